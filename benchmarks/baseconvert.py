@@ -0,0 +1,63 @@
+"""Compare the Base X codec with the former per-character loops.
+
+Run with velruse installed, for instance with ``pip install -e .``::
+
+    python benchmarks/baseconvert.py [number]
+
+"""
+import sys
+import timeit
+
+from velruse.app.baseconvert import ALPHABET
+from velruse.app.baseconvert import get_codec
+
+
+def loop_encode(num, alphabet=ALPHABET):
+    # the former velruse.app.baseconvert.base_encode
+    if num == 0:
+        return alphabet[0]
+    arr = []
+    base = len(alphabet)
+    while num:
+        rem = num % base
+        num = num // base
+        arr.append(alphabet[rem])
+    arr.reverse()
+    return ''.join(arr)
+
+
+CHAR_VALUE = dict((c, v) for v, c in enumerate(ALPHABET))
+
+
+def loop_decode(string, base=len(ALPHABET)):
+    # the former velruse.app.baseconvert.base_decode
+    num = 0
+    for char in string:
+        num = num * base + CHAR_VALUE[char]
+    return num
+
+
+def main(number=100000):
+    codec = get_codec()
+    num = 2 ** 122 - 12345
+    string = codec.encode(num)
+    batch = [string] * 1000
+    nums = [num] * 1000
+    runs = [
+        # name, function, numbers per call
+        ('loop encode', lambda: loop_encode(num), 1),
+        ('codec.encode', lambda: codec.encode(num), 1),
+        ('codec.encode_many', lambda: codec.encode_many(nums), len(nums)),
+        ('loop decode', lambda: loop_decode(string), 1),
+        ('codec.decode', lambda: codec.decode(string), 1),
+        ('codec.decode_many', lambda: codec.decode_many(batch), len(batch)),
+    ]
+    for name, func, size in runs:
+        calls = max(number // size, 1)
+        elapsed = min(timeit.repeat(func, number=calls, repeat=3))
+        print('%-20s %8.3f us/number' % (
+            name, elapsed / (calls * size) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,407 @@
+"""A fake identity provider answering for every supported service.
+
+The server speaks just enough OAuth 1.0a, OAuth 2.0, OpenID 2.0 and
+Last.fm to let the providers complete a login: it grants every
+authorization request, issues random tokens and returns a canned profile
+in the format of each service. Signatures, secrets and codes are not
+checked.
+
+The providers keep their real endpoint URLs. Their requests are sent to
+the fake server by :func:`route_to`, which mounts a transport on their
+HTTP client rewriting ``https://api.github.com/user`` into
+``http://127.0.0.1:<port>/https/api.github.com/user``, and by
+:func:`route_openid_to` for the fetches of ``python-openid``.
+
+Run standalone, the server prints its URL and serves until interrupted::
+
+    python benchmarks/fakeidp.py [--port PORT] [--latency MS]
+
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+import uuid
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import WSGIServer
+from wsgiref.simple_server import make_server
+
+from requests.adapters import HTTPAdapter
+
+from velruse.compat import parse_qsl
+from velruse.compat import urlencode
+from velruse.compat import urlsplit
+
+
+OPENID2_NS = 'http://specs.openid.net/auth/2.0'
+SREG_NS = 'http://openid.net/extensions/sreg/1.1'
+
+# where the services without a redirect URI send the user back, only the
+# query string of this URL is used by the benchmark
+DEFAULT_CALLBACK = 'http://localhost/callback'
+
+_ids = itertools.count(1000)
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def redirect(url, **params):
+    sep = '&' if '?' in url else '?'
+    return '302 Found', [('Location', url + sep + urlencode(params))], b''
+
+
+def as_json(data):
+    return ('200 OK', [('Content-Type', 'application/json')],
+            json.dumps(data).encode('utf-8'))
+
+
+def as_text(text, content_type='text/plain'):
+    return '200 OK', [('Content-Type', content_type)], text.encode('utf-8')
+
+
+def as_qs(**params):
+    return as_text(urlencode(params), 'application/x-www-form-urlencoded')
+
+
+# Authorization endpoints, the user always agrees
+
+def oauth2_authorize(host, params):
+    back = dict(code=new_token())
+    if 'state' in params:
+        back['state'] = params['state']
+    return redirect(params.get('redirect_uri') or DEFAULT_CALLBACK, **back)
+
+
+def oauth1_authorize(host, params):
+    return redirect(DEFAULT_CALLBACK, oauth_token=params['oauth_token'],
+                    oauth_verifier=new_token())
+
+
+def lastfm_authorize(host, params):
+    return redirect(params.get('cb') or DEFAULT_CALLBACK, token=new_token())
+
+
+# Token endpoints
+
+def oauth2_token_json(**extra):
+    def token(host, params):
+        data = {'access_token': new_token(), 'refresh_token': new_token(),
+                'expires_in': 3600, 'token_type': 'Bearer'}
+        data.update(dict((k, v() if callable(v) else v)
+                         for k, v in extra.items()))
+        return as_json(data)
+    return token
+
+
+def oauth2_token_qs(host, params):
+    return as_qs(access_token=new_token(), expires=3600)
+
+
+def oauth1_request_token(host, params):
+    return as_qs(oauth_token=new_token(), oauth_token_secret=new_token(),
+                 oauth_callback_confirmed='true')
+
+
+def oauth1_access_token(host, params):
+    return as_qs(oauth_token=new_token(), oauth_token_secret=new_token(),
+                 user_id=next(_ids), screen_name='bob')
+
+
+# Profile endpoints
+
+def static(data):
+    return lambda host, params: as_json(data)
+
+
+def qq_me(host, params):
+    return as_text('callback( %s );' % json.dumps(
+        {'client_id': 'key', 'openid': 'q%d' % next(_ids)}))
+
+
+def lastfm_api(host, params):
+    if params.get('method') == 'auth.getSession':
+        return as_json({'session': {'key': new_token(), 'name': 'bob'}})
+    return as_json({'user': {
+        'id': str(next(_ids)), 'name': 'bob', 'realname': 'Bob Smith',
+        'gender': 'm', 'url': 'https://www.last.fm/user/bob',
+        'image': [{'size': 'medium', '#text': 'https://img/m.png'},
+                  {'size': 'large', '#text': 'https://img/l.png'}],
+    }})
+
+
+# OpenID 2.0 provider, in stateless mode
+
+def openid_discovery(host, params):
+    return as_text(
+        '<html><head><link rel="openid2.provider" href="https://%s/op">'
+        '</head><body></body></html>' % host, 'text/html')
+
+
+def openid_endpoint(host, params):
+    mode = params.get('openid.mode')
+    if mode == 'check_authentication':
+        return as_text('ns:%s\nis_valid:true\n' % OPENID2_NS)
+    if mode not in ('checkid_setup', 'checkid_immediate'):
+        return '400 Bad Request', [], b''
+    nonce = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()) + new_token()
+    claimed_id = params.get('openid.claimed_id', params.get('openid.identity'))
+    response = {
+        'openid.ns': OPENID2_NS,
+        'openid.mode': 'id_res',
+        'openid.op_endpoint': 'https://%s/op' % host,
+        'openid.claimed_id': claimed_id,
+        'openid.identity': params.get('openid.identity', claimed_id),
+        'openid.return_to': params['openid.return_to'],
+        'openid.response_nonce': nonce,
+        'openid.assoc_handle': 'stateless',
+        'openid.ns.sreg': SREG_NS,
+        'openid.sreg.nickname': 'bob',
+        'openid.sreg.email': 'bob@example.com',
+        'openid.sreg.fullname': 'Bob Smith',
+        'openid.signed': ('op_endpoint,claimed_id,identity,return_to,'
+                          'response_nonce,assoc_handle,ns.sreg,'
+                          'sreg.nickname,sreg.email,sreg.fullname'),
+        'openid.sig': 'c2lnbmF0dXJl',
+    }
+    url = params['openid.return_to']
+    sep = '&' if '?' in url else '?'
+    return ('302 Found', [('Location', url + sep + urlencode(response))],
+            b'')
+
+
+def user(**data):
+    return dict(data, id=str(next(_ids)))
+
+
+ROUTES = {
+    # OAuth 2.0
+    'www.douban.com/service/auth2/auth': oauth2_authorize,
+    'www.douban.com/service/auth2/token': oauth2_token_json(
+        douban_user_id=lambda: str(next(_ids))),
+    'api.douban.com/v2/user/': static(
+        {'name': 'bob', 'large_avatar': 'https://img/bob.png'}),
+    'www.facebook.com/dialog/oauth/': oauth2_authorize,
+    'graph.facebook.com/oauth/access_token': oauth2_token_qs,
+    'graph.facebook.com/me': lambda host, params: as_json(user(
+        name='Bob Smith', first_name='Bob', last_name='Smith',
+        link='https://www.facebook.com/bob', email='bob@example.com',
+        verified=True, gender='male', timezone=-5.5,
+        birthday='01/31/1980')),
+    'github.com/login/oauth/authorize': oauth2_authorize,
+    'github.com/login/oauth/access_token': oauth2_token_qs,
+    'api.github.com/user': lambda host, params: as_json(
+        {'login': 'bob', 'id': next(_ids), 'name': 'Bob Smith'}),
+    'accounts.google.com/o/oauth2/auth': oauth2_authorize,
+    'accounts.google.com/o/oauth2/token': oauth2_token_json(),
+    'www.googleapis.com/oauth2/v1/userinfo': lambda host, params: as_json(
+        user(email='bob@example.com', name='Bob Smith',
+             given_name='Bob', family_name='Smith')),
+    'login.live.com/oauth20_authorize.srf': oauth2_authorize,
+    'login.live.com/oauth20_token.srf': oauth2_token_json(),
+    'apis.live.net/v5.0/me': lambda host, params: as_json(user(
+        name='Bob Smith', first_name='Bob', last_name='Smith',
+        emails={'preferred': 'bob@example.com'},
+        link='https://profile.live.com/bob',
+        birth_day=31, birth_month=1, birth_year=1980)),
+    'connect.mail.ru/oauth/authorize': oauth2_authorize,
+    'connect.mail.ru/oauth/token': oauth2_token_json(),
+    'www.appsmail.ru/platform/api': lambda host, params: as_json([{
+        'uid': str(next(_ids)), 'nick': 'bob', 'first_name': 'Bob',
+        'last_name': 'Smith', 'sex': 0, 'birthday': '31.01.1980',
+        'email': 'bob@mail.ru', 'pic': 'https://img/bob.png'}]),
+    'graph.qq.com/oauth2.0/authorize': oauth2_authorize,
+    'graph.qq.com/oauth2.0/token': oauth2_token_qs,
+    'graph.qq.com/oauth2.0/me': qq_me,
+    'graph.qq.com/user/get_user_info': static({'nickname': 'bob'}),
+    'graph.renren.com/oauth/authorize': oauth2_authorize,
+    'graph.renren.com/oauth/token': oauth2_token_json(
+        user=lambda: {'id': next(_ids), 'name': 'bob'}),
+    'oauth.taobao.com/authorize': oauth2_authorize,
+    'oauth.taobao.com/token': oauth2_token_json(),
+    'gw.api.taobao.com/router/rest': lambda host, params: as_json(
+        {'user_get_response': {'user': {'nick': 'bob',
+                                        'user_id': next(_ids)}}}),
+    'oauth.vk.com/authorize': oauth2_authorize,
+    'api.vk.com/oauth/access_token': oauth2_token_json(
+        user_id=lambda: next(_ids)),
+    'api.vk.com/method/getProfiles': static({'response': [{
+        'first_name': 'Bob', 'last_name': 'Smith', 'nickname': 'bob',
+        'sex': 2, 'bdate': '31.1.1980', 'timezone': 3,
+        'photo': 'https://img/bob.png'}]}),
+    'api.weibo.com/oauth2/authorize': oauth2_authorize,
+    'api.weibo.com/oauth2/access_token': oauth2_token_json(
+        uid=lambda: str(next(_ids))),
+    'api.weibo.com/2/users/show.json': lambda host, params: as_json(user(
+        screen_name='bob', name='Bob Smith', gender='m',
+        avatar_large='https://img/bob.png')),
+    'oauth.yandex.ru/authorize': oauth2_authorize,
+    'oauth.yandex.ru/token': oauth2_token_json(),
+    'login.yandex.ru/info': lambda host, params: as_json(user(
+        display_name='bob', real_name='Bob Smith',
+        default_email='bob@yandex.ru', sex='male',
+        birthday='1980-01-31')),
+    # OAuth 1.0a
+    'api.twitter.com/oauth/request_token': oauth1_request_token,
+    'api.twitter.com/oauth/authenticate': oauth1_authorize,
+    'api.twitter.com/oauth/access_token': oauth1_access_token,
+    'api.twitter.com/1.1/users/show.json': static(
+        {'name': 'Bob Smith', 'url': 'https://bob.example.com',
+         'location': 'Paris', 'utc_offset': 3600,
+         'profile_image_url': 'https://img/bob.png'}),
+    'api.linkedin.com/uas/oauth/requestToken': oauth1_request_token,
+    'api.linkedin.com/uas/oauth/authenticate': oauth1_authorize,
+    'api.linkedin.com/uas/oauth/accessToken': oauth1_access_token,
+    'api.linkedin.com/v1/people/~:(first-name,last-name,id,date-of-birth,'
+    'picture-url,email-address)': lambda host, params: as_json(
+        {'id': str(next(_ids)), 'firstName': 'Bob', 'lastName': 'Smith',
+         'emailAddress': 'bob@example.com',
+         'pictureUrl': 'https://img/bob.png'}),
+    'bitbucket.org/api/1.0/oauth/request_token/': oauth1_request_token,
+    'bitbucket.org/api/1.0/oauth/authenticate/': oauth1_authorize,
+    'bitbucket.org/api/1.0/oauth/access_token/': oauth1_access_token,
+    'bitbucket.org/api/1.0/user': static({'user': {
+        'username': 'bob', 'first_name': 'Bob', 'last_name': 'Smith',
+        'display_name': 'Bob Smith'}}),
+    'bitbucket.org/api/1.0/users/': static(
+        [{'email': 'bob@example.com', 'primary': True, 'active': True}]),
+    # Last.fm
+    'www.last.fm/api/auth/': lastfm_authorize,
+    'ws.audioscrobbler.com/2.0/': lastfm_api,
+}
+
+# the hosts of the OpenID providers, any other path is an identifier
+OPENID_HOSTS = ['openid.example.com', 'me.yahoo.com', 'www.google.com']
+
+
+def find_route(host, path):
+    key = host + path
+    handler = ROUTES.get(key)
+    if handler is None:
+        # the URLs holding a user id are matched on their prefix
+        for prefix in ('api.douban.com/v2/user/',
+                       'bitbucket.org/api/1.0/users/'):
+            if key.startswith(prefix):
+                return ROUTES[prefix]
+        if host in OPENID_HOSTS:
+            return openid_endpoint if path == '/op' else openid_discovery
+    return handler
+
+
+class FakeIdP(object):
+    """The WSGI application of the fake identity provider.
+
+    Requests are expected at ``/<scheme>/<host>/<path>``. Every response
+    is delayed by ``latency`` seconds to mimic a remote service.
+    """
+    def __init__(self, latency=0):
+        self.latency = latency
+
+    def __call__(self, environ, start_response):
+        try:
+            scheme, host, path = environ['PATH_INFO'].split('/', 3)[1:]
+        except ValueError:
+            start_response('404 Not Found', [])
+            return [b'']
+        path = '/' + path
+        params = dict(parse_qsl(environ.get('QUERY_STRING', '')))
+        if environ['REQUEST_METHOD'] == 'POST':
+            size = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(size).decode('utf-8')
+            params.update(parse_qsl(body))
+        handler = find_route(host, path)
+        if handler is None:
+            status, headers, body = '404 Not Found', [], b''
+        else:
+            status, headers, body = handler(host, params)
+        if self.latency:
+            time.sleep(self.latency)
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def make_idp_server(host='127.0.0.1', port=0, latency=0):
+    """Return a threaded WSGI server running :class:`FakeIdP`"""
+    return make_server(host, port, FakeIdP(latency),
+                       server_class=ThreadingWSGIServer,
+                       handler_class=QuietHandler)
+
+
+def rewrite(base, url):
+    """Return the URL of the fake identity provider at ``base`` standing
+    for ``url``"""
+    parts = urlsplit(url)
+    url = '%s/%s/%s%s' % (base, parts.scheme, parts.netloc, parts.path)
+    if parts.query:
+        url += '?' + parts.query
+    return url
+
+
+class RewritingAdapter(HTTPAdapter):
+    """A transport sending every request to the fake identity provider"""
+
+    def __init__(self, base, **kw):
+        self.base = base
+        HTTPAdapter.__init__(self, **kw)
+
+    def send(self, request, **kw):
+        request.url = rewrite(self.base, request.url)
+        return HTTPAdapter.send(self, request, **kw)
+
+
+def route_to(session, base, pool_maxsize=10):
+    """Send the requests of a ``requests`` session to the fake identity
+    provider at ``base``"""
+    adapter = RewritingAdapter(base, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def route_openid_to(base):
+    """Send the fetches of ``python-openid`` to the fake identity provider
+    at ``base``"""
+    from openid import fetchers
+
+    class RewritingFetcher(fetchers.Urllib2Fetcher):
+        def fetch(self, url, body=None, headers=None):
+            response = fetchers.Urllib2Fetcher.fetch(
+                self, rewrite(base, url), body, headers)
+            # discovery keys the identifiers on the URL they were found at
+            response.final_url = url
+            return response
+
+    fetchers.setDefaultFetcher(RewritingFetcher())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of every response in milliseconds')
+    args = parser.parse_args(argv)
+    server = make_idp_server(args.host, args.port, args.latency / 1000.0)
+    print('http://%s:%d' % server.server_address[:2])
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
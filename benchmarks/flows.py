@@ -0,0 +1,276 @@
+"""Measure complete logins of every provider against a fake identity
+provider.
+
+The standalone app is configured with every provider and their upstream
+requests are sent to ``fakeidp.py``, started in a separate process so that
+it does not compete with the app for the interpreter. Each flow plays the
+browser: it posts to the login view, follows the redirect to the fake
+identity provider, which grants the authorization, and calls the callback
+view with the parameters it sent back.
+
+For each provider the flows are run by ``--concurrency`` threads and the
+report shows the throughput, the latency percentiles of the login and
+callback views, excluding the authorization step which is the browser's,
+and the memory allocated by a flow as measured by ``tracemalloc``: the
+peak during a flow and what is left allocated after it, mostly the result
+kept in the store until it is read.
+
+Run with velruse installed, for instance with ``pip install -e .``::
+
+    python benchmarks/flows.py [--concurrency N] [--flows N]
+        [--latency MS] [provider ...]
+
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pyramid.config import Configurator
+from pyramid.interfaces import IRoutesMapper
+from pyramid.request import Request
+from pyramid.session import SignedCookieSessionFactory
+
+from velruse.app import settings_adapter
+from velruse.compat import urlsplit
+from velruse.http import HTTPClient
+from velruse.store.memory import MemoryStore
+
+import fakeidp
+
+# the hidden fields of the form posting to the identity provider
+INPUT_RE = re.compile(r'<input type="hidden" name="([^"]*)" value="([^"]*)"')
+ACTION_RE = re.compile(r'<form[^>]* action="([^"]*)"')
+TOKEN_RE = re.compile(r'name="token" value="([^"]*)"')
+
+# the OpenID providers have no settings, they are added by setup()
+OPENID_PROVIDERS = {
+    'openid': ('add_openid_login', {}),
+    'yahoo': ('add_yahoo_login', {}),
+    'google_hybrid': ('add_google_hybrid_login', {
+        'login_path': '/login/google_hybrid',
+        'callback_path': '/login/google_hybrid/callback'}),
+}
+OPENID_IDENTIFIER = 'https://openid.example.com/bob'
+
+
+def session_factory():
+    # the OpenID providers keep python-openid objects in the session
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        from pyramid.session import PickleSerializer
+        serializer = PickleSerializer()
+    return SignedCookieSessionFactory('seekrit', serializer=serializer)
+
+
+def oauth_provider_names():
+    # google is the OpenID provider, configured as google_hybrid
+    return sorted(set(settings_adapter) - set(['google']))
+
+
+def make_app(names):
+    def setup(config):
+        config.set_session_factory(session_factory())
+        config.register_velruse_store(MemoryStore())
+        for name in names:
+            if name in OPENID_PROVIDERS:
+                directive, kw = OPENID_PROVIDERS[name]
+                module = 'google_hybrid' if name == 'google_hybrid' else name
+                config.include('velruse.providers.%s' % module)
+                getattr(config, directive)(name=name, **kw)
+
+    settings = {'endpoint': 'http://example.com/logged_in', 'setup': setup}
+    for name in names:
+        if name not in OPENID_PROVIDERS:
+            settings['provider.%s.consumer_key' % name] = 'key'
+            settings['provider.%s.consumer_secret' % name] = 'secret'
+    config = Configurator(settings=settings)
+    config.include('velruse.app')
+    return config.make_wsgi_app()
+
+
+def route_app_to(app, base, pool_maxsize):
+    """Send the upstream requests of the providers of ``app`` to the fake
+    identity provider"""
+    for provider in app.registry.velruse_providers.values():
+        http = getattr(provider, 'http', None)
+        if isinstance(http, HTTPClient):
+            fakeidp.route_to(http.session, base, pool_maxsize)
+    fakeidp.route_openid_to(base)
+
+
+class Flow(object):
+    """Play the browser through the logins of a provider"""
+
+    def __init__(self, app, provider, idp):
+        self.app = app
+        self.name = provider.name
+        self.idp = idp
+        mapper = app.registry.getUtility(IRoutesMapper)
+        self.login_path = mapper.get_route(provider.login_route).generate({})
+        self.callback_path = mapper.get_route(
+            provider.callback_route).generate({})
+        self.login_params = {}
+        if provider.type == 'openid':
+            self.login_params['openid_identifier'] = OPENID_IDENTIFIER
+
+    def authorize(self, response):
+        """Return the query string sent back by the identity provider"""
+        if response.status_int == 302:
+            r = self.idp.get(response.location, allow_redirects=False)
+        else:
+            # the OpenID requests too long for a redirect are posted
+            body = response.text
+            r = self.idp.post(ACTION_RE.search(body).group(1),
+                              data=dict(INPUT_RE.findall(body)),
+                              allow_redirects=False)
+        if r.status_code != 302:
+            raise RuntimeError('%s: authorization failed with %s' % (
+                self.name, r.status_code))
+        return urlsplit(r.headers['Location']).query
+
+    def __call__(self):
+        """Run a flow and return the time spent in velruse and the
+        response of the callback"""
+        request = Request.blank(self.login_path, POST=self.login_params)
+        start = time.time()
+        response = request.get_response(self.app)
+        elapsed = time.time() - start
+        cookies = '; '.join(c.split(';', 1)[0]
+                            for c in response.headers.getall('Set-Cookie'))
+        query = self.authorize(response)
+        request = Request.blank(self.callback_path + '?' + query,
+                                headers={'Cookie': cookies})
+        start = time.time()
+        response = request.get_response(self.app)
+        elapsed += time.time() - start
+        if response.status_int != 200:
+            raise RuntimeError('%s: callback failed with %s' % (
+                self.name, response.status))
+        return elapsed, response
+
+    def check(self):
+        """Run a flow and return the result received by the endpoint"""
+        response = self()[1]
+        token = TOKEN_RE.search(response.text).group(1)
+        request = Request.blank('/auth_info?format=json&token=' + token)
+        return request.get_response(self.app).json
+
+
+def percentile(values, pct):
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def measure(flow, flows, concurrency):
+    """Run ``flows`` flows on ``concurrency`` threads, return the elapsed
+    time, the sorted latencies and the number of errors"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def run():
+        try:
+            elapsed = flow()[0]
+        except Exception:
+            with lock:
+                errors[0] += 1
+        else:
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.time()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for i in range(flows):
+            executor.submit(run)
+    return time.time() - start, sorted(latencies), errors[0]
+
+
+def allocations(flow, flows):
+    """Return the mean peak and retained memory of ``flows`` flows"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        peaks = 0
+        for i in range(flows):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            flow()
+            peaks += tracemalloc.get_traced_memory()[1] - current
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return peaks / flows, retained / flows
+
+
+def start_idp(latency):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'fakeidp.py')
+    process = subprocess.Popen(
+        [sys.executable, script, '--latency', str(latency)],
+        stdout=subprocess.PIPE, universal_newlines=True)
+    return process, process.stdout.readline().strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('providers', nargs='*',
+                        help='the providers to measure, all by default')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-n', '--flows', type=int, default=200,
+                        help='number of flows per provider')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of the identity provider in ms')
+    parser.add_argument('--allocations', type=int, default=20,
+                        help='number of flows traced by tracemalloc')
+    args = parser.parse_args(argv)
+
+    names = args.providers or (oauth_provider_names() +
+                               sorted(OPENID_PROVIDERS))
+    process, base = start_idp(args.latency)
+    try:
+        app = make_app(names)
+        route_app_to(app, base, args.concurrency)
+        idp = requests.Session()
+        fakeidp.route_to(idp, base, args.concurrency)
+
+        print('%-14s %9s %6s %9s %9s %9s %10s %10s' % (
+            'provider', 'flows/s', 'errors', 'p50 ms', 'p90 ms', 'p99 ms',
+            'peak KiB', 'kept B'))
+        for name, provider in sorted(app.registry.velruse_providers.items()):
+            flow = Flow(app, provider, idp)
+            try:
+                result = flow.check()
+                if 'profile' not in result:
+                    raise RuntimeError(result)
+            except Exception as e:
+                print('%-14s failed: %r' % (name, e))
+                continue
+            elapsed, latencies, errors = measure(
+                flow, args.flows, args.concurrency)
+            if args.allocations:
+                peak, kept = allocations(flow, args.allocations)
+            else:
+                peak = kept = float('nan')
+            if not latencies:
+                print('%-14s %9s %6d' % (name, '-', errors))
+                continue
+            print('%-14s %9.1f %6d %9.2f %9.2f %9.2f %10.1f %10.0f' % (
+                name, len(latencies) / elapsed, errors,
+                percentile(latencies, 50) * 1e3,
+                percentile(latencies, 90) * 1e3,
+                percentile(latencies, 99) * 1e3,
+                peak / 1024, kept))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
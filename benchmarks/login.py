@@ -0,0 +1,76 @@
+"""Measure the login view of the OAuth 2.0 providers.
+
+Each provider configured by the standalone app redirects a request to its
+authorization URL, either through its precompiled
+:class:`velruse.utils.URLTemplate` or by encoding every parameter with
+``flat_url`` as was done before.
+
+Run with velruse installed, for instance with ``pip install -e .``::
+
+    python benchmarks/login.py [number]
+
+"""
+import sys
+import timeit
+
+from pyramid.config import Configurator
+from pyramid.httpexceptions import HTTPFound
+from pyramid.request import Request
+from pyramid.session import SignedCookieSessionFactory
+
+from velruse.app import settings_adapter
+from velruse.providers.oauth2 import OAuth2Provider
+from velruse.store.memory import MemoryStore
+from velruse.utils import flat_url
+
+
+def setup(config):
+    config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+    config.register_velruse_store(MemoryStore())
+
+
+def make_registry():
+    # google has no settings loader
+    settings = {'endpoint': 'http://example.com/logged_in', 'setup': setup}
+    for name in sorted(set(settings_adapter) - set(['google'])):
+        settings['provider.%s.consumer_key' % name] = 'key'
+        settings['provider.%s.consumer_secret' % name] = 'secret'
+    config = Configurator(settings=settings)
+    config.include('velruse.app')
+    config.commit()
+    return config.registry
+
+
+def flat_login(provider, request):
+    # the login view before the authorization URLs were precompiled
+    params = provider.static_authorize_params()
+    params.update(provider.authorize_params(request))
+    params = dict((k, v) for k, v in params.items() if v is not None)
+    return HTTPFound(location=flat_url(provider.authorize_url, **params))
+
+
+def main(number=20000):
+    registry = make_registry()
+    request = Request.blank('/login', POST={})
+    request.registry = registry
+    request.session = {}
+    providers = sorted(
+        (name, p) for name, p in registry.velruse_providers.items()
+        if isinstance(p, OAuth2Provider))
+    print('%-14s %12s %12s' % ('provider', 'flat_url', 'template'))
+    totals = [0, 0]
+    for name, provider in providers:
+        row = []
+        for i, login in enumerate((flat_login, OAuth2Provider.login)):
+            elapsed = min(timeit.repeat(
+                lambda: login(provider, request), number=number, repeat=3))
+            totals[i] += elapsed
+            row.append(elapsed / number * 1e6)
+        print('%-14s %9.2f us %9.2f us' % (name, row[0], row[1]))
+    count = number * len(providers)
+    print('%-14s %9.2f us %9.2f us' % (
+        'mean', totals[0] / count * 1e6, totals[1] / count * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,73 @@
+"""Measure the startup of the standalone app.
+
+Each sample configures the app in a fresh interpreter, either with a
+single provider or with every supported provider, and reports the time
+taken and the peak memory allocated by the imports and the configuration,
+Pyramid itself being imported beforehand.
+
+Run with velruse installed, for instance with ``pip install -e .``::
+
+    python benchmarks/startup.py [repeat]
+
+"""
+import subprocess
+import sys
+
+
+SAMPLE = r'''
+import time
+import tracemalloc
+import sys
+
+# pyramid is loaded in any case
+from pyramid.config import Configurator
+from pyramid.session import SignedCookieSessionFactory
+
+tracemalloc.start()
+start = time.time()
+
+from velruse.app import settings_adapter
+from velruse.store.memory import MemoryStore
+
+
+def setup(config):
+    config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+    config.register_velruse_store(MemoryStore())
+
+
+# google has no settings loader
+providers = %(providers)r or sorted(set(settings_adapter) - set(['google']))
+settings = {'endpoint': 'http://example.com/logged_in', 'setup': setup}
+for name in providers:
+    settings['provider.%%s.consumer_key' %% name] = 'key'
+    settings['provider.%%s.consumer_secret' %% name] = 'secret'
+config = Configurator(settings=settings)
+config.include('velruse.app')
+config.make_wsgi_app()
+
+elapsed = time.time() - start
+peak = tracemalloc.get_traced_memory()[1]
+modules = len([m for m in sys.modules if m.startswith(('velruse.', 'openid'))])
+print('%%f %%d %%d' %% (elapsed, peak, modules))
+'''
+
+
+def sample(providers):
+    code = SAMPLE % {'providers': providers}
+    out = subprocess.check_output([sys.executable, '-c', code])
+    elapsed, peak, modules = out.split()
+    return float(elapsed), int(peak), int(modules)
+
+
+def main(repeat=5):
+    for label, providers in [('github only', ['github']),
+                             ('all providers', [])]:
+        samples = [sample(providers) for i in range(repeat)]
+        elapsed = min(s[0] for s in samples)
+        peak = min(s[1] for s in samples)
+        print('%-16s %8.1f ms %8.1f MiB peak %4d modules' % (
+            label, elapsed * 1e3, peak / 2.0 ** 20, samples[0][2]))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,39 @@
+"""Compare the token generators of the standalone app.
+
+Run with velruse installed, for instance with ``pip install -e .``::
+
+    python benchmarks/tokens.py [number]
+
+"""
+import sys
+import timeit
+import uuid
+
+from velruse.app.baseconvert import base_encode
+from velruse.app.utils import generate_token
+from velruse.app.utils import generate_tokens
+
+
+def uuid_token():
+    # the generator used before velruse.app.utils.generate_token
+    return base_encode(uuid.uuid4().int)
+
+
+def main(number=100000):
+    batch = 1000
+    runs = [
+        # name, function, tokens per call
+        ('base_encode(uuid4().int)', uuid_token, 1),
+        ('generate_token()', generate_token, 1),
+        ('generate_tokens(%d)' % batch, lambda: generate_tokens(batch),
+         batch),
+    ]
+    for name, func, size in runs:
+        calls = max(number // size, 1)
+        elapsed = min(timeit.repeat(func, number=calls, repeat=3))
+        print('%-28s %8.3f us/token' % (
+            name, elapsed / (calls * size) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
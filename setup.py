@@ -8,7 +8,6 @@ PY3 = sys.version_info[0] >= 3
 requires = [
     'pyramid',
     'requests',
-    'requests-oauthlib',
     'anykeystore',
 ]
 
@@ -16,13 +15,32 @@ if PY3:
     requires.append('python3-openid')
 else:
     requires.append('python-openid')
+    requires.append('futures')
 
 testing_extras = [
     'nose',
+    'cryptography',
+    'requests-oauthlib',
     'selenium',
     'webtest',
 ]
 
+asgi_extras = [
+    'httpx',
+]
+
+if PY3:
+    # the ASGI app requires Python 3
+    testing_extras.extend(asgi_extras)
+
+sealed_extras = [
+    'cryptography',
+]
+
+id_token_extras = [
+    'cryptography',
+]
+
 docs_extras = [
     'Sphinx',
     'docutils',
@@ -69,11 +87,16 @@ setup(name='velruse',
       tests_require=testing_extras,
       test_suite='nose.collector',
       extras_require={
+          'asgi': asgi_extras,
           'docs': docs_extras,
+          'id_token': id_token_extras,
+          'sealed': sealed_extras,
           'testing': testing_extras,
       },
       entry_points="""
       [paste.app_factory]
       main = velruse.app:make_app
+      [paste.filter_app_factory]
+      main = velruse.app.middleware:make_filter
       """,
       )
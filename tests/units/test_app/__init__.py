@@ -0,0 +1,7 @@
+# a provider installed separately whose module has no includeme
+
+
+def add_plain_login_from_settings(config, prefix='velruse.plain.'):
+    settings = config.registry.settings
+    config.registry.plain_logins = getattr(
+        config.registry, 'plain_logins', []) + [settings.get(prefix + 'name')]
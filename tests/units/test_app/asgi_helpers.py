@@ -0,0 +1,33 @@
+"""Coroutine helpers of the ASGI tests, which are only imported on
+Python 3.7+ as this syntax does not compile on Python 2."""
+import asyncio
+
+run = asyncio.run
+
+
+def call_app(app, method, path, query=b'', headers=()):
+    """Call the ASGI ``app`` and return the status, headers and body of its
+    response"""
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1'))
+                    for k, v in headers],
+        'server': ('example.com', 80),
+        'scheme': 'http',
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    run(app(scope, receive, send))
+    start, body = messages
+    headers = [(k.decode('latin-1'), v.decode('latin-1'))
+               for k, v in start['headers']]
+    return start['status'], headers, body['body']
@@ -0,0 +1,152 @@
+import json
+import sys
+import unittest
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    httpx = None
+else:
+    from .asgi_helpers import call_app as _call
+    from .asgi_helpers import run
+
+from velruse.compat import parse_qs
+
+
+def _setup(config):
+    from anykeystore import create_store
+    from pyramid.session import SignedCookieSessionFactory
+    config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+    config.register_velruse_store(create_store('memory'))
+
+
+def _github_upstream(request):
+    url = str(request.url)
+    if '/login/oauth/access_token' in url:
+        return httpx.Response(200, text='access_token=t0k3n')
+    if url.startswith('https://api.github.com/user'):
+        return httpx.Response(200, json={'login': 'bob', 'id': 1})
+    return httpx.Response(500)
+
+
+@unittest.skipIf(httpx is None, 'requires Python 3.7+ and httpx')
+class TestASGIApp(unittest.TestCase):
+
+    def _makeApp(self, transport, **settings):
+        from pyramid.config import Configurator
+        from velruse.app.asgi import ASGIApp
+        settings.update({
+            'setup': _setup,
+            'endpoint': 'http://example.com/logged_in',
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+        })
+        config = Configurator(settings=settings)
+        config.include('velruse.app')
+        return ASGIApp(config.make_wsgi_app(), config.registry,
+                       transport=transport)
+
+    def _login(self, app):
+        status, headers, body = _call(app, 'GET', '/login/github')
+        self.assertEqual(status, 302)
+        headers = dict(headers)
+        location = headers['location']
+        state = parse_qs(location.split('?', 1)[1])['state'][0]
+        cookie = headers['set-cookie'].split(';', 1)[0]
+
+        query = 'code=abc&state=%s' % state
+        status, headers, body = _call(
+            app, 'GET', '/login/github/callback', query.encode('latin-1'),
+            headers=[('cookie', cookie)])
+        self.assertEqual(status, 200)
+        body = body.decode('utf-8')
+        self.assertTrue('http://example.com/logged_in' in body)
+        token = body.split('name="token" value="', 1)[1].split('"', 1)[0]
+        self.assertTrue('github' in app.clients)
+
+        query = 'format=json&token=%s' % token
+        status, headers, body = _call(
+            app, 'GET', '/auth_info', query.encode('latin-1'))
+        self.assertEqual(status, 200)
+        return json.loads(body.decode('utf-8'))
+
+    def test_github_login(self):
+        app = self._makeApp(httpx.MockTransport(_github_upstream))
+        self.assertTrue('velruse.github-callback' in app.callbacks)
+        data = self._login(app)
+        self.assertEqual(data['provider_type'], 'github')
+        self.assertEqual(data['profile']['preferredUsername'], 'bob')
+        self.assertEqual(data['credentials']['oauthAccessToken'], 't0k3n')
+
+    def test_github_lazy_profile(self):
+        app = self._makeApp(httpx.MockTransport(_github_upstream),
+                            **{'provider.github.lazy_profile': 'true'})
+        data = self._login(app)
+        self.assertEqual(data['profile']['preferredUsername'], 'bob')
+
+    def test_callback_error(self):
+        from velruse.exceptions import CSRFError
+        app = self._makeApp(httpx.MockTransport(_github_upstream))
+        self.assertRaises(CSRFError, _call, app, 'GET',
+                          '/login/github/callback', b'code=abc&state=bad')
+
+
+@unittest.skipIf(httpx is None, 'requires Python 3.7+ and httpx')
+class TestAsyncHTTPClient(unittest.TestCase):
+
+    def _makeOne(self, handler, http=None):
+        from velruse.app.asgi import AsyncHTTPClient
+        return AsyncHTTPClient(http, transport=httpx.MockTransport(handler))
+
+    def test_run(self):
+        from velruse.http import HTTPRequest
+
+        def handler(request):
+            return httpx.Response(200, text=request.url.path)
+
+        def flow():
+            r = yield HTTPRequest('GET', 'http://example.com/a')
+            r2 = yield HTTPRequest('POST', 'http://example.com/b',
+                                   data={'x': '1'})
+            yield [r.text, r2.text]
+
+        client = self._makeOne(handler)
+        result = run(client.run(flow()))
+        self.assertEqual(result, ['/a', '/b'])
+
+    def test_error_thrown_into_flow(self):
+        from velruse.http import HTTPRequest
+
+        def handler(request):
+            raise httpx.ConnectError('down')
+
+        def flow():
+            try:
+                yield HTTPRequest('GET', 'http://example.com/a')
+            except httpx.ConnectError:
+                yield 'recovered'
+
+        client = self._makeOne(handler)
+        self.assertEqual(run(client.run(flow())), 'recovered')
+
+    def test_timeouts(self):
+        from velruse.http import HTTPRequest
+        timeouts = []
+
+        def handler(request):
+            timeouts.append(request.extensions['timeout']['read'])
+            return httpx.Response(200)
+
+        def flow():
+            yield HTTPRequest('GET', 'http://example.com/a')
+            yield HTTPRequest('GET', 'http://example.com/b', timeout=2)
+            yield None
+
+        # not limited by default, like the blocking client
+        run(self._makeOne(handler).run(flow()))
+        client = self._makeOne(handler, {'timeout': 5})
+        run(client.run(flow()))
+        self.assertEqual(timeouts, [None, 2, 5, 2])
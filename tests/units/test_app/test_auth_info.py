@@ -0,0 +1,164 @@
+import unittest
+
+from pyramid import testing
+
+try:
+    import cryptography
+except ImportError:  # pragma: no cover
+    cryptography = None
+
+
+class DummyStore(object):
+
+    def __init__(self, **data):
+        self.data = data
+
+    def store(self, key, value, expires=None):
+        self.data[key] = value
+
+    def retrieve(self, key):
+        return self.data[key]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class DummyConsumeStore(DummyStore):
+
+    def consume(self, key):
+        return self.data.pop(key)
+
+
+class TestAuthInfoView(unittest.TestCase):
+
+    def _callFUT(self, store, token, consume=True):
+        from velruse.app import auth_info_view
+        request = testing.DummyRequest(params={'token': token})
+        request.registry.velruse_store = store
+        request.registry.velruse_consume = consume
+        return request, auth_info_view(request)
+
+    def test_consume(self):
+        store = DummyConsumeStore(tok={'a': 1})
+        request, result = self._callFUT(store, 'tok')
+        self.assertEqual(result, {'a': 1})
+        self.assertEqual(store.data, {})
+        request, result = self._callFUT(store, 'tok')
+        self.assertEqual(result, None)
+        self.assertEqual(request.response.status_int, 400)
+
+    def test_consume_fallback(self):
+        store = DummyStore(tok={'a': 1})
+        request, result = self._callFUT(store, 'tok')
+        self.assertEqual(result, {'a': 1})
+        self.assertEqual(store.data, {})
+
+    def test_retrieve(self):
+        store = DummyConsumeStore(tok={'a': 1})
+        request, result = self._callFUT(store, 'tok', consume=False)
+        self.assertEqual(result, {'a': 1})
+        self.assertEqual(store.data, {'tok': {'a': 1}})
+
+
+@unittest.skipIf(cryptography is None, 'cryptography is not installed')
+class TestSealedTokenViews(unittest.TestCase):
+
+    def _makeRequest(self, **kw):
+        from velruse.app.tokens import SealedTokens
+        request = testing.DummyRequest(**kw)
+        request.registry.settings = {'endpoint': 'http://example.com/in'}
+        request.registry.velruse_store = None
+        request.registry.velruse_consume = True
+        request.registry.velruse_tokens = SealedTokens('seekrit')
+        return request
+
+    def test_roundtrip(self):
+        from velruse import AuthenticationDenied
+        from velruse.app import auth_denied_view
+        from velruse.app import auth_info_view
+        context = AuthenticationDenied('nope', provider_name='gh',
+                                       provider_type='github')
+        response = auth_denied_view(context, self._makeRequest())
+        body = response.body.decode('utf-8')
+        token = body.split('name="token" value="', 1)[1].split('"', 1)[0]
+
+        request = self._makeRequest(params={'token': token})
+        self.assertEqual(auth_info_view(request), {
+            'provider_type': 'github',
+            'provider_name': 'gh',
+            'error': 'nope',
+        })
+
+        request = self._makeRequest(params={'token': token[:-4] + 'AAAA'})
+        self.assertEqual(auth_info_view(request), None)
+        self.assertEqual(request.response.status_int, 400)
+
+
+class TestAuthInfoBatchView(unittest.TestCase):
+
+    def _callFUT(self, store, tokens, consume=True):
+        from webob.multidict import MultiDict
+        from velruse.app import auth_info_batch_view
+        params = MultiDict([('tokens', t) for t in tokens])
+        request = testing.DummyRequest(params=params)
+        request.registry.velruse_store = store
+        request.registry.velruse_consume = consume
+        request.registry.velruse_tokens = None
+        return auth_info_batch_view(request)
+
+    def test_consume(self):
+        store = DummyConsumeStore(a={'x': 1}, b={'x': 2})
+        result = self._callFUT(store, ['a', 'c', 'b'])
+        self.assertEqual(result, {'a': {'x': 1}, 'b': {'x': 2}, 'c': None})
+        self.assertEqual(store.data, {})
+
+    def test_retrieve(self):
+        store = DummyStore(a={'x': 1})
+        result = self._callFUT(store, ['a', 'b'], consume=False)
+        self.assertEqual(result, {'a': {'x': 1}, 'b': None})
+        self.assertEqual(store.data, {'a': {'x': 1}})
+
+    def test_no_tokens(self):
+        self.assertEqual(self._callFUT(DummyStore(), []), {})
+
+
+class TestAuthCompleteView(unittest.TestCase):
+
+    def _callFUT(self, context):
+        from velruse.app import auth_complete_view
+        request = testing.DummyRequest()
+        request.registry.settings = {'endpoint': 'http://example.com/in'}
+        request.registry.velruse_store = store = DummyStore()
+        request.registry.velruse_tokens = None
+        request.registry.velruse_downstream = None
+        request.registry.velruse_handoff = None
+        auth_complete_view(context, request)
+        self.assertEqual(len(store.data), 1)
+        return list(store.data.values())[0]
+
+    def test_lazy_profile_missing(self):
+        from velruse import AuthenticationComplete
+        from velruse import LazyProfile
+        from velruse.http import HTTPClient
+        from velruse.http import HTTPRequest
+
+        class Client(HTTPClient):
+            def send(self, req):
+                raise IOError('timed out')
+
+        def flow():
+            r = yield HTTPRequest('GET', 'emails').optional('emails')
+            yield {'emails': r, 'preferredUsername': 'bob'}
+
+        http = Client()
+        self.addCleanup(http.close)
+        profile = LazyProfile(flow, http, eager={'accounts': []})
+        context = AuthenticationComplete(profile=profile, missing=['details'],
+                                         provider_name='gh',
+                                         provider_type='github')
+        result = self._callFUT(context)
+        self.assertEqual(result['profile'], {
+            'accounts': [], 'emails': None, 'preferredUsername': 'bob'})
+        self.assertEqual(result['missing'], ['details', 'emails'])
+        self.assertEqual(profile.missing, ['emails'])
+        self.assertEqual(context.missing, ['details'])
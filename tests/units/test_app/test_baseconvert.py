@@ -22,3 +22,56 @@ class TestBaseEncoding(unittest.TestCase):
     def test_bad_decode(self):
         from velruse.app.baseconvert import base_decode
         self.assertRaises(ValueError, base_decode, '381')
+
+
+class TestBaseCodec(unittest.TestCase):
+
+    def _makeOne(self, alphabet=None):
+        from velruse.app.baseconvert import BaseCodec
+        if alphabet is None:
+            return BaseCodec()
+        return BaseCodec(alphabet)
+
+    def test_roundtrip(self):
+        codec = self._makeOne()
+        for num in (0, 1, 55, 56, 3135, 3136, 425242, 2 ** 122 - 1, 7 ** 90):
+            self.assertEqual(codec.decode(codec.encode(num)), num)
+        self.assertEqual(codec.encode(425242), '4rBC')
+
+    def test_fixed_width(self):
+        codec = self._makeOne()
+        self.assertEqual(codec.encode(42, width=4), '222L')
+        self.assertEqual(codec.encode(0, width=3), '222')
+        self.assertEqual(codec.decode('222L'), 42)
+        self.assertEqual(codec.encode(425242, width=4), '4rBC')
+        self.assertRaises(ValueError, codec.encode, 425242, width=3)
+        self.assertEqual(len(codec.encode(2 ** 122 - 1, width=22)), 22)
+
+    def test_width(self):
+        codec = self._makeOne('01')
+        self.assertEqual(codec.width(8), 8)
+        self.assertEqual(codec.encode(255), '11111111')
+        self.assertEqual(self._makeOne().width(122), 22)
+
+    def test_bytes(self):
+        codec = self._makeOne()
+        self.assertEqual(codec.encode_bytes(42, width=2), b'2L')
+        self.assertEqual(codec.decode_bytes(b'4rBC'), 425242)
+        self.assertRaises(ValueError, codec.decode_bytes, b'4r1C')
+
+    def test_many(self):
+        codec = self._makeOne()
+        self.assertEqual(codec.encode_many([42, 0, 425242]),
+                         ['L', '2', '4rBC'])
+        self.assertEqual(codec.encode_many([42, 0], width=2), ['2L', '22'])
+        self.assertEqual(codec.decode_many(['L', '2', '4rBC', '222L']),
+                         [42, 0, 425242, 42])
+        self.assertEqual(codec.decode_many([]), [])
+        self.assertRaises(ValueError, codec.decode_many, ['L', '381'])
+
+    def test_invalid(self):
+        codec = self._makeOne()
+        self.assertRaises(ValueError, codec.encode, -1)
+        self.assertRaises(ValueError, codec.decode, u'4r\xe9')
+        self.assertRaises(ValueError, self._makeOne, 'aab')
+        self.assertRaises(ValueError, self._makeOne, 'a')
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyramid import testing
+
+
+def includeme(config):
+    config.add_directive('add_dummy_login', add_dummy_login)
+
+
+def add_dummy_login(config, name='dummy'):
+    config.registry.dummy_logins = getattr(
+        config.registry, 'dummy_logins', []) + [name]
+
+
+def add_dummy_login_from_settings(config, prefix='velruse.dummy.'):
+    settings = config.registry.settings
+    config.add_dummy_login(name=settings.get(prefix + 'name', 'dummy'))
+
+
+class DummyScanner(object):
+
+    def __init__(self, providers):
+        self.providers = providers
+        self.calls = 0
+
+    def __call__(self, group):
+        self.calls += 1
+        return dict(self.providers)
+
+
+class TestProviderIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'providers.json')
+        self.fingerprint = 'a'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, scan, filename=None):
+        from velruse.app.discovery import ProviderIndex
+        return ProviderIndex(filename, scan=scan,
+                             fingerprint=lambda: self.fingerprint)
+
+    def test_memory(self):
+        scan = DummyScanner({'acme': 'acme:setup'})
+        index = self._makeOne(scan)
+        self.assertEqual(index.get('acme'), 'acme:setup')
+        self.assertEqual(index.get('acme'), 'acme:setup')
+        self.assertEqual(scan.calls, 1)
+
+    def test_file_is_reused(self):
+        scan = DummyScanner({'acme': 'acme:setup'})
+        self.assertEqual(self._makeOne(scan, self.filename).get('acme'),
+                         'acme:setup')
+        with open(self.filename) as f:
+            self.assertEqual(json.load(f)['providers'],
+                             {'acme': 'acme:setup'})
+        self.assertEqual(self._makeOne(scan, self.filename).get('acme'),
+                         'acme:setup')
+        self.assertEqual(scan.calls, 1)
+
+    def test_file_is_stale(self):
+        scan = DummyScanner({'acme': 'acme:setup'})
+        self._makeOne(scan, self.filename).load()
+        self.fingerprint = 'b'
+        scan.providers['other'] = 'other:setup'
+        index = self._makeOne(scan, self.filename)
+        self.assertEqual(index.load()['other'], 'other:setup')
+        self.assertEqual(scan.calls, 2)
+
+    def test_file_is_invalid(self):
+        with open(self.filename, 'w') as f:
+            f.write('{')
+        scan = DummyScanner({'acme': 'acme:setup'})
+        index = self._makeOne(scan, self.filename)
+        self.assertEqual(index.get('acme'), 'acme:setup')
+
+    def test_missing_provider_rescans(self):
+        scan = DummyScanner({})
+        index = self._makeOne(scan)
+        index.load()
+        scan.providers['acme'] = 'acme:setup'
+        self.assertEqual(index.get('acme'), 'acme:setup')
+        self.assertEqual(index.get('missing'), None)
+        self.assertEqual(scan.calls, 3)
+
+    def test_scan_entry_points(self):
+        from velruse.app.discovery import scan_entry_points
+        self.assertEqual(scan_entry_points('velruse.no-such-group'), {})
+
+
+class TestLoadProvider(unittest.TestCase):
+
+    def setUp(self):
+        from velruse.app import discovery
+        from velruse.app.discovery import ProviderIndex
+        spec = __name__ + ':add_dummy_login_from_settings'
+        self.scan = DummyScanner({'acme': spec})
+        discovery._indexes['test'] = ProviderIndex(scan=self.scan)
+        self.config = testing.setUp(settings={'providers.index': 'test'})
+
+    def tearDown(self):
+        from velruse.app import discovery
+        discovery._indexes.pop('test', None)
+        testing.tearDown()
+
+    def _callFUT(self, provider):
+        from velruse.app import load_provider
+        return load_provider(self.config, provider)
+
+    def test_entry_point(self):
+        self.config.registry.settings.update({
+            'provider.a.impl': 'acme',
+            'provider.a.name': 'acme1',
+        })
+        self._callFUT('a')
+        self.assertEqual(self.config.registry.dummy_logins, ['acme1'])
+
+    def test_entry_point_without_includeme(self):
+        package = __name__.rsplit('.', 1)[0]
+        self.scan.providers['plain'] = (
+            package + ':add_plain_login_from_settings')
+        self.config.registry.settings.update({
+            'provider.p.impl': 'plain',
+            'provider.p.name': 'plain1',
+        })
+        self._callFUT('p')
+        self.assertEqual(self.config.registry.plain_logins, ['plain1'])
+
+    def test_builtin_does_not_scan(self):
+        self.config.registry.settings.update({
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+        })
+        self._callFUT('github')
+        self.assertEqual(self.scan.calls, 0)
+
+    def test_unknown(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._callFUT, 'nope')
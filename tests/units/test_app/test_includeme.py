@@ -0,0 +1,108 @@
+import unittest
+
+from pyramid import testing
+
+
+def _setup(config):
+    from pyramid.session import SignedCookieSessionFactory
+    config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+    config.register_velruse_store(None)
+
+
+class TestIncludeme(unittest.TestCase):
+
+    def _makeConfig(self, **settings):
+        settings.setdefault('setup', _setup)
+        settings.setdefault('endpoint', 'http://example.com/logged_in')
+        config = testing.setUp(settings=settings)
+        self.addCleanup(testing.tearDown)
+        config.include('velruse.app')
+        return config
+
+    def test_only_configured_providers_are_included(self):
+        config = self._makeConfig(**{
+            'provider.gh.impl': 'github',
+            'provider.gh.consumer_key': 'key',
+            'provider.gh.consumer_secret': 'secret',
+        })
+        directives = config.registry._directives
+        self.assertTrue('add_github_login' in directives)
+        self.assertFalse('add_facebook_login' in directives)
+        self.assertEqual(len(config.registry.velruse_providers), 1)
+
+    def test_no_providers(self):
+        config = self._makeConfig()
+        self.assertFalse('add_github_login' in config.registry._directives)
+
+    def test_bulkheads(self):
+        from velruse import bulkheads
+        config = self._makeConfig(**{
+            'bulkheads.concurrency': '3',
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+            'provider.facebook.consumer_key': 'key',
+            'provider.facebook.consumer_secret': 'secret',
+            'provider.facebook.http.bulkhead.concurrency': '1',
+        })
+        config.commit()
+        stats = bulkheads(config.registry)
+        self.assertEqual(stats['github']['concurrency'], 3)
+        self.assertEqual(stats['facebook']['concurrency'], 1)
+
+    def test_unknown_provider(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeConfig,
+                          **{'provider.x.consumer_key': 'key'})
+
+
+class TestUpstreamFailure(unittest.TestCase):
+
+    def _makeApp(self, **settings):
+        from pyramid.config import Configurator
+        from velruse.store.memory import MemoryStore
+
+        def setup(config):
+            _setup(config)
+            config.register_velruse_store(MemoryStore())
+
+        settings.update({
+            'setup': setup,
+            'endpoint': 'http://example.com/logged_in',
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+            'provider.github.http.breaker.failures': '1',
+        })
+        config = Configurator(settings=settings)
+        config.include('velruse.app')
+        app = config.make_wsgi_app()
+        breaker = app.registry.velruse_providers['github'].http.breaker
+        breaker.acquire()
+        breaker.failure()
+        return app
+
+    def test_unavailable_provider_is_denied(self):
+        from webtest import TestApp
+        from velruse import circuit_breakers
+        app = self._makeApp()
+        res = TestApp(app).get('/login/github/callback?code=c&state=s')
+        self.assertTrue('http://example.com/logged_in' in res.text)
+        token = res.html.find('input', {'name': 'token'})
+        result = app.registry.velruse_store.retrieve(token['value'])
+        self.assertEqual(result['provider_name'], 'github')
+        self.assertEqual(result['provider_type'], 'github')
+        self.assertTrue('circuit breaker' in result['error'])
+        stats = circuit_breakers(app.registry)
+        self.assertEqual(stats['github']['state'], 'open')
+        self.assertEqual(stats['github']['rejected'], 1)
+
+    def test_unavailable_provider_error(self):
+        from webtest import TestApp
+        from velruse.exceptions import ProviderUnavailable
+        app = TestApp(self._makeApp(upstream_failure='error'))
+        self.assertRaises(ProviderUnavailable, app.get,
+                          '/login/github/callback?code=c&state=s')
+
+    def test_invalid_upstream_failure(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeApp,
+                          upstream_failure='x')
@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from webtest import TestApp
+
+from velruse.compat import parse_qs
+
+
+def _setup(config):
+    from pyramid.session import SignedCookieSessionFactory
+    config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+    config.register_velruse_store(None)
+
+
+def _app(environ, start_response):
+    result = environ.get('velruse.result')
+    body = json.dumps({
+        'path': environ['PATH_INFO'],
+        'method': environ['REQUEST_METHOD'],
+        'cookie': environ.get('HTTP_COOKIE'),
+        'result': result,
+    })
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body.encode('utf-8')]
+
+
+class TestVelruseMiddleware(unittest.TestCase):
+
+    def _makeOne(self, **settings):
+        from velruse.app.middleware import make_filter
+        settings.setdefault('setup', _setup)
+        settings.setdefault('endpoint', 'http://example.com/logged_in')
+        settings.setdefault('provider.github.consumer_key', 'key')
+        settings.setdefault('provider.github.consumer_secret', 'secret')
+        return TestApp(make_filter(_app, {}, **settings))
+
+    def test_passthrough(self):
+        app = self._makeOne()
+        res = app.get('/foo')
+        self.assertEqual(res.json['path'], '/foo')
+        self.assertEqual(res.json['result'], None)
+
+    def test_denied_dispatched_to_endpoint(self):
+        app = self._makeOne()
+        res = app.get('/login/github')
+        self.assertEqual(res.status_int, 302)
+        state = parse_qs(res.location.split('?', 1)[1])['state'][0]
+
+        res = app.get('/login/github/callback',
+                      params={'state': state, 'error': 'access_denied'})
+        self.assertEqual(res.json['path'], '/logged_in')
+        self.assertEqual(res.json['method'], 'POST')
+        self.assertTrue(res.json['cookie'])
+        self.assertTrue('Set-Cookie' in res.headers)
+        self.assertEqual(res.json['result'], {
+            'provider_type': 'github',
+            'provider_name': 'github',
+            'error': 'access_denied',
+        })
@@ -0,0 +1,60 @@
+import unittest
+
+try:
+    import cryptography
+except ImportError:  # pragma: no cover
+    cryptography = None
+
+
+@unittest.skipIf(cryptography is None, 'cryptography is not installed')
+class TestSealedTokens(unittest.TestCase):
+
+    def _makeOne(self, secrets='seekrit', **kw):
+        from velruse.app.tokens import SealedTokens
+        self.now = 1000.0
+        return SealedTokens(secrets, clock=lambda: self.now, **kw)
+
+    def test_roundtrip(self):
+        tokens = self._makeOne()
+        data = {'profile': {'displayName': u'J\xfcrgen'}, 'a': [1, 2]}
+        token = tokens.seal(data)
+        self.assertFalse('displayName' in token)
+        self.assertEqual(tokens.unseal(token), data)
+        self.assertEqual(tokens.unseal(token), data)
+
+    def test_expired(self):
+        tokens = self._makeOne(ttl=60)
+        token = tokens.seal({'a': 1})
+        self.now += 61
+        self.assertRaises(KeyError, tokens.unseal, token)
+
+    def test_invalid(self):
+        tokens = self._makeOne()
+        token = tokens.seal({'a': 1})
+        self.assertRaises(KeyError, tokens.unseal, token[:-4] + 'AAAA')
+        self.assertRaises(KeyError, tokens.unseal, 'garbage')
+        self.assertRaises(KeyError, tokens.unseal, None)
+        other = self._makeOne('other')
+        self.assertRaises(KeyError, other.unseal, token)
+
+    def test_rotation(self):
+        old = self._makeOne('old')
+        token = old.seal({'a': 1})
+        tokens = self._makeOne(['new', 'old'])
+        self.assertEqual(tokens.unseal(token), {'a': 1})
+        self.assertRaises(KeyError, old.unseal, tokens.seal({'a': 1}))
+
+    def test_no_secret(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._makeOne, [])
+
+    def test_from_settings(self):
+        from velruse.app.tokens import sealed_tokens_from_settings
+        tokens = sealed_tokens_from_settings({
+            'tokens.secret': '\nnew\nold',
+            'tokens.ttl': '60',
+        })
+        self.assertEqual(tokens.ttl, 60)
+        old = sealed_tokens_from_settings({'tokens.secret': 'old'})
+        self.assertEqual(old.ttl, 300)
+        self.assertEqual(tokens.unseal(old.seal({'a': 1})), {'a': 1})
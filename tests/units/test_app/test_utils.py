@@ -0,0 +1,106 @@
+import unittest
+
+
+class TestGenerateToken(unittest.TestCase):
+
+    def test_generate_token(self):
+        from velruse.app.baseconvert import ALPHABET
+        from velruse.app.utils import generate_token
+        token = generate_token()
+        self.assertEqual(len(token), 22)
+        self.assertTrue(set(token) <= set(ALPHABET))
+        self.assertNotEqual(token, generate_token())
+
+    def test_generate_tokens(self):
+        from velruse.app.baseconvert import ALPHABET
+        from velruse.app.utils import generate_tokens
+        tokens = generate_tokens(500)
+        self.assertEqual(len(tokens), 500)
+        self.assertEqual(len(set(tokens)), 500)
+        self.assertEqual(set(len(t) for t in tokens), set([22]))
+        self.assertEqual(set(''.join(tokens)), set(ALPHABET))
+        self.assertEqual(generate_tokens(0), [])
+
+
+class TestRedirectForm(unittest.TestCase):
+
+    def _makeOne(self, end_point):
+        from velruse.app.utils import RedirectForm
+        return RedirectForm(end_point)
+
+    def test_render(self):
+        from velruse.app.utils import redirect_form
+        form = self._makeOne(u'http://example.com/in?x=\xe9')
+        body = form.render('t0k3n')
+        self.assertTrue(isinstance(body, bytes))
+        self.assertEqual(
+            body.decode('utf-8'),
+            redirect_form(u'http://example.com/in?x=\xe9', 't0k3n'))
+
+    def test_response(self):
+        form = self._makeOne('http://example.com/in')
+        response = form.response('t0k3n')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'text/html')
+        self.assertTrue(b'value="t0k3n"' in response.body)
+
+
+class TestRedirectLocation(unittest.TestCase):
+
+    def _makeOne(self, end_point):
+        from velruse.app.utils import RedirectLocation
+        return RedirectLocation(end_point)
+
+    def test_response(self):
+        handoff = self._makeOne('http://example.com/in')
+        response = handoff.response('t0k3n')
+        self.assertEqual(response.status_int, 303)
+        self.assertEqual(response.location,
+                         'http://example.com/in?token=t0k3n')
+
+    def test_query_and_quoting(self):
+        handoff = self._makeOne('http://example.com/in?a=1')
+        self.assertEqual(handoff.location('ab=='),
+                         'http://example.com/in?a=1&token=ab%3D%3D')
+
+
+class TestEndpointMethod(unittest.TestCase):
+
+    def _login(self, **settings):
+        from pyramid.session import SignedCookieSessionFactory
+        from webtest import TestApp
+        from velruse.app import make_app
+        from velruse.compat import parse_qs
+        from velruse.store.memory import MemoryStore
+
+        def setup(config):
+            config.set_session_factory(SignedCookieSessionFactory('seekrit'))
+            config.register_velruse_store(MemoryStore())
+
+        settings.update({
+            'setup': setup,
+            'endpoint': 'http://example.com/in',
+            'provider.github.consumer_key': 'key',
+            'provider.github.consumer_secret': 'secret',
+        })
+        app = TestApp(make_app({}, **settings))
+        res = app.get('/login/github')
+        state = parse_qs(res.location.split('?', 1)[1])['state'][0]
+        return app.get('/login/github/callback',
+                       params={'state': state, 'error': 'denied'})
+
+    def test_post(self):
+        res = self._login()
+        self.assertEqual(res.status_int, 200)
+        self.assertTrue(b'action="http://example.com/in"' in res.body)
+
+    def test_get(self):
+        res = self._login(**{'endpoint.method': 'get'})
+        self.assertEqual(res.status_int, 303)
+        self.assertTrue(
+            res.location.startswith('http://example.com/in?token='))
+
+    def test_invalid(self):
+        from pyramid.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._login,
+                          **{'endpoint.method': 'PUT'})
@@ -0,0 +1,361 @@
+import unittest
+
+
+class TestHTTPClient(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.http import HTTPClient
+        return HTTPClient(**kw)
+
+    def test_pool_settings(self):
+        client = self._makeOne(pool_connections=2, pool_maxsize=5)
+        adapter = client.session.get_adapter('https://example.com')
+        self.assertTrue(adapter is client.session.get_adapter('http://x'))
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertTrue('Connection' not in client.session.headers or
+                        client.session.headers['Connection'] != 'close')
+
+    def test_no_keep_alive(self):
+        client = self._makeOne(keep_alive=False)
+        self.assertEqual(client.session.headers['Connection'], 'close')
+
+    def test_make_http_client(self):
+        from velruse.http import HTTPClient
+        from velruse.http import make_http_client
+        client = make_http_client({'pool_maxsize': 3})
+        self.assertTrue(isinstance(client, HTTPClient))
+        self.assertEqual(client.pool_maxsize, 3)
+        self.assertTrue(make_http_client(client) is client)
+        self.assertEqual(make_http_client().pool_maxsize, 10)
+
+
+class TestHTTPClientRun(unittest.TestCase):
+
+    def _makeOne(self):
+        from velruse.http import HTTPClient
+
+        class Client(HTTPClient):
+            def send(self, req):
+                if req.url == 'fail':
+                    raise KeyError(req.url)
+                return req.url
+        return Client()
+
+    def test_sub_flows(self):
+        from velruse.http import HTTPRequest
+
+        def inner(name):
+            r = yield HTTPRequest('GET', name)
+            yield r.upper()
+
+        def flow():
+            a = yield inner('a')
+            b = yield HTTPRequest('GET', 'b')
+            c = yield inner('c')
+            yield [a, b, c]
+
+        client = self._makeOne()
+        self.assertEqual(client.run(flow()), ['A', 'b', 'C'])
+
+    def test_sub_flow_error_propagates(self):
+        from velruse.http import HTTPRequest
+
+        def inner():
+            yield HTTPRequest('GET', 'fail')
+            yield 'unreachable'
+
+        def flow():
+            try:
+                yield inner()
+            except KeyError:
+                yield 'recovered'
+
+        client = self._makeOne()
+        self.assertEqual(client.run(flow()), 'recovered')
+
+    def test_flow_without_result(self):
+        def flow():
+            if False:
+                yield
+
+        self.assertEqual(self._makeOne().run(flow()), None)
+
+    def test_deadline_is_thrown_into_flow(self):
+        from velruse.exceptions import DeadlineExceeded
+        from velruse.http import HTTPRequest
+        client = self._makeOne()
+        client.deadline = 0
+        seen = []
+
+        def flow():
+            try:
+                yield HTTPRequest('GET', 'a')
+            except DeadlineExceeded:
+                seen.append('expired')
+                raise
+
+        self.assertRaises(DeadlineExceeded, client.run, flow())
+        self.assertEqual(seen, ['expired'])
+
+    def test_deadline_bounds_timeouts(self):
+        from velruse.http import HTTPRequest
+        client = self._makeOne()
+        client.deadline = 60
+        client.timeout = 5
+        reqs = [HTTPRequest('GET', 'a'), HTTPRequest('GET', 'b', timeout=1)]
+
+        def flow():
+            yield reqs[0]
+            yield reqs[1]
+
+        client.run(flow())
+        self.assertEqual(reqs[0].timeout, 5)
+        self.assertEqual(reqs[1].timeout, 1)
+
+    def test_breaker(self):
+        from velruse.exceptions import ProviderUnavailable
+        from velruse.exceptions import ThirdPartyFailure
+        from velruse.exceptions import UpstreamFailure
+        from velruse.http import CircuitBreaker
+        from velruse.http import HTTPRequest
+        client = self._makeOne()
+        client.breaker = CircuitBreaker(failures=1)
+        calls = []
+
+        def flow(url):
+            calls.append(url)
+            if url == 'invalid':
+                raise ThirdPartyFailure('invalid callback')
+            r = yield HTTPRequest('GET', url)
+            if r == 'error':
+                raise UpstreamFailure(r)
+
+        # errors of the flow are not failures of the upstream service
+        self.assertRaises(KeyError, client.run, flow('fail'))
+        self.assertRaises(ThirdPartyFailure, client.run, flow('invalid'))
+        self.assertEqual(client.breaker.state, 'closed')
+        self.assertRaises(UpstreamFailure, client.run, flow('error'))
+        self.assertEqual(client.breaker.state, 'open')
+        self.assertRaises(ProviderUnavailable, client.run, flow('a'))
+        self.assertEqual(calls, ['fail', 'invalid', 'error'])
+
+    def test_unguarded_call(self):
+        from velruse.http import CircuitBreaker
+        client = self._makeOne()
+        client.breaker = CircuitBreaker(failures=1)
+
+        def fail():
+            raise IOError('unknown host')
+
+        self.assertRaises(IOError, client.call, fail, guard=False)
+        self.assertEqual(client.breaker.state, 'closed')
+        self.assertRaises(IOError, client.call, fail)
+        self.assertEqual(client.breaker.state, 'open')
+
+
+    def test_optional_requests_are_skipped(self):
+        import threading
+        import time
+        from velruse import AuthenticationComplete
+        from velruse.http import HTTPRequest
+        client = self._makeOne()
+        self.addCleanup(client.close)
+        event = threading.Event()
+        self.addCleanup(event.set)
+        client.optional_budget = 0.05
+        send = client.send
+
+        def slow_send(req):
+            if req.url == 'slow':
+                event.wait()
+            return send(req)
+        client.send = slow_send
+
+        def flow():
+            a = yield HTTPRequest('GET', 'a')
+            b = yield HTTPRequest('GET', 'slow').optional('details')
+            c = yield HTTPRequest('GET', 'fail').optional('emails')
+            yield AuthenticationComplete(profile=[a, b, c])
+
+        start = time.time()
+        result = client.run(flow())
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(result.profile, ['a', None, None])
+        self.assertEqual(result.missing, ['details', 'emails'])
+
+    def test_optional_requests_after_deadline(self):
+        from velruse import AuthenticationComplete
+        from velruse.http import HTTPRequest
+        client = self._makeOne()
+        client.deadline = 0
+
+        def flow():
+            r = yield HTTPRequest('GET', 'a').optional('details')
+            yield AuthenticationComplete(profile=r)
+
+        result = client.run(flow())
+        self.assertEqual(result.profile, None)
+        self.assertEqual(result.missing, ['details'])
+
+
+class DummyClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+
+    def _makeOne(self, seconds):
+        from velruse.http import Deadline
+        self.clock = DummyClock()
+        return Deadline(seconds, clock=self.clock)
+
+    def test_timeout(self):
+        from velruse.exceptions import DeadlineExceeded
+        deadline = self._makeOne(10)
+        self.assertEqual(deadline.timeout(), 10)
+        self.assertEqual(deadline.timeout(3), 3)
+        self.clock.now += 8
+        self.assertEqual(deadline.timeout(3), 2)
+        self.clock.now += 2
+        self.assertRaises(DeadlineExceeded, deadline.timeout)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.http import CircuitBreaker
+        self.clock = DummyClock()
+        return CircuitBreaker(clock=self.clock, **kw)
+
+    def test_opens_after_consecutive_failures(self):
+        from velruse.exceptions import ProviderUnavailable
+        breaker = self._makeOne(failures=2)
+        breaker.acquire()
+        breaker.failure()
+        breaker.acquire()
+        breaker.success()
+        breaker.acquire()
+        breaker.failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.acquire()
+        breaker.failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(ProviderUnavailable, breaker.acquire)
+        stats = breaker.stats()
+        self.assertEqual(stats['calls'], 4)
+        self.assertEqual(stats['failures'], 3)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['state'], 'open')
+
+    def test_slow_calls_are_failures(self):
+        breaker = self._makeOne(failures=1, slow_call=2)
+        breaker.acquire()
+        breaker.success(1)
+        self.assertEqual(breaker.state, 'closed')
+        breaker.acquire()
+        breaker.success(3)
+        self.assertEqual(breaker.state, 'open')
+
+    def test_half_open_probe_closes(self):
+        from velruse.exceptions import ProviderUnavailable
+        breaker = self._makeOne(failures=1, reset_timeout=30)
+        breaker.acquire()
+        breaker.failure()
+        self.clock.now += 30
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.acquire()
+        # a single probe at a time
+        self.assertRaises(ProviderUnavailable, breaker.acquire)
+        breaker.success()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.acquire()
+
+    def test_half_open_probe_reopens(self):
+        breaker = self._makeOne(failures=1, reset_timeout=30)
+        breaker.acquire()
+        breaker.failure()
+        self.clock.now += 30
+        breaker.acquire()
+        breaker.failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.stats()['opened'], 2)
+
+    def test_released_probe(self):
+        breaker = self._makeOne(failures=1, reset_timeout=30)
+        breaker.acquire()
+        breaker.failure()
+        self.clock.now += 30
+        breaker.acquire()
+        breaker.release()
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.acquire()
+
+    def test_make_breaker(self):
+        from velruse.http import CircuitBreaker
+        from velruse.http import make_breaker
+        from velruse.http import make_http_client
+        self.assertEqual(make_breaker(None), None)
+        breaker = make_breaker({'failures': 2}, 'github')
+        self.assertEqual((breaker.failures, breaker.name), (2, 'github'))
+        self.assertTrue(make_breaker(breaker) is breaker)
+        client = make_http_client({'breaker': {}}, 'github')
+        self.assertTrue(isinstance(client.breaker, CircuitBreaker))
+        self.assertEqual(client.breaker.name, 'github')
+        self.assertEqual(make_http_client().breaker, None)
+
+
+class TestBulkhead(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.http import Bulkhead
+        bulkhead = Bulkhead(**kw)
+        self.addCleanup(bulkhead.shutdown)
+        return bulkhead
+
+    def test_call(self):
+        import threading
+        bulkhead = self._makeOne(concurrency=2)
+        self.assertNotEqual(bulkhead.call(threading.current_thread),
+                            threading.current_thread())
+        self.assertEqual(bulkhead.stats()['pending'], 0)
+
+    def test_full(self):
+        import threading
+        from velruse.exceptions import BulkheadFull
+        bulkhead = self._makeOne(concurrency=1, queue=1)
+        event = threading.Event()
+        futures = [bulkhead.submit(event.wait) for i in range(2)]
+        self.assertRaises(BulkheadFull, bulkhead.submit, event.wait)
+        event.set()
+        for future in futures:
+            future.result()
+        bulkhead.call(lambda: None)
+        stats = bulkhead.stats()
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_timeout(self):
+        import threading
+        from velruse.exceptions import DeadlineExceeded
+        bulkhead = self._makeOne(concurrency=1)
+        event = threading.Event()
+        self.addCleanup(event.set)
+        self.assertRaises(DeadlineExceeded, bulkhead.call, event.wait, 0.01)
+
+    def test_client(self):
+        from velruse.http import Bulkhead
+        from velruse.http import make_http_client
+        client = make_http_client({'bulkhead': {'concurrency': 2}}, 'github')
+        self.addCleanup(client.close)
+        self.assertTrue(isinstance(client.bulkhead, Bulkhead))
+        self.assertEqual(client.bulkhead.name, 'github')
+        self.assertEqual(client.call(lambda: 'ok'), 'ok')
+        self.assertEqual(client.bulkhead.stats()['calls'], 1)
@@ -0,0 +1,197 @@
+import base64
+import binascii
+import json
+import time
+import unittest
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:  # pragma: no cover
+    rsa = None
+
+from .test_providers import DummyResponse
+
+
+ISSUER = 'https://accounts.google.com'
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64int(num):
+    data = '%x' % num
+    data = binascii.unhexlify('0' * (len(data) % 2) + data)
+    return _b64(data).decode('ascii')
+
+
+class DummySigner(object):
+    """Sign ID tokens with a locally generated key"""
+
+    def __init__(self, kid='k1'):
+        self.kid = kid
+        self.key = rsa.generate_private_key(public_exponent=65537,
+                                            key_size=2048)
+
+    def jwk(self):
+        numbers = self.key.public_key().public_numbers()
+        return {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': self.kid,
+                'n': _b64int(numbers.n), 'e': _b64int(numbers.e)}
+
+    def sign(self, alg='RS256', **claims):
+        now = int(time.time())
+        claims.setdefault('iss', ISSUER)
+        claims.setdefault('aud', 'client')
+        claims.setdefault('sub', '42')
+        claims.setdefault('iat', now)
+        claims.setdefault('exp', now + 3600)
+        header = {'alg': alg, 'kid': self.kid, 'typ': 'JWT'}
+        signed = b'.'.join(_b64(json.dumps(part).encode('utf-8'))
+                           for part in (header, claims))
+        signature = self.key.sign(signed, padding.PKCS1v15(), hashes.SHA256())
+        return (signed + b'.' + _b64(signature)).decode('ascii')
+
+
+def jwks_response(*signers, **kw):
+    response = DummyResponse(text=json.dumps(
+        {'keys': [s.jwk() for s in signers]}))
+    response.headers = kw
+    return response
+
+
+class DummyClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@unittest.skipIf(rsa is None, 'cryptography is not installed')
+class TestVerifyIDToken(unittest.TestCase):
+
+    def setUp(self):
+        from velruse.idtoken import load_key
+        self.signer = DummySigner()
+        self.keys = {'k1': load_key(self.signer.jwk())}
+
+    def _callFUT(self, id_token, **kw):
+        from velruse.idtoken import verify_id_token
+        return verify_id_token(id_token, self.keys, 'client', (ISSUER,),
+                               **kw)
+
+    def test_valid(self):
+        claims = self._callFUT(self.signer.sign(email='bob@example.com'))
+        self.assertEqual(claims['sub'], '42')
+        self.assertEqual(claims['email'], 'bob@example.com')
+
+    def test_audience_list(self):
+        token = self.signer.sign(aud=['other', 'client'])
+        self.assertEqual(self._callFUT(token)['sub'], '42')
+
+    def test_invalid(self):
+        from velruse.exceptions import InvalidIDToken
+        now = int(time.time())
+        other = DummySigner()
+        tampered = self.signer.sign().split('.')
+        tampered[1] = _b64(b'{"sub": "1"}').decode('ascii')
+        for token in [
+            'garbage',
+            '.'.join(tampered),
+            other.sign(),
+            DummySigner(kid='k2').sign(),
+            self.signer.sign(alg='none'),
+            self.signer.sign(iss='https://evil.example.com'),
+            self.signer.sign(aud='other'),
+            self.signer.sign(exp=now - 120),
+            self.signer.sign(iat=now + 120),
+        ]:
+            self.assertRaises(InvalidIDToken, self._callFUT, token)
+
+    def test_leeway(self):
+        token = self.signer.sign(exp=int(time.time()) - 30)
+        self.assertEqual(self._callFUT(token)['sub'], '42')
+
+
+class TestCacheMaxAge(unittest.TestCase):
+
+    def _callFUT(self, value):
+        from velruse.idtoken import cache_max_age
+        return cache_max_age(value)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT(None), None)
+        self.assertEqual(self._callFUT('public'), None)
+        self.assertEqual(
+            self._callFUT('public, max-age=19854, must-revalidate'), 19854)
+        self.assertEqual(self._callFUT('no-store'), 0)
+
+
+@unittest.skipIf(rsa is None, 'cryptography is not installed')
+class TestJWKSCache(unittest.TestCase):
+
+    def _makeOne(self, responses, **kw):
+        from velruse.idtoken import JWKSCache
+        from .test_providers import DummyHTTPClient
+        self.clock = DummyClock()
+        self.http = DummyHTTPClient(responses)
+        cache = JWKSCache('https://example.com/certs', http=self.http,
+                          clock=self.clock, **kw)
+        self.addCleanup(self.http.close)
+        return cache
+
+    def _keys(self, cache, kid=None):
+        return self.http.run(cache.keys_flow(kid))
+
+    def test_fetch_once_then_cached(self):
+        signer = DummySigner()
+        cache = self._makeOne([
+            jwks_response(signer, **{'Cache-Control': 'max-age=600'})])
+        self.assertEqual(list(self._keys(cache)), ['k1'])
+        self.clock.now += 200
+        self.assertEqual(list(self._keys(cache)), ['k1'])
+        self.assertEqual(len(self.http.requests), 1)
+        self.assertEqual(cache.expires, 1600)
+
+    def test_expired_keys_are_fetched(self):
+        signers = DummySigner('k1'), DummySigner('k2')
+        cache = self._makeOne([jwks_response(signers[0]),
+                               jwks_response(signers[1])], default_ttl=600)
+        self._keys(cache)
+        self.clock.now += 600
+        self.assertEqual(list(self._keys(cache)), ['k2'])
+
+    def test_min_ttl(self):
+        signer = DummySigner()
+        cache = self._makeOne([
+            jwks_response(signer, **{'Cache-Control': 'no-cache'})],
+            min_ttl=60)
+        self._keys(cache)
+        self.assertEqual(cache.expires, 1060)
+
+    def test_unknown_kid_refetches_at_most_every_min_ttl(self):
+        signers = DummySigner('k1'), DummySigner('k2')
+        cache = self._makeOne([jwks_response(signers[0]),
+                               jwks_response(*signers)], min_ttl=60)
+        self._keys(cache, 'k1')
+        self.assertEqual(list(self._keys(cache, 'k2')), ['k1'])
+        self.clock.now += 60
+        self.assertEqual(sorted(self._keys(cache, 'k2')), ['k1', 'k2'])
+        self.assertEqual(len(self.http.requests), 2)
+
+    def test_background_refresh(self):
+        signers = DummySigner('k1'), DummySigner('k2')
+        cache = self._makeOne([jwks_response(signers[0]),
+                               jwks_response(signers[1])],
+                              default_ttl=3600, refresh_ahead=300)
+        self._keys(cache)
+        self.clock.now += 3400
+        # the current keys are used while the refresh runs
+        self.assertEqual(list(self._keys(cache)), ['k1'])
+        self.http.executor.shutdown(wait=True)
+        self.assertEqual(list(cache.keys), ['k2'])
+        self.assertFalse(cache.refreshing)
+        self.assertEqual(cache.expires, 4400 + 3600)
@@ -0,0 +1,26 @@
+import json
+
+from velruse.http import HTTPClient
+
+
+class DummyResponse(object):
+
+    def __init__(self, status_code=200, text=''):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class DummyHTTPClient(HTTPClient):
+
+    def __init__(self, responses):
+        HTTPClient.__init__(self)
+        self.responses = responses
+        self.requests = []
+
+    def send(self, req):
+        self.requests.append(req)
+        return self.responses.pop(0)
@@ -0,0 +1,96 @@
+import json
+import unittest
+
+from pyramid import testing
+
+from velruse.compat import parse_qs
+
+from . import DummyHTTPClient
+from . import DummyResponse
+from ..test_idtoken import DummySigner
+from ..test_idtoken import jwks_response
+from ..test_idtoken import rsa
+
+
+@unittest.skipIf(rsa is None, 'cryptography is not installed')
+class TestGoogleOAuth2Provider(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('velruse.google-callback', '/callback')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, responses, **kw):
+        from velruse.idtoken import JWKSCache
+        from velruse.providers.google_oauth2 import GoogleOAuth2Provider
+        provider = GoogleOAuth2Provider('google', 'client', 'secret', None,
+                                        http=DummyHTTPClient(responses),
+                                        **kw)
+        if provider.jwks is not None:
+            # a cache of the test rather than the one of the process
+            provider.jwks = JWKSCache(provider.jwks_url, http=provider.http)
+        return provider
+
+    def _callback(self, provider):
+        request = testing.DummyRequest(params={'code': 'c', 'state': 'st'})
+        request.session['velruse.state'] = 'st'
+        return provider.callback(request)
+
+    def test_login_requests_openid_scope(self):
+        from webob.multidict import MultiDict
+        provider = self._makeOne([], verify_id_token=True)
+        response = provider.login(testing.DummyRequest(post=MultiDict()))
+        scope = parse_qs(response.location.split('?', 1)[1])['scope'][0]
+        self.assertEqual(scope.split()[0], 'openid')
+
+    def test_callback_verifies_id_token(self):
+        signer = DummySigner()
+        id_token = signer.sign(email='bob@example.com', email_verified=True,
+                               name='Bob')
+        provider = self._makeOne([
+            DummyResponse(text=json.dumps(
+                {'access_token': 't', 'id_token': id_token})),
+            jwks_response(signer, **{'Cache-Control': 'max-age=3600'}),
+            DummyResponse(text=json.dumps(
+                {'access_token': 't', 'id_token': id_token})),
+        ], verify_id_token=True)
+        context = self._callback(provider)
+        self.assertEqual(context.profile, {
+            'accounts': [{'domain': 'accounts.google.com',
+                          'username': 'bob@example.com',
+                          'userid': '42'}],
+            'displayName': 'Bob',
+            'preferredUsername': 'bob@example.com',
+            'emails': [{'value': 'bob@example.com'}],
+            'verifiedEmail': 'bob@example.com',
+        })
+        # the keys are cached, the userinfo endpoint is never called
+        self._callback(provider)
+        urls = [r.url.split('?', 1)[0] for r in provider.http.requests]
+        self.assertEqual(urls, [provider.access_token_url,
+                                provider.jwks_url,
+                                provider.access_token_url])
+
+    def test_callback_rejects_forged_id_token(self):
+        from velruse.exceptions import InvalidIDToken
+        signer = DummySigner()
+        forged = DummySigner().sign(email='eve@example.com')
+        provider = self._makeOne([
+            DummyResponse(text=json.dumps(
+                {'access_token': 't', 'id_token': forged})),
+            jwks_response(signer),
+        ], verify_id_token=True)
+        self.assertRaises(InvalidIDToken, self._callback, provider)
+
+    def test_callback_without_id_token_uses_userinfo(self):
+        provider = self._makeOne([
+            DummyResponse(text='{"access_token": "t"}'),
+            DummyResponse(text=json.dumps(
+                {'id': '42', 'email': 'bob@example.com'})),
+        ], verify_id_token=True)
+        context = self._callback(provider)
+        self.assertEqual(context.profile['accounts'][0]['userid'], '42')
+        self.assertEqual(provider.http.requests[1].url.split('?', 1)[0],
+                         provider.profile_url)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""The signatures and profile normalization of the individual providers"""
+import hashlib
+import unittest
+
+from velruse.compat import parse_qsl
+from velruse.compat import urlsplit
+
+
+def _md5(data):
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def _query(url):
+    return dict(parse_qsl(urlsplit(url).query))
+
+
+class TestLastfmSignCall(unittest.TestCase):
+
+    def _callFUT(self, params, secret):
+        from velruse.providers.lastfm import sign_call
+        return sign_call(params, secret)
+
+    def test_text(self):
+        params = {'method': 'auth.getSession', 'token': u't\xf6k',
+                  'api_key': 'key'}
+        signed = self._callFUT(params, 'secret')
+        self.assertEqual(
+            signed['api_sig'],
+            _md5(u'api_keykeymethodauth.getSessiontokent\xf6ksecret'))
+        self.assertFalse('api_sig' in params)
+
+
+class TestTaobaoProfileRequest(unittest.TestCase):
+
+    def test_sign(self):
+        from velruse.providers.taobao import TaobaoProvider
+        provider = TaobaoProvider('taobao', 'key', 'secret')
+        req = provider.profile_request({'access_token': 'tok'})
+        params = _query(req.url)
+        sign = params.pop('sign')
+        src = 'secret%ssecret' % ''.join(
+            '%s%s' % kv for kv in sorted(params.items()))
+        self.assertEqual(sign, _md5(src).upper())
+        self.assertEqual(params['session'], 'tok')
+
+
+class TestMailRu(unittest.TestCase):
+
+    def test_profile_request_sig(self):
+        from velruse.providers.mailru import MailRuProvider
+        provider = MailRuProvider('mailru', 'key', 'secret', None)
+        req = provider.profile_request({'access_token': 'tok'})
+        self.assertEqual(
+            _query(req.url)['sig'],
+            _md5('app_id=keymethod=users.getInfosecure=1'
+                 'session_key=toksecret'))
+
+    def test_empty_values_are_removed(self):
+        from velruse.providers.mailru import extract_normalize_mailru_data
+        profile = extract_normalize_mailru_data({'uid': '1'})
+        self.assertEqual(
+            profile['accounts'], [{'domain': 'mail.ru', 'userid': '1'}])
+        for key in ('name', 'gender', 'photos', 'addresses'):
+            self.assertFalse(key in profile, key)
+
+
+class TestExtractFacebookData(unittest.TestCase):
+
+    def test_empty_values_are_removed(self):
+        from velruse.providers.facebook import extract_fb_data
+        profile = extract_fb_data({'id': '1', 'name': ''})
+        self.assertEqual(sorted(profile), ['accounts', 'name'])
+
+
+class TestExtractVKData(unittest.TestCase):
+
+    def test_empty_values_are_removed(self):
+        from velruse.providers.vk import extract_normalize_vk_data
+        profile = extract_normalize_vk_data(
+            {'uid': 1, 'first_name': '', 'last_name': ''})
+        self.assertEqual(profile, {
+            'accounts': [{'domain': 'vk.com', 'userid': 1}]})
+
+
+class TestExtractYandexData(unittest.TestCase):
+
+    def test_empty_values_are_removed(self):
+        from velruse.providers.yandex import extract_normalize_yandex_data
+        profile = extract_normalize_yandex_data({'id': '1'})
+        self.assertEqual(sorted(profile), ['accounts', 'displayName'])
+
+
+class TestExtractOpenIDData(unittest.TestCase):
+
+    def test_empty_values_are_removed(self):
+        from velruse.providers.openid import extract_openid_data
+        identifier = 'https://openid.example.com/bob'
+        profile = extract_openid_data(identifier, {}, None)
+        self.assertEqual(profile['accounts'],
+                         [{'domain': 'openid.net', 'username': identifier}])
+        for key in ('preferredUsername', 'emails', 'displayName'):
+            self.assertFalse(key in profile, key)
@@ -0,0 +1,307 @@
+import unittest
+
+from pyramid import testing
+
+from . import DummyHTTPClient
+from . import DummyResponse
+
+
+def _oauth_params(header):
+    from velruse.compat import parse_qsl
+    assert header.startswith('OAuth ')
+    items = header[len('OAuth '):].split(', ')
+    return dict(parse_qsl('&'.join(i.replace('"', '') for i in items)))
+
+
+class TestOAuth1Signer(unittest.TestCase):
+
+    def _makeOne(self, key='key', secret='se cret'):
+        from velruse.providers.oauth1 import OAuth1Signer
+        return OAuth1Signer(key, secret)
+
+    def _expected(self, method, url, **kw):
+        try:
+            from oauthlib.oauth1 import Client
+        except ImportError:  # pragma: no cover
+            raise unittest.SkipTest('oauthlib is not installed')
+        client = Client('key', client_secret='se cret', nonce='n0nce',
+                        timestamp='1300000000', **kw)
+        headers = client.sign(url, http_method=method)[1]
+        return _oauth_params(headers['Authorization'])
+
+    def _expected_with_body(self, method, url, data, **kw):
+        try:
+            from oauthlib.oauth1 import Client
+            from oauthlib.oauth1 import SIGNATURE_TYPE_AUTH_HEADER
+        except ImportError:  # pragma: no cover
+            raise unittest.SkipTest('oauthlib is not installed')
+        from velruse.compat import urlencode
+        client = Client('key', client_secret='se cret', nonce='n0nce',
+                        timestamp='1300000000',
+                        signature_type=SIGNATURE_TYPE_AUTH_HEADER, **kw)
+        headers = client.sign(
+            url, http_method=method, body=urlencode(data),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})[1]
+        return _oauth_params(headers['Authorization'])
+
+    def _assertSignature(self, method, url, data=None, **kw):
+        signer = self._makeOne()
+        headers = signer.sign(method, url, 'tok', 'tok secret', data=data,
+                              nonce='n0nce', timestamp='1300000000')
+        params = _oauth_params(headers['Authorization'])
+        if data:
+            expected = self._expected_with_body(
+                method, url, data, resource_owner_key='tok',
+                resource_owner_secret='tok secret')
+        else:
+            expected = self._expected(method, url, resource_owner_key='tok',
+                                      resource_owner_secret='tok secret')
+        self.assertEqual(params['oauth_signature'],
+                         expected['oauth_signature'])
+
+    def test_request_token(self):
+        signer = self._makeOne()
+        headers = signer.sign('POST', 'https://example.com/request_token',
+                              nonce='n0nce', timestamp='1300000000',
+                              callback='http://example.com/cb?a=1')
+        params = _oauth_params(headers['Authorization'])
+        expected = self._expected('POST', 'https://example.com/request_token',
+                                  callback_uri='http://example.com/cb?a=1')
+        self.assertEqual(params['oauth_callback'], 'http://example.com/cb?a=1')
+        self.assertEqual(params['oauth_signature'],
+                         expected['oauth_signature'])
+
+    def test_resource_request_with_query(self):
+        signer = self._makeOne()
+        url = 'https://API.example.com:443/users/show.json?screen_name=b%20b'
+        headers = signer.sign('GET', url, 'tok', 'tok secret',
+                              nonce='n0nce', timestamp='1300000000')
+        params = _oauth_params(headers['Authorization'])
+        expected = self._expected('GET', url,
+                                  resource_owner_key='tok',
+                                  resource_owner_secret='tok secret')
+        self.assertEqual(params['oauth_token'], 'tok')
+        self.assertEqual(params['oauth_signature'],
+                         expected['oauth_signature'])
+
+    def test_body_data(self):
+        self._assertSignature('POST', 'https://example.com/statuses',
+                              data=[('status', 'hello world!'),
+                                    ('lang', 'en')])
+
+    def test_body_data_dict(self):
+        self._assertSignature('POST', 'https://example.com/statuses',
+                              data={'status': 'hello world!'})
+
+    def test_repeated_names(self):
+        self._assertSignature('GET', 'https://example.com/r?a=2&a=1&b=x')
+        self._assertSignature('POST', 'https://example.com/r?a=3',
+                              data=[('a', '2'), ('a', '1 0')])
+
+    def test_names_sharing_a_prefix(self):
+        # 'a' sorts before 'a1' although 'a=' sorts after 'a1'
+        self._assertSignature('GET', 'https://example.com/r?a1=2&a=1')
+        self._assertSignature('POST', 'https://example.com/r',
+                              data=[('v2', 'x'), ('v', 'y'), ('v-', 'z')])
+
+    def test_request(self):
+        signer = self._makeOne()
+        req = signer.request('POST', 'https://example.com/access_token',
+                             'tok', 'sec', verifier='v')
+        self.assertEqual(req.method, 'POST')
+        params = _oauth_params(req.headers['Authorization'])
+        self.assertEqual(params['oauth_verifier'], 'v')
+        self.assertEqual(params['oauth_consumer_key'], 'key')
+
+
+class TestOAuth1Provider(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('velruse.test-callback', '/callback')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, responses, **kw):
+        from velruse.providers.oauth1 import OAuth1Provider
+
+        class Provider(OAuth1Provider):
+            type = 'test'
+            request_token_url = 'https://example.com/request_token'
+            authorize_url = 'https://example.com/authorize'
+            access_token_url = 'https://example.com/access_token'
+
+            def profile_flow(self, access_token):
+                r = yield self.signed_request(
+                    'GET', 'https://example.com/me', access_token)
+                yield {'preferredUsername': r.json()['login']}
+
+        return Provider('test', 'key', 'secret',
+                        http=DummyHTTPClient(responses), **kw)
+
+    def test_login(self):
+        provider = self._makeOne([
+            DummyResponse(text='oauth_token=rt&oauth_token_secret=rs'),
+        ])
+        request = testing.DummyRequest()
+        response = provider.login(request)
+        self.assertEqual(response.location,
+                         'https://example.com/authorize?oauth_token=rt')
+        self.assertEqual(request.session['velruse.token'],
+                         {'oauth_token': 'rt', 'oauth_token_secret': 'rs'})
+        params = _oauth_params(
+            provider.http.requests[0].headers['Authorization'])
+        self.assertEqual(params['oauth_callback'],
+                         'http://example.com/callback')
+
+    def test_login_from_prefetched_pool(self):
+        provider = self._makeOne([
+            DummyResponse(text='oauth_token=rt1&oauth_token_secret=rs'),
+            DummyResponse(text='oauth_token=rt2&oauth_token_secret=rs'),
+        ], prefetch={'size': 1})
+        provider.token_pool.executor = executor = DummyExecutor()
+        response = provider.login(testing.DummyRequest())
+        self.assertTrue(response.location.endswith('oauth_token=rt1'))
+        executor.run_pending()
+        response = provider.login(testing.DummyRequest())
+        self.assertTrue(response.location.endswith('oauth_token=rt2'))
+        self.assertEqual(provider.token_pool.stats()['hits'], 1)
+
+    def test_callback(self):
+        provider = self._makeOne([
+            DummyResponse(text='oauth_token=at&oauth_token_secret=as'),
+            DummyResponse(text='{"login": "bob"}'),
+        ])
+        request = testing.DummyRequest(params={'oauth_verifier': 'v'})
+        request.session['velruse.token'] = {'oauth_token': 'rt',
+                                            'oauth_token_secret': 'rs'}
+        context = provider.callback(request)
+        self.assertEqual(context.profile, {'preferredUsername': 'bob'})
+        self.assertEqual(context.credentials,
+                         {'oauthAccessToken': 'at',
+                          'oauthAccessTokenSecret': 'as'})
+        access_req, profile_req = provider.http.requests
+        params = _oauth_params(access_req.headers['Authorization'])
+        self.assertEqual(params['oauth_token'], 'rt')
+        self.assertEqual(params['oauth_verifier'], 'v')
+        params = _oauth_params(profile_req.headers['Authorization'])
+        self.assertEqual(params['oauth_token'], 'at')
+
+    def test_callback_denied(self):
+        from velruse import AuthenticationDenied
+        provider = self._makeOne([])
+        request = testing.DummyRequest(params={'denied': 'rt'})
+        context = provider.callback(request)
+        self.assertTrue(isinstance(context, AuthenticationDenied))
+        self.assertEqual(provider.http.requests, [])
+
+    def test_callback_missing_verifier(self):
+        from velruse.exceptions import ThirdPartyFailure
+        provider = self._makeOne([])
+        request = testing.DummyRequest()
+        self.assertRaises(ThirdPartyFailure, provider.callback, request)
+
+    def test_invalid_callbacks_do_not_open_the_breaker(self):
+        from velruse.exceptions import ThirdPartyFailure
+        from velruse.exceptions import UpstreamFailure
+        from velruse.http import CircuitBreaker
+        provider = self._makeOne([DummyResponse(503)])
+        provider.http.breaker = CircuitBreaker(failures=2)
+        for i in range(3):
+            self.assertRaises(ThirdPartyFailure, provider.callback,
+                              testing.DummyRequest())
+        self.assertEqual(provider.http.breaker.state, 'closed')
+        request = testing.DummyRequest(params={'oauth_verifier': 'v'})
+        request.session['velruse.token'] = {'oauth_token': 'rt',
+                                            'oauth_token_secret': 'rs'}
+        self.assertRaises(UpstreamFailure, provider.callback, request)
+        self.assertEqual(provider.http.breaker.stats()['failures'], 1)
+
+
+class DummyExecutor(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run_pending(self):
+        calls, self.calls = self.calls, []
+        for fn, args in calls:
+            fn(*args)
+
+
+class TestRequestTokenPool(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.providers.oauth1 import RequestTokenPool
+        self.now = 1000.0
+        self.fetched = []
+
+        def fetch(callback_url):
+            token = {'oauth_token': 't%d' % len(self.fetched),
+                     'callback': callback_url}
+            self.fetched.append(token)
+            return token
+
+        self.executor = DummyExecutor()
+        return RequestTokenPool(fetch, self.executor,
+                                clock=lambda: self.now, **kw)
+
+    def test_miss_then_hits(self):
+        pool = self._makeOne(size=2)
+        self.assertEqual(pool.get('cb'), None)
+        self.executor.run_pending()
+        self.assertEqual(len(self.fetched), 2)
+        self.assertEqual(pool.get('cb')['oauth_token'], 't0')
+        self.assertEqual(pool.get('cb')['oauth_token'], 't1')
+        self.assertEqual(pool.stats(), {'hits': 2, 'misses': 1,
+                                        'expired': 0, 'errors': 0,
+                                        'available': 0})
+        # a single refill is pending for the callback URL
+        self.assertEqual(len(self.executor.calls), 1)
+        self.executor.run_pending()
+        self.assertEqual(pool.stats()['available'], 2)
+
+    def test_pools_per_callback_url(self):
+        pool = self._makeOne(size=1)
+        pool.get('a')
+        self.executor.run_pending()
+        self.assertEqual(pool.get('b'), None)
+        self.assertEqual(pool.get('a')['callback'], 'a')
+
+    def test_max_pools(self):
+        pool = self._makeOne(size=1, max_pools=2)
+        for host in ['a', 'b', 'c', 'd']:
+            self.assertEqual(pool.get(host), None)
+        self.executor.run_pending()
+        self.assertEqual(sorted(pool.pools), ['a', 'b'])
+        self.assertEqual([t['callback'] for t in self.fetched], ['a', 'b'])
+        self.assertEqual(pool.get('c'), None)
+        self.assertEqual(pool.get('a')['callback'], 'a')
+        self.assertEqual(pool.stats()['misses'], 5)
+
+    def test_expired_tokens_are_discarded(self):
+        pool = self._makeOne(size=1, ttl=60)
+        pool.get('cb')
+        self.executor.run_pending()
+        self.now += 61
+        self.assertEqual(pool.get('cb'), None)
+        self.assertEqual(pool.stats()['expired'], 1)
+
+    def test_fetch_errors(self):
+        from velruse.providers.oauth1 import RequestTokenPool
+
+        def fetch(callback_url):
+            raise ValueError
+
+        executor = DummyExecutor()
+        pool = RequestTokenPool(fetch, executor)
+        self.assertEqual(pool.get('cb'), None)
+        executor.run_pending()
+        self.assertEqual(pool.stats()['errors'], 1)
+        # the next login schedules another attempt
+        pool.get('cb')
+        self.assertEqual(len(executor.calls), 1)
@@ -0,0 +1,162 @@
+import unittest
+
+from pyramid import testing
+
+from velruse.compat import parse_qs
+
+from . import DummyHTTPClient
+from . import DummyResponse
+
+
+class TestOAuth2Provider(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('velruse.test-callback', '/callback')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, responses, **kw):
+        from velruse.providers.oauth2 import OAuth2Provider
+
+        class Provider(OAuth2Provider):
+            type = 'test'
+            authorize_url = 'https://example.com/authorize'
+            access_token_url = 'https://example.com/token'
+            profile_url = 'https://example.com/me'
+
+            def extract_profile(self, data, token_data):
+                return {'preferredUsername': data['login']}
+
+        for k, v in kw.items():
+            setattr(Provider, k, v)
+        return Provider('test', 'key', 'secret', 'email',
+                        http=DummyHTTPClient(responses))
+
+    def _callback(self, provider, **params):
+        request = testing.DummyRequest(params=params)
+        request.session['velruse.state'] = 'st'
+        return provider.callback(request)
+
+    def test_login(self):
+        provider = self._makeOne([])
+        request = testing.DummyRequest(post={})
+        response = provider.login(request)
+        url, query = response.location.split('?', 1)
+        self.assertEqual(url, 'https://example.com/authorize')
+        query = parse_qs(query)
+        self.assertEqual(query['state'], [request.session['velruse.state']])
+        self.assertEqual(query['scope'], ['email'])
+        self.assertEqual(query['response_type'], ['code'])
+        self.assertEqual(query['redirect_uri'],
+                         ['http://example.com/callback'])
+
+    def test_login_reuses_template(self):
+        provider = self._makeOne([])
+        first = provider.login(testing.DummyRequest(post={})).location
+        template = provider.authorize_template
+        self.assertEqual(template.prefix,
+                         'https://example.com/authorize?client_id=key'
+                         '&response_type=code')
+        request = testing.DummyRequest(post={'scope': 'profile'})
+        second = provider.login(request).location
+        self.assertTrue(provider.authorize_template is template)
+        self.assertNotEqual(first, second)
+        query = parse_qs(second.split('?', 1)[1])
+        self.assertEqual(query['scope'], ['profile'])
+        self.assertEqual(query['client_id'], ['key'])
+
+    def test_login_with_callback_url(self):
+        from velruse.utils import CallbackURL
+        provider = self._makeOne([])
+        provider.callback_url = CallbackURL(provider.callback_route,
+                                            'https://example.org/cb')
+        request = testing.DummyRequest(post={})
+        query = parse_qs(provider.login(request).location.split('?', 1)[1])
+        self.assertEqual(query['redirect_uri'], ['https://example.org/cb'])
+
+    def test_login_omits_unset_params(self):
+        provider = self._makeOne([], use_state=False, response_type=None)
+        provider.scope = None
+        request = testing.DummyRequest(post={})
+        query = parse_qs(provider.login(request).location.split('?', 1)[1])
+        self.assertEqual(sorted(query), ['client_id', 'redirect_uri'])
+        self.assertFalse('velruse.state' in request.session)
+
+    def test_callback(self):
+        provider = self._makeOne([
+            DummyResponse(text='{"access_token": "t", "refresh_token": "r"}'),
+            DummyResponse(text='{"login": "bob"}'),
+        ])
+        context = self._callback(provider, code='c', state='st')
+        self.assertEqual(context.profile, {'preferredUsername': 'bob'})
+        self.assertEqual(context.credentials, {'oauthAccessToken': 't',
+                                               'oauthRefreshToken': 'r'})
+        self.assertEqual(context.provider_type, 'test')
+        token_req, profile_req = provider.http.requests
+        self.assertEqual(token_req.method, 'POST')
+        self.assertEqual(token_req.data['grant_type'], 'authorization_code')
+        self.assertEqual(token_req.data['code'], 'c')
+        self.assertEqual(profile_req.url,
+                         'https://example.com/me?access_token=t')
+
+    def test_callback_lazy_profile(self):
+        from velruse import LazyProfile
+        from velruse import load_profile
+
+        def eager_profile(self, token_data):
+            return {'accounts': [{'userid': token_data['user_id']}]}
+
+        provider = self._makeOne([
+            DummyResponse(text='{"access_token": "t", "user_id": 7}'),
+            DummyResponse(text='{"login": "bob"}'),
+        ], eager_profile=eager_profile)
+        provider.lazy_profile = True
+        context = self._callback(provider, code='c', state='st')
+        profile = context.profile
+        self.assertTrue(isinstance(profile, LazyProfile))
+        self.assertEqual(profile['accounts'][0]['userid'], 7)
+        self.assertFalse(profile.loaded)
+        self.assertEqual(len(provider.http.requests), 1)
+        self.assertEqual(profile['preferredUsername'], 'bob')
+        self.assertEqual(load_profile(profile), {
+            'accounts': [{'userid': 7}], 'preferredUsername': 'bob'})
+        self.assertEqual(len(provider.http.requests), 2)
+        # the profile is retrieved once
+        self.assertEqual(dict(profile), load_profile(profile))
+        self.assertEqual(len(provider.http.requests), 2)
+
+    def test_callback_qs_token_by_get(self):
+        provider = self._makeOne([
+            DummyResponse(text='access_token=t&expires=5'),
+            DummyResponse(text='{"login": "bob"}'),
+        ], access_token_method='GET', access_token_format='qs',
+            grant_type=None)
+        context = self._callback(provider, code='c', state='st')
+        self.assertEqual(context.credentials, {'oauthAccessToken': 't'})
+        token_req = provider.http.requests[0]
+        self.assertEqual(token_req.method, 'GET')
+        query = parse_qs(token_req.url.split('?', 1)[1])
+        self.assertEqual(query['code'], ['c'])
+        self.assertFalse('grant_type' in query)
+
+    def test_callback_csrf(self):
+        from velruse.exceptions import CSRFError
+        provider = self._makeOne([])
+        self.assertRaises(CSRFError, self._callback, provider,
+                          code='c', state='bad')
+
+    def test_callback_denied(self):
+        from velruse import AuthenticationDenied
+        provider = self._makeOne([])
+        context = self._callback(provider, state='st', error='nope')
+        self.assertTrue(isinstance(context, AuthenticationDenied))
+        self.assertEqual(context.reason, 'nope')
+        self.assertEqual(provider.http.requests, [])
+
+    def test_callback_upstream_failure(self):
+        from velruse.exceptions import ThirdPartyFailure
+        provider = self._makeOne([DummyResponse(500, 'oops')])
+        self.assertRaises(ThirdPartyFailure, self._callback, provider,
+                          code='c', state='st')
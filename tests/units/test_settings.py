@@ -15,3 +15,54 @@ class TestProviderSettings(unittest.TestCase):
         self.assertRaises(KeyError, p.update, 'missing', required=True)
         p.update('missing')
         self.assertEqual(p.kwargs, {'foo': 'bar', 'baz': 'bar'})
+
+    def test_update_http(self):
+        p = self._makeOne({
+            'v.http.pool_maxsize': '20',
+            'v.http.keep_alive': 'false',
+            'v.http.unknown': 'x',
+        }, 'v.')
+        p.update_http()
+        self.assertEqual(p.kwargs, {
+            'http': {'pool_maxsize': 20, 'keep_alive': False},
+        })
+
+    def test_update_http_empty(self):
+        p = self._makeOne({}, 'v.')
+        p.update_http()
+        self.assertEqual(p.kwargs, {})
+
+    def test_update_http_breaker(self):
+        p = self._makeOne({
+            'v.http.timeout': '5',
+            'v.http.breaker.failures': '3',
+            'v.http.breaker.slow_call': '2.5',
+        }, 'v.')
+        p.update_http()
+        self.assertEqual(p.kwargs, {
+            'http': {'timeout': 5.0,
+                     'breaker': {'failures': 3, 'slow_call': 2.5}},
+        })
+
+    def test_update_http_breaker_enabled(self):
+        p = self._makeOne({'v.http.breaker': 'true'}, 'v.')
+        p.update_http()
+        self.assertEqual(p.kwargs, {'http': {'breaker': {}}})
+
+    def test_update_http_bulkhead(self):
+        p = self._makeOne({
+            'v.http.bulkhead.concurrency': '2',
+            'v.http.bulkhead.queue': '8',
+        }, 'v.')
+        p.update_http()
+        self.assertEqual(p.kwargs, {
+            'http': {'bulkhead': {'concurrency': 2, 'queue': 8}},
+        })
+
+    def test_update_prefetch(self):
+        p = self._makeOne({'v.prefetch.size': '3', 'v.prefetch.ttl': '30',
+                           'v.prefetch.max_pools': '8'},
+                          'v.')
+        p.update_prefetch()
+        self.assertEqual(p.kwargs, {'prefetch': {'size': 3, 'ttl': 30.0,
+                                                 'max_pools': 8}})
@@ -0,0 +1,122 @@
+import socket
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:  # pragma: no cover Python < 3.0
+    import SocketServer as socketserver
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    """Serve a minimal subset of the Redis protocol from a dict"""
+
+    def handle(self):
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        db = 0
+        queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            name = command[0].upper()
+            with server.lock:
+                server.commands.append(name)
+                if name == b'MULTI':
+                    queued = []
+                    reply = b'+OK\r\n'
+                elif name == b'EXEC':
+                    replies = [self.apply(db, c) for c in queued or []]
+                    queued = None
+                    reply = ('*%d\r\n' % len(replies)).encode('ascii')
+                    reply += b''.join(replies)
+                elif queued is not None:
+                    queued.append(command)
+                    reply = b'+QUEUED\r\n'
+                elif name == b'SELECT':
+                    db = int(command[1])
+                    reply = b'+OK\r\n'
+                else:
+                    reply = self.apply(db, command)
+            self.wfile.write(reply)
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for i in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def apply(self, db, command):
+        data = self.server.data.setdefault(db, {})
+        name, args = command[0].upper(), command[1:]
+        now = time.time()
+        for key, (value, expires) in list(data.items()):
+            if expires is not None and expires <= now:
+                del data[key]
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name == b'AUTH':
+            if args[0] == self.server.password:
+                return b'+OK\r\n'
+            return b'-ERR invalid password\r\n'
+        if name == b'SET':
+            expires = None
+            if len(args) == 4 and args[2].upper() == b'EX':
+                expires = now + int(args[3])
+            elif len(args) == 4 and args[2].upper() == b'PX':
+                expires = now + int(args[3]) / 1000.0
+            data[args[0]] = (args[1], expires)
+            return b'+OK\r\n'
+        if name == b'GET':
+            if args[0] not in data:
+                return b'$-1\r\n'
+            value = data[args[0]][0]
+            return ('$%d\r\n' % len(value)).encode('ascii') + value + b'\r\n'
+        if name == b'MGET':
+            reply = [('*%d\r\n' % len(args)).encode('ascii')]
+            for key in args:
+                if key in data:
+                    value = data[key][0]
+                    reply.append(('$%d\r\n' % len(value)).encode('ascii'))
+                    reply.append(value + b'\r\n')
+                else:
+                    reply.append(b'$-1\r\n')
+            return b''.join(reply)
+        if name == b'DEL':
+            count = sum(1 for k in args if data.pop(k, None) is not None)
+            return (':%d\r\n' % count).encode('ascii')
+        return b'-ERR unknown command\r\n'
+
+
+class RedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """A stand-in Redis server listening on a random local port"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        socketserver.TCPServer.__init__(self, ('127.0.0.1', 0), RedisHandler)
+        self.password = password and password.encode('utf-8')
+        self.lock = threading.Lock()
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,72 @@
+import unittest
+
+
+class TestMemoryStore(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from velruse.store.memory import MemoryStore
+        self.now = 1000.0
+        return MemoryStore(clock=lambda: self.now, **kw)
+
+    def test_store_and_retrieve(self):
+        store = self._makeOne()
+        store.store('a', {'x': 1}, expires=300)
+        self.assertEqual(store.retrieve('a'), {'x': 1})
+        self.assertEqual(store.retrieve('a'), {'x': 1})
+        self.assertRaises(KeyError, store.retrieve, 'b')
+
+    def test_consume(self):
+        store = self._makeOne()
+        store.store('a', 1, expires=300)
+        self.assertEqual(store.consume('a'), 1)
+        self.assertRaises(KeyError, store.consume, 'a')
+        self.assertEqual(store.stats()['size'], 0)
+
+    def test_retrieve_and_consume_many(self):
+        store = self._makeOne()
+        store.store('a', 1, expires=300)
+        store.store('b', 2)
+        self.assertEqual(store.retrieve_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.assertEqual(store.consume_many(['a', 'c']), {'a': 1})
+        self.assertEqual(store.retrieve_many(['a', 'b']), {'b': 2})
+
+    def test_expiration(self):
+        store = self._makeOne()
+        store.store('a', 1, expires=10)
+        store.store('b', 2, expires=20)
+        store.store('c', 3)
+        self.now += 15
+        self.assertRaises(KeyError, store.retrieve, 'a')
+        self.assertEqual(store.retrieve('b'), 2)
+        self.now += 10
+        store.purge_expired()
+        self.assertEqual(store.stats()['expirations'], 2)
+        self.assertEqual(store.retrieve('c'), 3)
+
+    def test_replaced_key_keeps_new_expiry(self):
+        store = self._makeOne()
+        store.store('a', 1, expires=10)
+        store.store('a', 2, expires=100)
+        self.now += 50
+        self.assertEqual(store.retrieve('a'), 2)
+        self.assertEqual(store.stats()['expirations'], 0)
+
+    def test_lru_eviction(self):
+        store = self._makeOne(capacity=2)
+        store.store('a', 1)
+        store.store('b', 2)
+        store.retrieve('a')
+        store.store('c', 3)
+        self.assertRaises(KeyError, store.retrieve, 'b')
+        self.assertEqual(store.retrieve('a'), 1)
+        self.assertEqual(store.retrieve('c'), 3)
+        self.assertEqual(store.stats(), {'size': 2, 'capacity': 2,
+                                         'evictions': 1, 'expirations': 0})
+
+    def test_expiry_heap_is_compacted(self):
+        store = self._makeOne()
+        for i in range(1000):
+            store.store(i, i, expires=300)
+            store.consume(i)
+        self.assertTrue(len(store.expiry) < 200)
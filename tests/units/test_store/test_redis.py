@@ -0,0 +1,175 @@
+import threading
+import unittest
+
+from . import RedisServer
+
+
+class TestRedisStore(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RedisServer(password='pw')
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _makeOne(self, **kw):
+        from velruse.store.redis import RedisStore
+        kw.setdefault('password', 'pw')
+        store = RedisStore(host='127.0.0.1', port=self.server.port, **kw)
+        self.addCleanup(store.close)
+        return store
+
+    def test_store_and_retrieve(self):
+        store = self._makeOne(db=2)
+        value = {'profile': {'displayName': u'B\xf6b'}, 'n': [1, 2]}
+        store.store('tok', value, expires=300)
+        self.assertEqual(store.retrieve('tok'), value)
+        self.assertEqual(store.retrieve('tok'), value)
+        self.assertTrue(b'velruse.tok' in self.server.data[2])
+        self.assertRaises(KeyError, store.retrieve, 'missing')
+
+    def test_expires(self):
+        import datetime
+        import time
+        store = self._makeOne()
+        store.store('tok', 1, expires=datetime.timedelta(seconds=0.05))
+        self.assertEqual(store.retrieve('tok'), 1)
+        time.sleep(0.1)
+        self.assertRaises(KeyError, store.retrieve, 'tok')
+
+    def test_consume(self):
+        store = self._makeOne()
+        store.store('tok', {'a': 1})
+        del self.server.commands[:]
+        self.assertEqual(store.consume('tok'), {'a': 1})
+        self.assertEqual(self.server.commands,
+                         [b'MULTI', b'GET', b'DEL', b'EXEC'])
+        self.assertRaises(KeyError, store.consume, 'tok')
+        self.assertRaises(KeyError, store.retrieve, 'tok')
+
+    def test_retrieve_many(self):
+        store = self._makeOne()
+        store.store('a', {'x': 1})
+        store.store('b', 2)
+        del self.server.commands[:]
+        self.assertEqual(store.retrieve_many(['a', 'missing', 'b']),
+                         {'a': {'x': 1}, 'b': 2})
+        self.assertEqual(self.server.commands, [b'MGET'])
+        self.assertEqual(store.retrieve_many([]), {})
+
+    def test_consume_many(self):
+        store = self._makeOne()
+        store.store('a', 1)
+        store.store('b', 2)
+        del self.server.commands[:]
+        self.assertEqual(store.consume_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.assertEqual(self.server.commands,
+                         [b'MULTI', b'MGET', b'DEL', b'EXEC'])
+        self.assertEqual(store.consume_many(['a', 'b']), {})
+
+    def test_consume_is_one_round_trip(self):
+        from velruse.store.redis import Connection
+        store = self._makeOne()
+        store.store('tok', 1)
+        sent = []
+        orig_send = Connection.send
+
+        def send(conn, commands):
+            sent.append(len(commands))
+            return orig_send(conn, commands)
+
+        Connection.send = send
+        try:
+            store.consume('tok')
+        finally:
+            Connection.send = orig_send
+        self.assertEqual(sent, [4])
+
+    def test_delete(self):
+        store = self._makeOne()
+        store.store('tok', 1)
+        store.delete('tok')
+        store.delete('tok')
+        self.assertRaises(KeyError, store.retrieve, 'tok')
+
+    def test_connections_are_reused(self):
+        store = self._makeOne()
+        for i in range(5):
+            store.store('tok%d' % i, i)
+            store.consume('tok%d' % i)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_pool_is_bounded(self):
+        store = self._makeOne(max_connections=2)
+        errors = []
+
+        def worker(i):
+            try:
+                for j in range(20):
+                    store.store('k%d-%d' % (i, j), j)
+                    self.assertEqual(store.consume('k%d-%d' % (i, j)), j)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(self.server.connections <= 2)
+
+    def test_connection_discarded_on_any_error(self):
+        class Interrupt(BaseException):
+            pass
+
+        class Bad(object):
+            def __str__(self):
+                raise Interrupt
+
+        store = self._makeOne(max_connections=1)
+        store.store('tok', 1)
+        self.assertRaises(Interrupt, store.execute, 'GET', Bad())
+        self.assertEqual(store.pool.in_use, 0)
+        self.assertEqual(store.retrieve('tok'), 1)
+
+    def test_error_reply(self):
+        from velruse.store.redis import RedisError
+        self.assertRaises(RedisError, self._makeOne(password='bad').retrieve,
+                          'tok')
+        store = self._makeOne()
+        self.assertRaises(RedisError, store.execute, 'BOGUS')
+        # the connection stays usable after an error reply
+        store.store('tok', 1)
+        self.assertEqual(store.retrieve('tok'), 1)
+
+
+class TestCreateStoreFromSettings(unittest.TestCase):
+
+    def _callFUT(self, settings):
+        from velruse.store import create_store_from_settings
+        return create_store_from_settings(settings, prefix='store.')
+
+    def test_velruse_backend(self):
+        from velruse.store.redis import RedisStore
+        store = self._callFUT({'store.store': 'redis',
+                               'store.port': '6380',
+                               'store.key_prefix': 'x.'})
+        self.assertTrue(isinstance(store, RedisStore))
+        self.assertEqual(store.pool.connection_kw['port'], 6380)
+        self.assertEqual(store.key_prefix, 'x.')
+
+    def test_memory_backend(self):
+        from velruse.store.memory import MemoryStore
+        store = self._callFUT({'store.store': 'memory',
+                               'store.capacity': '5'})
+        self.assertTrue(isinstance(store, MemoryStore))
+        self.assertEqual(store.capacity, 5)
+
+    def test_anykeystore_backend(self):
+        from anykeystore.exceptions import ConfigurationError
+        self.assertRaises(ConfigurationError, self._callFUT,
+                          {'store.store': 'unknown'})
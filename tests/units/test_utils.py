@@ -0,0 +1,91 @@
+import unittest
+
+from pyramid import testing
+
+
+class TestCallbackURL(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('callback', '/login/test/callback')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, url=None):
+        from velruse.utils import CallbackURL
+        return CallbackURL('callback', url)
+
+    def _makeRequest(self, url):
+        from pyramid.request import Request
+        request = Request.blank(url)
+        request.registry = self.config.registry
+        return request
+
+    def test_cached_per_application_url(self):
+        callback_url = self._makeOne()
+        request = self._makeRequest('http://example.com/login/test')
+        self.assertEqual(callback_url(request),
+                         'http://example.com/login/test/callback')
+        self.assertEqual(list(callback_url.urls),
+                         ['http://example.com'])
+
+        request = self._makeRequest('https://example.org:8443/x')
+        request.script_name = '/app'
+        self.assertEqual(callback_url(request),
+                         'https://example.org:8443/app/login/test/callback')
+        self.assertEqual(len(callback_url.urls), 2)
+
+        callback_url.urls['http://example.com'] = 'cached'
+        request = self._makeRequest('http://example.com/other')
+        self.assertEqual(callback_url(request), 'cached')
+
+    def test_cache_is_bounded(self):
+        callback_url = self._makeOne()
+        callback_url.max_entries = 2
+        for i in range(4):
+            request = self._makeRequest('http://host%d.example.com/' % i)
+            self.assertEqual(
+                callback_url(request),
+                'http://host%d.example.com/login/test/callback' % i)
+        self.assertEqual(len(callback_url.urls), 2)
+
+    def test_fixed_url(self):
+        callback_url = self._makeOne('https://example.com/cb')
+        request = self._makeRequest('http://localhost/')
+        self.assertEqual(callback_url(request), 'https://example.com/cb')
+        self.assertEqual(callback_url.urls, {})
+
+
+class TestURLTemplate(unittest.TestCase):
+
+    def _makeOne(self, params=None, volatile=()):
+        from velruse.utils import URLTemplate
+        return URLTemplate('https://example.com/auth', params, volatile)
+
+    def test_static_params(self):
+        template = self._makeOne({'b': 'x y', 'a': '1', 'c': None})
+        self.assertEqual(template(), 'https://example.com/auth?a=1&b=x+y')
+        self.assertEqual(template(d='/&', e=None),
+                         'https://example.com/auth?a=1&b=x+y&d=%2F%26')
+
+    def test_no_static_params(self):
+        template = self._makeOne()
+        self.assertEqual(template(d='1'), 'https://example.com/auth?d=1')
+
+    def test_encoded_values_cached(self):
+        template = self._makeOne({'a': '1'}, volatile=['state'])
+        template(uri='http://x/cb', state='s1')
+        self.assertEqual(template.encoded,
+                         {('uri', 'http://x/cb'): 'uri=http%3A%2F%2Fx%2Fcb'})
+        template.encoded[('uri', 'http://x/cb')] = 'uri=cached'
+        self.assertEqual(template(uri='http://x/cb'),
+                         'https://example.com/auth?a=1&uri=cached')
+
+    def test_cache_is_bounded(self):
+        template = self._makeOne()
+        template.max_entries = 2
+        for i in range(4):
+            self.assertEqual(template(a=str(i)),
+                             'https://example.com/auth?a=%d' % i)
+        self.assertEqual(len(template.encoded), 2)
@@ -1,16 +1,104 @@
+import threading
+
+from velruse.compat import Mapping
+
+
 class AuthenticationComplete(object):
-    """ An AuthenticationComplete context object"""
+    """ An AuthenticationComplete context object
+
+    ``profile`` is a :class:`LazyProfile` for the providers configured with
+    ``lazy_profile``. ``missing`` lists the optional parts of the profile
+    which could not be retrieved in time, see
+    :class:`velruse.http.OptionalRequest`."""
 
     def __init__(self,
                  profile=None,
                  credentials=None,
                  provider_name=None,
-                 provider_type=None):
+                 provider_type=None,
+                 missing=None):
         """Create an AuthenticationComplete object with user data"""
         self.profile = profile
         self.credentials = credentials
         self.provider_name = provider_name
         self.provider_type = provider_type
+        self.missing = missing or []
+
+
+class LazyProfile(Mapping):
+    """ A profile retrieved from the provider on first access.
+
+    ``flow`` is called without arguments to create the flow retrieving the
+    profile, which is then run by the ``http`` client. The fields of
+    ``eager``, known without contacting the provider, are read without
+    retrieving the profile; they are replaced by those of the retrieved
+    profile, if any, once it is loaded. ``missing`` then lists the
+    optional parts of the profile which could not be retrieved in time."""
+
+    def __init__(self, flow, http, eager=None):
+        self.flow = flow
+        self.http = http
+        self.eager = eager or {}
+        self.profile = None
+        self.missing = []
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """Whether the profile was retrieved"""
+        return self.profile is not None
+
+    def load_flow(self):
+        """The flow retrieving the profile, its result is an
+        :class:`AuthenticationComplete` listing the ``missing`` parts"""
+        profile = yield self.flow()
+        yield AuthenticationComplete(profile=profile)
+
+    def resolve(self, result):
+        """Complete the eager fields with the profile of ``result``, the
+        result of :meth:`load_flow`"""
+        full = dict(self.eager)
+        full.update(result.profile or {})
+        self.missing = result.missing
+        self.profile = full
+        return full
+
+    def load(self):
+        """Retrieve the profile, once, and return it as a dict"""
+        if self.profile is None:
+            with self.lock:
+                if self.profile is None:
+                    self.resolve(self.http.run(self.load_flow()))
+        return self.profile
+
+    def __getitem__(self, key):
+        if self.profile is None and key in self.eager:
+            return self.eager[key]
+        return self.load()[key]
+
+    def __contains__(self, key):
+        if self.profile is None and key in self.eager:
+            return True
+        return key in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        if self.profile is None:
+            return '<LazyProfile %r (not loaded)>' % (self.eager,)
+        return '<LazyProfile %r>' % (self.profile,)
+
+
+def load_profile(profile):
+    """ Return ``profile`` as a dict, retrieving it if it is a
+    :class:`LazyProfile`."""
+    if isinstance(profile, LazyProfile):
+        return profile.load()
+    return profile
 
 
 class AuthenticationDenied(object):
@@ -32,3 +120,27 @@ def login_url(request, name):
     registry = request.registry
     provider = registry.velruse_providers[name]
     return request.route_url(provider.login_route)
+
+
+def circuit_breakers(registry):
+    """ Return the state of the circuit breakers of the providers, for
+    monitoring, as a dict mapping the name of each provider with a breaker
+    to :meth:`velruse.http.CircuitBreaker.stats`."""
+    breakers = {}
+    for name, provider in getattr(registry, 'velruse_providers', {}).items():
+        breaker = getattr(getattr(provider, 'http', None), 'breaker', None)
+        if breaker is not None:
+            breakers[name] = breaker.stats()
+    return breakers
+
+
+def bulkheads(registry):
+    """ Return the state of the bulkheads of the providers, for monitoring,
+    as a dict mapping the name of each provider with a bulkhead to
+    :meth:`velruse.http.Bulkhead.stats`."""
+    result = {}
+    for name, provider in getattr(registry, 'velruse_providers', {}).items():
+        bulkhead = getattr(getattr(provider, 'http', None), 'bulkhead', None)
+        if bulkhead is not None:
+            result[name] = bulkhead.stats()
+    return result
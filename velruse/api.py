@@ -2,14 +2,20 @@
 from velruse import (
     AuthenticationComplete,
     AuthenticationDenied,
+    LazyProfile,
     login_url,
 )  # bw compat
+from velruse.http import make_bulkhead
 
 
 def register_provider(config, name, provider):
     """
     Add a provider to the registry. This will also provide conflict
     detection by detecting duplicate provider names.
+
+    When the registry has ``velruse_bulkheads``, a dict of the arguments
+    of :class:`velruse.http.Bulkhead`, the provider is given a bulkhead of
+    its own unless it was configured with one.
     """
 
     def register():
@@ -21,4 +27,10 @@ def register_provider(config, name, provider):
 
         registry.velruse_providers[name] = provider
 
+        bulkheads = getattr(registry, 'velruse_bulkheads', None)
+        http = getattr(provider, 'http', None)
+        if (bulkheads is not None and http is not None and
+                getattr(http, 'bulkhead', False) is None):
+            http.bulkhead = make_bulkhead(bulkheads, name)
+
     config.action(('velruse-provider', name), register)
@@ -1,52 +1,118 @@
 import os
-
-from anykeystore import create_store_from_settings
+import sys
 
 from pyramid.config import Configurator
 from pyramid.exceptions import ConfigurationError
 from pyramid.response import Response
-
+from pyramid.settings import asbool
+
+from velruse import LazyProfile
+from velruse import load_profile
+from velruse.app.discovery import get_provider_index
+from velruse.app.middleware import dispatch_result
+from velruse.app.utils import RedirectForm
+from velruse.app.utils import RedirectLocation
 from velruse.app.utils import generate_token
 from velruse.app.utils import redirect_form
+from velruse.settings import BULKHEAD_SETTINGS
+from velruse.settings import ProviderSettings
+from velruse.store import consume
+from velruse.store import consume_many
+from velruse.store import create_store_from_settings
+from velruse.store import retrieve_many
 
 
 log = __import__('logging').getLogger(__name__)
 
 
-def auth_complete_view(context, request):
-    endpoint = request.registry.settings.get('endpoint')
+def issue_token(request, result_data):
+    """Return the token under which ``result_data`` is handed to the
+    endpoint.
+
+    The data is sealed into the token itself when sealed tokens are
+    enabled, otherwise it is stored under a random token.
+    """
+    tokens = getattr(request.registry, 'velruse_tokens', None)
+    if tokens is not None:
+        return tokens.seal(result_data)
     token = generate_token()
     storage = request.registry.velruse_store
+    storage.store(token, result_data, expires=300)
+    return token
+
+
+def deliver_result(request, result_data):
+    """Hand ``result_data`` over to the endpoint.
+
+    When running as :class:`~velruse.app.middleware.VelruseMiddleware`
+    the endpoint of the wrapped app is called directly, otherwise the
+    browser is sent to it with a token.
+    """
+    app = getattr(request.registry, 'velruse_downstream', None)
+    if app is not None:
+        return dispatch_result(request, app, result_data)
+    token = issue_token(request, result_data)
+    handoff = getattr(request.registry, 'velruse_handoff', None)
+    if handoff is None:
+        endpoint = request.registry.settings.get('endpoint')
+        return Response(body=redirect_form(endpoint, token))
+    return handoff.response(token)
+
+
+def auth_complete_view(context, request):
     result_data = {
         'provider_type': context.provider_type,
         'provider_name': context.provider_name,
-        'profile': context.profile,
+        'profile': load_profile(context.profile),
         'credentials': context.credentials,
     }
-    storage.store(token, result_data, expires=300)
-    form = redirect_form(endpoint, token)
-    return Response(body=form)
+    missing = list(context.missing)
+    if isinstance(context.profile, LazyProfile):
+        missing.extend(context.profile.missing)
+    if missing:
+        result_data['missing'] = missing
+    return deliver_result(request, result_data)
 
 
 def auth_denied_view(context, request):
-    endpoint = request.registry.settings.get('endpoint')
-    token = generate_token()
-    storage = request.registry.velruse_store
     error_dict = {
         'provider_type': context.provider_type,
         'provider_name': context.provider_name,
         'error': context.reason,
     }
-    storage.store(token, error_dict, expires=300)
-    form = redirect_form(endpoint, token)
-    return Response(body=form)
+    return deliver_result(request, error_dict)
+
+
+def upstream_failure_view(context, request):
+    """Deny the login of a provider which is unavailable or too slow"""
+    route = request.matched_route
+    provider_name = provider_type = None
+    providers = getattr(request.registry, 'velruse_providers', {})
+    for provider in providers.values():
+        if route is not None and route.name in (provider.login_route,
+                                                provider.callback_route):
+            provider_name, provider_type = provider.name, provider.type
+            break
+    error_dict = {
+        'provider_type': provider_type,
+        'provider_name': provider_name,
+        'error': str(context),
+    }
+    return deliver_result(request, error_dict)
 
 
 def auth_info_view(request):
     # TODO: insecure URL, must be protected behind a firewall
+    if 'tokens' in request.GET:
+        return auth_info_batch_view(request)
     storage = request.registry.velruse_store
+    tokens = getattr(request.registry, 'velruse_tokens', None)
     token = request.GET.get('token')
     try:
+        if tokens is not None:
+            return tokens.unseal(token)
+        if request.registry.velruse_consume:
+            return consume(storage, token)
         return storage.retrieve(token)
     except KeyError:
         log.info('auth_info requested invalid token "%s"')
@@ -54,6 +120,26 @@ def auth_info_view(request):
         return None
 
 
+def auth_info_batch_view(request):
+    """Return a map of the ``tokens`` of the request to their results,
+    ``None`` for the invalid ones"""
+    storage = request.registry.velruse_store
+    tokens = getattr(request.registry, 'velruse_tokens', None)
+    keys = request.GET.getall('tokens')
+    if tokens is not None:
+        results = {}
+        for key in keys:
+            try:
+                results[key] = tokens.unseal(key)
+            except KeyError:
+                pass
+    elif request.registry.velruse_consume:
+        results = consume_many(storage, keys)
+    else:
+        results = retrieve_many(storage, keys)
+    return dict((key, results.get(key)) for key in keys)
+
+
 def default_setup(config):
     """Configure Velruse's session factory and backend storage.
 
@@ -68,9 +154,13 @@ def default_setup(config):
     ``session.cookie_name`` is the name of the cookie stored on a client's
     browser and will default to 'velruse.session'.
 
-    ``store.*`` settings are used by the `anykeystore` library to construct
-    a storage backend for user credentials. If no storage settings are
-    specified then an in-memory storage backend will be used.
+    ``store.*`` settings are used to construct a storage backend for user
+    credentials, see :func:`velruse.store.create_store_from_settings`.
+    ``store = redis`` selects the pipelined
+    :class:`velruse.store.redis.RedisStore` and ``store = memory`` the
+    bounded :class:`velruse.store.memory.MemoryStore`, other names are
+    looked up in the `anykeystore` library. If no storage settings are
+    specified then the in-memory store will be used.
 
     """
     from pyramid.session import UnencryptedCookieSessionFactoryConfig
@@ -105,7 +195,8 @@ def register_velruse_store(config, storage):
     This function is registered with Pyramid and can be used via
     ``config.register_velruse_store(storage)``.
 
-    ``storage`` should be an instance of an `anykeystore` backend.
+    ``storage`` should implement :class:`velruse.store.ResultStore`, the
+    `anykeystore` backends are also supported.
 
     """
     config.registry.velruse_store = storage
@@ -121,11 +212,14 @@ settings_adapter = {
     'lastfm': 'add_lastfm_login_from_settings',
     'linkedin': 'add_linkedin_login_from_settings',
     'live': 'add_live_login_from_settings',
+    'mailru': 'add_mailru_login_from_settings',
     'qq': 'add_qq_login_from_settings',
     'renren': 'add_renren_login_from_settings',
     'taobao': 'add_taobao_login_from_settings',
     'twitter': 'add_twitter_login_from_settings',
+    'vk': 'add_vk_login_from_settings',
     'weibo': 'add_weibo_login_from_settings',
+    'yandex': 'add_yandex_login_from_settings',
 }
 
 
@@ -143,12 +237,26 @@ def load_provider(config, provider):
     impl = settings.get('provider.%s.impl' % provider) or provider
 
     login_cfg = settings_adapter.get(impl)
-    if login_cfg is None:
+    if login_cfg is not None:
+        # only the modules of the configured providers are imported
+        config.include('velruse.providers.%s' % impl)
+        loader = getattr(config, login_cfg)
+        loader(prefix='provider.%s.' % provider)
+        return
+
+    # look for a provider installed separately
+    index = get_provider_index(settings.get('providers.index'))
+    spec = index.get(impl)
+    if spec is None:
         raise ConfigurationError(
             'could not find configuration method for provider %s'
             '' % provider)
-    loader = getattr(config, login_cfg)
-    loader(prefix='provider.%s.' % provider)
+    loader = config.maybe_dotted(spec)
+    module = sys.modules[loader.__module__]
+    if hasattr(module, 'includeme'):
+        # the directives used by the loader
+        config.include(module)
+    loader(config, prefix='provider.%s.' % provider)
 
 
 def includeme(config):
@@ -161,19 +269,50 @@ def includeme(config):
     if setup:
         config.include(setup)
 
-    # include supported providers
-    for provider in settings_adapter:
-        config.include('velruse.providers.%s' % provider)
+    # every provider may run its upstream calls on threads of its own
+    bulkheads = ProviderSettings(settings).collect_group(
+        'bulkheads', BULKHEAD_SETTINGS)
+    if bulkheads or asbool(settings.get('bulkheads')):
+        config.registry.velruse_bulkheads = bulkheads
 
-    # configure requested providers
+    # include and configure requested providers
     for provider in find_providers(settings):
         load_provider(config, provider)
 
+    # results are removed from the store once read unless disabled
+    config.registry.velruse_consume = asbool(
+        settings.get('auth_info.consume', True))
+
+    # results may be sealed into the tokens instead of being stored
+    tokens = settings.get('tokens', 'store')
+    if tokens == 'sealed':
+        # imported on demand as it loads the cryptography package
+        from velruse.app.tokens import sealed_tokens_from_settings
+        config.registry.velruse_tokens = sealed_tokens_from_settings(
+            settings, prefix='tokens.')
+    elif tokens == 'store':
+        config.registry.velruse_tokens = None
+    else:
+        raise ConfigurationError(
+            'invalid value "%s" for the "tokens" setting' % tokens)
+
     # check for required settings
     if not settings.get('endpoint'):
         raise ConfigurationError(
             'missing required setting "endpoint"')
 
+    # the completed logins are handed to the endpoint with a POST form
+    # unless it accepts GET requests
+    method = settings.get('endpoint.method', 'POST').upper()
+    if method == 'POST':
+        config.registry.velruse_handoff = RedirectForm(settings['endpoint'])
+    elif method == 'GET':
+        config.registry.velruse_handoff = RedirectLocation(
+            settings['endpoint'])
+    else:
+        raise ConfigurationError(
+            'invalid value "%s" for the "endpoint.method" setting' % method)
+
     # add views
     config.add_view(
         auth_complete_view,
@@ -181,6 +320,20 @@ def includeme(config):
     config.add_view(
         auth_denied_view,
         context='velruse.AuthenticationDenied')
+
+    # the logins of the providers which are unavailable, because their
+    # circuit breaker is open, or ran out of time are denied unless
+    # the setup handles the errors with its own views
+    upstream_failure = settings.get('upstream_failure', 'denied')
+    if upstream_failure == 'denied':
+        for context in ('velruse.exceptions.ProviderUnavailable',
+                        'velruse.exceptions.DeadlineExceeded'):
+            config.add_view(upstream_failure_view, context=context)
+    elif upstream_failure != 'error':
+        raise ConfigurationError(
+            'invalid value "%s" for the "upstream_failure" setting'
+            '' % upstream_failure)
+
     config.add_view(
         auth_info_view,
         name='auth_info',
@@ -0,0 +1,364 @@
+"""ASGI entry point for the standalone app.
+
+Provider callbacks written as flows (see
+:meth:`velruse.http.HTTPClient.run`) are driven natively on the event loop
+using `httpx`_, so an in-flight login does not hold a thread while it waits
+on the upstream servers. Every other request, including the login views
+which do not talk to the upstream servers, is handled by the regular WSGI
+app in a worker thread.
+
+The callbacks run on the event loop bypass the Pyramid router:
+
+- tweens are not called, and neither are the ``NewRequest`` and
+  ``ContextFound`` subscribers;
+- the context is the result of the provider's flow rather than of the
+  route factory;
+- the view or exception view of the context is rendered and the response
+  callbacks of the request, such as the one saving the session, are
+  processed directly, relying on Pyramid's private
+  ``Request._process_response_callbacks``.
+
+Applications depending on any of these for the callback routes should
+serve :func:`velruse.app.make_app` over WSGI instead.
+
+This module requires Python 3.7+ and the ``httpx`` package.
+
+.. _httpx: https://www.python-httpx.org/
+
+"""
+import asyncio
+from io import BytesIO
+import sys
+import time
+
+from pyramid.config import Configurator
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IRequestFactory
+from pyramid.interfaces import IRoutesMapper
+from pyramid.request import Request
+from pyramid.threadlocal import manager
+from pyramid.view import render_view_to_response
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+from velruse import LazyProfile
+from velruse.exceptions import DeadlineExceeded
+from velruse.http import FlowRunner
+from velruse.http import OptionalRequest
+from velruse.http import UPSTREAM_ERRORS
+from velruse.http import limit_timeouts
+from velruse.http import make_http_client
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+class AsyncHTTPClient(object):
+    """The asynchronous counterpart of :class:`velruse.http.HTTPClient`.
+
+    ``http`` is the provider's blocking client, whose pool settings,
+    timeouts and circuit breaker are reused. ``transport`` is passed
+    through to :class:`httpx.AsyncClient`.
+
+    """
+    def __init__(self, http=None, transport=None):
+        if httpx is None:  # pragma: no cover
+            raise ConfigurationError(
+                'the "httpx" package is required to run velruse on ASGI')
+        self.http = http = make_http_client(http)
+        keepalive = http.pool_maxsize if http.keep_alive else 0
+        limits = httpx.Limits(max_keepalive_connections=keepalive)
+        # without a timeout the requests are not limited, as with the
+        # blocking client, rather than by the default of httpx
+        self.client = httpx.AsyncClient(limits=limits, transport=transport,
+                                        timeout=http.timeout)
+
+    async def send(self, req):
+        """Perform an :class:`~velruse.http.HTTPRequest`."""
+        if req.auth is not None:
+            raise TypeError('requests auth objects are not supported by '
+                            'the asynchronous client')
+        timeout = req.timeout if req.timeout is not None else self.http.timeout
+        return await self.client.request(req.method, req.url,
+                                         data=req.data,
+                                         params=req.params,
+                                         headers=req.headers,
+                                         timeout=timeout)
+
+    async def run(self, flow):
+        """Drive a provider flow to completion and return its result.
+
+        This follows the same protocol as
+        :meth:`velruse.http.HTTPClient.run`, including its time limits and
+        circuit breaker. The flows run on the event loop, so a bulkhead
+        only bounds the number of flows in progress.
+        """
+        bulkhead = self.http.bulkhead
+        if bulkhead is None:
+            return await self._guarded(flow)
+        bulkhead.acquire()
+        try:
+            return await self._guarded(flow)
+        finally:
+            bulkhead.release()
+
+    async def _guarded(self, flow):
+        breaker = self.http.breaker
+        if breaker is None:
+            return await self._run(flow)
+        breaker.acquire()
+        start = time.time()
+        try:
+            result = await self._run(flow)
+        except UPSTREAM_ERRORS + (httpx.HTTPError,):
+            breaker.failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.success(time.time() - start)
+        return result
+
+    async def _optional(self, req, runner):
+        wait_for = req.limit(self.http.optional_budget)
+        try:
+            return await asyncio.wait_for(self.send(req), wait_for)
+        except Exception:
+            log.info('skipping the optional %s of %s', req.part, req.url,
+                     exc_info=True)
+            return runner.skip(req)
+
+    def _perform(self, req, runner):
+        if isinstance(req, OptionalRequest):
+            return self._optional(req, runner)
+        return self.send(req)
+
+    async def _within(self, call, deadline):
+        try:
+            return await asyncio.wait_for(call, deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded('the deadline of the upstream requests '
+                                   'expired')
+
+    async def _run(self, flow):
+        runner = FlowRunner(flow)
+        deadline = self.http.new_deadline()
+        try:
+            item = runner.start()
+            while not runner.done:
+                try:
+                    if deadline is not None:
+                        limit_timeouts(item, deadline, self.http.timeout)
+                except DeadlineExceeded:
+                    if isinstance(item, OptionalRequest):
+                        item = runner.send(runner.skip(item))
+                        continue
+                    item = runner.throw(sys.exc_info())
+                    continue
+                try:
+                    call = self._perform(item, runner)
+                    if deadline is not None:
+                        call = self._within(call, deadline)
+                    response = await call
+                except Exception:
+                    item = runner.throw(sys.exc_info())
+                else:
+                    item = runner.send(response)
+            return runner.result
+        finally:
+            runner.close()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ASGIApp(object):
+    """Serve a configured velruse Pyramid app over ASGI.
+
+    ``wsgi_app`` is the Pyramid router created from ``registry``. Provider
+    callbacks exposing a ``callback_flow`` are run on the event loop while
+    everything else is delegated to ``wsgi_app`` in a worker thread.
+
+    """
+    def __init__(self, wsgi_app, registry, transport=None):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+        self.transport = transport
+        self.mapper = registry.queryUtility(IRoutesMapper)
+        self.request_factory = registry.queryUtility(IRequestFactory,
+                                                     default=Request)
+        self.clients = {}
+        self.callbacks = {}
+        providers = getattr(registry, 'velruse_providers', {})
+        for provider in providers.values():
+            if hasattr(provider, 'callback_flow'):
+                self.callbacks[provider.callback_route] = provider
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope "%s"' % scope['type'])
+
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        environ = make_environ(scope, b''.join(body))
+
+        loop = asyncio.get_running_loop()
+        request = self.request_factory(environ)
+        request.registry = self.registry
+        info = self.mapper(request) if self.mapper is not None else None
+        route = info and info['route']
+        provider = route is not None and self.callbacks.get(route.name)
+        if provider:
+            request.matchdict = info['match']
+            request.matched_route = route
+            client = self.get_client(provider)
+            try:
+                context = await client.run(provider.callback_flow(request))
+                profile = getattr(context, 'profile', None)
+                if isinstance(profile, LazyProfile) and not profile.loaded:
+                    # the app hands over the whole profile, retrieve it on
+                    # the event loop rather than in the view
+                    profile.resolve(await client.run(profile.load_flow()))
+            except Exception:
+                exc_info = sys.exc_info()
+                response = await loop.run_in_executor(
+                    None, self.render_exception, request, exc_info)
+            else:
+                response = await loop.run_in_executor(
+                    None, self.render, context, request)
+            status = response.status_int
+            headers = response.headerlist
+            body = response.body
+        else:
+            status, headers, body = await loop.run_in_executor(
+                None, self.call_wsgi, environ)
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_client(self, provider):
+        client = self.clients.get(provider.name)
+        if client is None:
+            client = AsyncHTTPClient(provider.http, transport=self.transport)
+            self.clients[provider.name] = client
+        return client
+
+    async def aclose(self):
+        clients, self.clients = self.clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def render(self, context, request):
+        """Render the view registered for the callback's context."""
+        manager.push({'registry': self.registry, 'request': request})
+        try:
+            response = render_view_to_response(context, request)
+            if response is None:
+                raise ValueError('no view registered for %r' % context)
+            request._process_response_callbacks(response)
+            return response
+        finally:
+            manager.pop()
+
+    def render_exception(self, request, exc_info):
+        """Render the exception view for an error raised by a callback."""
+        manager.push({'registry': self.registry, 'request': request})
+        try:
+            response = request.invoke_exception_view(exc_info, reraise=True)
+            request._process_response_callbacks(response)
+            return response
+        finally:
+            manager.pop()
+
+    def call_wsgi(self, environ):
+        """Call the WSGI app and return its status, headers and body."""
+        result = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            result['status'] = int(status.split(' ', 1)[0])
+            result['headers'] = headers
+            return chunks.append
+
+        app_iter = self.wsgi_app(environ, start_response)
+        try:
+            chunks.extend(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        return result['status'], result['headers'], b''.join(chunks)
+
+
+def make_environ(scope, body):
+    """Build a WSGI environ from an ASGI HTTP scope."""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+def make_app(global_conf, **settings):
+    """Construct a complete ASGI app.
+
+    This accepts the same settings as :func:`velruse.app.make_app`.
+    """
+    config = Configurator(settings=settings)
+    config.include('velruse.app')
+    wsgi_app = config.make_wsgi_app()
+    return ASGIApp(wsgi_app, config.registry)
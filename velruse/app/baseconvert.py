@@ -2,6 +2,147 @@
 
 ALPHABET = "23456789abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ"
 
+# the value of the characters outside of an alphabet in the decoding table
+_INVALID = 255
+
+
+class BaseCodec(object):
+    """Encode numbers in Base X and decode them back.
+
+    The lookup tables of ``alphabet`` are built once: digits are encoded
+    two at a time from a table of all the pairs. A single string is
+    decoded one character at a time from a table of the character values,
+    which is no slower than translating strings as short as the tokens.
+    Bytes and batches of strings are translated to their values in a
+    single pass, then folded two digits at a time.
+
+    Encoded numbers have no leading zero digit unless a fixed ``width`` is
+    requested, in which case they are padded to exactly ``width``
+    characters.
+
+    """
+    def __init__(self, alphabet=ALPHABET):
+        if len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise ValueError('an alphabet needs 2 or more unique characters')
+        if len(alphabet) >= _INVALID:
+            raise ValueError('an alphabet has at most %d characters'
+                             % (_INVALID - 1))
+        self.alphabet = alphabet
+        self.base = len(alphabet)
+        self.zero = alphabet[0]
+        self.pairs = [a + b for a in alphabet for b in alphabet]
+        self.values = dict((char, value)
+                           for value, char in enumerate(alphabet))
+        table = bytearray([_INVALID] * 256)
+        for value, char in enumerate(bytearray(alphabet.encode('ascii'))):
+            table[char] = value
+        self.decode_table = bytes(table)
+
+    def width(self, bits):
+        """Return the number of characters needed to encode ``bits`` bits"""
+        width, limit, top = 1, self.base, 2 ** bits
+        while limit < top:
+            width += 1
+            limit *= self.base
+        return width
+
+    def encode(self, num, width=None):
+        """Encode ``num`` as a string"""
+        if num < 0:
+            raise ValueError('cannot encode negative number %r' % num)
+        base2 = self.base * self.base
+        pairs = self.pairs
+        out = []
+        while num:
+            num, rem = divmod(num, base2)
+            out.append(pairs[rem])
+        out.reverse()
+        string = ''.join(out).lstrip(self.zero) or self.zero
+        if width is not None:
+            if len(string) > width:
+                raise ValueError('number does not fit in %d characters'
+                                 % width)
+            string = self.zero * (width - len(string)) + string
+        return string
+
+    def encode_bytes(self, num, width=None):
+        """Encode ``num`` as ASCII bytes"""
+        return self.encode(num, width).encode('ascii')
+
+    def encode_many(self, nums, width=None):
+        """Encode each of ``nums`` as a string"""
+        encode = self.encode
+        return [encode(num, width) for num in nums]
+
+    def _values(self, data):
+        values = bytearray(data.translate(self.decode_table))
+        if _INVALID in values:
+            char = bytearray(data)[values.index(_INVALID)]
+            raise ValueError('Unexpected character %r' % chr(char))
+        return values
+
+    def _fold(self, values):
+        # fold the digits two at a time to halve the big integer operations
+        base = self.base
+        base2 = base * base
+        num = 0
+        if len(values) % 2:
+            num = values[0]
+            values = values[1:]
+        digits = iter(values)
+        for high in digits:
+            num = num * base2 + high * base + next(digits)
+        return num
+
+    def _to_bytes(self, string):
+        try:
+            return string.encode('ascii')
+        except UnicodeError:
+            raise ValueError('Unexpected character in %r' % string)
+
+    def decode_bytes(self, data):
+        """Decode ASCII bytes into a number"""
+        return self._fold(self._values(data))
+
+    def decode(self, string):
+        """Decode a string into a number"""
+        values = self.values
+        base = self.base
+        num = 0
+        for char in string:
+            try:
+                num = num * base + values[char]
+            except KeyError:
+                raise ValueError('Unexpected character %r' % char)
+        return num
+
+    def decode_many(self, strings):
+        """Decode each of ``strings`` into a number.
+
+        The strings are translated together, so an invalid character in
+        any of them raises :exc:`ValueError`.
+        """
+        strings = list(strings)
+        values = self._values(self._to_bytes(''.join(strings)))
+        nums = []
+        start = 0
+        for string in strings:
+            end = start + len(string)
+            nums.append(self._fold(values[start:end]))
+            start = end
+        return nums
+
+
+_codecs = {}
+
+
+def get_codec(alphabet=ALPHABET):
+    """Return the shared :class:`BaseCodec` of ``alphabet``"""
+    codec = _codecs.get(alphabet)
+    if codec is None:
+        codec = _codecs[alphabet] = BaseCodec(alphabet)
+    return codec
+
 
 def base_encode(num, alphabet=ALPHABET):
     """Encode a number in Base X
@@ -9,16 +150,7 @@ def base_encode(num, alphabet=ALPHABET):
     `num`: The number to encode
     `alphabet`: The alphabet to use for encoding
     """
-    if (num == 0):
-        return alphabet[0]
-    arr = []
-    base = len(alphabet)
-    while num:
-        rem = num % base
-        num = num // base
-        arr.append(alphabet[rem])
-    arr.reverse()
-    return ''.join(arr)
+    return get_codec(alphabet).encode(num)
 
 
 def base_n_decoder(alphabet=ALPHABET):
@@ -28,17 +160,6 @@ def base_n_decoder(alphabet=ALPHABET):
     - `string`: The encoded string
     - `alphabet`: The alphabet to use for encoding
     """
-    base = len(alphabet)
-    char_value = dict(((c, v) for v, c in enumerate(alphabet)))
-
-    def f(string):
-        num = 0
-        try:
-            for char in string:
-                num = num * base + char_value[char]
-        except KeyError:
-            raise ValueError('Unexpected character %r' % char)
-        return num
-    return f
+    return get_codec(alphabet).decode
 
 base_decode = base_n_decoder()
@@ -0,0 +1,158 @@
+"""Discovery of the providers installed as separate packages.
+
+A package makes a provider available to the standalone app by declaring
+an entry point in the ``velruse.providers`` group, named after the value
+of the ``provider.<identifier>.impl`` setting and pointing at the function
+configuring the provider from the settings::
+
+    entry_points='''
+    [velruse.providers]
+    acme = acme_velruse:add_acme_login_from_settings
+    '''
+
+The function is called with the configurator and the ``prefix`` of the
+settings of the provider, ``provider.<identifier>.``. When its module
+defines an ``includeme`` the module is included first, so that the
+function may use the directives it adds, such as ``add_acme_login``.
+
+Finding the entry points means reading the metadata of every installed
+distribution, so the result is kept in an index, in memory and optionally
+in a file. The index is rebuilt when the directories of ``sys.path``
+change, as they do when a package is installed or removed, or when a
+provider is missing from it.
+
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+
+
+log = __import__('logging').getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'velruse.providers'
+
+
+def scan_entry_points(group=ENTRY_POINT_GROUP):
+    """Return the entry points of ``group`` as a dict of name to
+    ``module:attr`` specs"""
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover Python < 3.8
+        import pkg_resources
+        return dict(
+            (ep.name, '%s:%s' % (ep.module_name, '.'.join(ep.attrs)))
+            for ep in pkg_resources.iter_entry_points(group))
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:  # pragma: no cover Python < 3.10
+        eps = eps.get(group, [])
+    return dict((ep.name, ep.value) for ep in eps)
+
+
+def path_fingerprint(paths=None):
+    """Return a digest of the modification times of the ``paths``,
+    ``sys.path`` by default"""
+    digest = hashlib.sha1()
+    for path in sys.path if paths is None else paths:
+        try:
+            mtime = os.stat(path or '.').st_mtime
+        except OSError:
+            mtime = None
+        digest.update(('%s\0%r\0' % (path, mtime)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ProviderIndex(object):
+    """The providers declared in the ``velruse.providers`` entry point
+    group.
+
+    ``filename`` is the file the index is cached in across processes, the
+    index is only kept in memory when it is ``None``.
+
+    """
+    def __init__(self, filename=None, group=ENTRY_POINT_GROUP,
+                 scan=scan_entry_points, fingerprint=path_fingerprint):
+        self.filename = filename
+        self.group = group
+        self.scan = scan
+        self.fingerprint = fingerprint
+        self.providers = None
+        self.lock = threading.Lock()
+
+    def _read(self, fingerprint):
+        if self.filename is None:
+            return None
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if (not isinstance(data, dict) or
+                data.get('group') != self.group or
+                data.get('fingerprint') != fingerprint):
+            return None
+        return data.get('providers')
+
+    def _write(self, fingerprint, providers):
+        if self.filename is None:
+            return
+        data = {
+            'group': self.group,
+            'fingerprint': fingerprint,
+            'providers': providers,
+        }
+        # write a new file and move it in place so that workers starting
+        # concurrently never read a partial index
+        tmp = '%s.%d.tmp' % (self.filename, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, sort_keys=True)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError):
+            log.warning('could not write the provider index %s',
+                        self.filename, exc_info=True)
+
+    def refresh(self):
+        """Scan the entry points and update the index"""
+        fingerprint = self.fingerprint()
+        self.providers = self.scan(self.group)
+        self._write(fingerprint, self.providers)
+        return self.providers
+
+    def load(self):
+        """Return the index, reading it from :attr:`filename` when it is
+        up to date"""
+        with self.lock:
+            if self.providers is None:
+                providers = self._read(self.fingerprint())
+                if providers is None:
+                    providers = self.refresh()
+                self.providers = providers
+            return self.providers
+
+    def get(self, name):
+        """Return the ``module:attr`` spec of the provider ``name`` or
+        ``None``"""
+        spec = self.load().get(name)
+        if spec is None:
+            # the index may predate the package declaring it
+            with self.lock:
+                spec = self.refresh().get(name)
+        return spec
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_provider_index(filename=None):
+    """Return the :class:`ProviderIndex` shared by the apps using the
+    index ``filename``"""
+    with _indexes_lock:
+        index = _indexes.get(filename)
+        if index is None:
+            index = _indexes[filename] = ProviderIndex(filename)
+        return index
@@ -0,0 +1,94 @@
+"""WSGI middleware serving velruse in front of an application.
+
+The login views are served by the standalone app but, once a login
+completes, the result is passed to the endpoint of the wrapped application
+in the same request instead of being stored and posted back by the
+browser. The endpoint finds it in ``environ['velruse.result']`` in the same
+format as returned by ``/auth_info``.
+
+"""
+from io import BytesIO
+
+from pyramid.config import Configurator
+from pyramid.interfaces import IRoutesMapper
+from pyramid.request import Request
+
+from ..compat import urlsplit
+
+
+def dispatch_result(request, app, result_data):
+    """Call the endpoint of ``app`` with ``result_data`` and return its
+    response.
+
+    The endpoint is called with an empty ``POST`` request as it would have
+    been by the redirect form, keeping the headers of the browser's request
+    such as its cookies.
+    """
+    endpoint = request.registry.settings.get('endpoint')
+    environ = dict((k, v) for k, v in request.environ.items()
+                   if not k.startswith(('webob.', 'bfg.')))
+    environ.update({
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': urlsplit(endpoint).path or '/',
+        'QUERY_STRING': '',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': '0',
+        'wsgi.input': BytesIO(b''),
+        'velruse.result': result_data,
+    })
+    return Request(environ).get_response(app)
+
+
+class VelruseMiddleware(object):
+    """Serve the velruse routes of ``velruse_app`` in front of ``app``.
+
+    ``velruse_app`` is the Pyramid router created from ``registry``. The
+    requests matching one of its routes, such as the login and callback
+    URLs, are handled by velruse and everything else is passed to ``app``.
+
+    The path of the ``endpoint`` setting is the path of the endpoint
+    within ``app``.
+
+    """
+    def __init__(self, app, velruse_app, registry):
+        self.app = app
+        self.velruse_app = velruse_app
+        self.mapper = registry.queryUtility(IRoutesMapper)
+        registry.velruse_downstream = app
+
+    def __call__(self, environ, start_response):
+        if self.mapper is not None:
+            path = environ.get('PATH_INFO') or '/'
+            for route in self.mapper.get_routes():
+                if route.match(path) is not None:
+                    return self.velruse_app(environ, start_response)
+        return self.app(environ, start_response)
+
+
+def make_filter(app, global_conf, **settings):
+    """Wrap ``app`` with :class:`VelruseMiddleware`.
+
+    This function is compatible with the `PasteDeploy` filter factory API
+    and accepts the same settings as :func:`velruse.app.make_app`.
+
+    Example INI file:
+
+    .. code-block:: ini
+
+        [pipeline:main]
+        pipeline =
+            velruse
+            YOURAPP
+
+        [filter:velruse]
+        use = egg:velruse
+        endpoint = /logged_in
+
+        provider.facebook.consumer_key = KMfXjzsA2qVUcnnRn3vpnwWZ2pwPRFZdb
+        provider.facebook.consumer_secret =
+            ULZ6PkJbsqw2GxZWCIbOEBZdkrb9XwgXNjRy
+
+    """
+    config = Configurator(settings=settings)
+    config.include('velruse.app')
+    return VelruseMiddleware(app, config.make_wsgi_app(), config.registry)
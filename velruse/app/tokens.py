@@ -0,0 +1,93 @@
+"""Self-contained result tokens.
+
+Instead of storing a result under a random token, the standalone app can
+hand the result itself to the endpoint as a sealed token: the result is
+serialized as JSON, compressed and encrypted with `Fernet`_, which also
+authenticates it and records when it was issued. ``/auth_info`` opens the
+token on any node sharing the secret without touching a store.
+
+A sealed token is only valid for ``ttl`` seconds but, as nothing is
+stored, it cannot be consumed and may be read again until it expires.
+
+This module requires the ``cryptography`` package.
+
+.. _Fernet: https://cryptography.io/en/latest/fernet/
+
+"""
+import base64
+import hashlib
+import json
+import time
+import zlib
+
+from pyramid.exceptions import ConfigurationError
+
+try:
+    from cryptography.fernet import Fernet
+    from cryptography.fernet import InvalidToken
+    from cryptography.fernet import MultiFernet
+except ImportError:  # pragma: no cover
+    Fernet = None
+
+from ..compat import TEXT
+from ..settings import splitlines
+
+
+def derive_key(secret):
+    """Return the Fernet key derived from an arbitrary ``secret``"""
+    if isinstance(secret, TEXT):
+        secret = secret.encode('utf-8')
+    return base64.urlsafe_b64encode(hashlib.sha256(secret).digest())
+
+
+class SealedTokens(object):
+    """Seal results into tokens and open them again.
+
+    ``secrets`` is a list of secrets shared by every node. Tokens are
+    sealed with the first one and opened with any of them, so a new
+    secret can be rolled out in front of the old one.
+
+    """
+    def __init__(self, secrets, ttl=300, clock=time.time):
+        if Fernet is None:  # pragma: no cover
+            raise ConfigurationError(
+                'the "cryptography" package is required to use sealed '
+                'tokens')
+        if isinstance(secrets, (TEXT, bytes)):
+            secrets = [secrets]
+        if not secrets:
+            raise ConfigurationError('sealed tokens require a secret')
+        self.fernet = MultiFernet([Fernet(derive_key(s)) for s in secrets])
+        self.ttl = int(ttl)
+        self.clock = clock
+
+    def seal(self, data):
+        """Return a token holding ``data``"""
+        payload = zlib.compress(
+            json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        token = self.fernet.encrypt_at_time(payload, int(self.clock()))
+        return token.decode('ascii')
+
+    def unseal(self, token):
+        """Return the data of ``token`` or raise :exc:`KeyError` if it is
+        invalid or expired"""
+        if not token:
+            raise KeyError(token)
+        if isinstance(token, TEXT):
+            token = token.encode('ascii', 'replace')
+        try:
+            payload = self.fernet.decrypt_at_time(
+                token, self.ttl, int(self.clock()))
+        except InvalidToken:
+            raise KeyError(token)
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def sealed_tokens_from_settings(settings, prefix='tokens.'):
+    """Create :class:`SealedTokens` from the ``secret`` and ``ttl``
+    settings under ``prefix``.
+
+    ``secret`` may hold several secrets, one per line.
+    """
+    secrets = list(splitlines(settings.get(prefix + 'secret') or ''))
+    return SealedTokens(secrets, ttl=settings.get(prefix + 'ttl', 300))
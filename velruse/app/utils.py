@@ -1,19 +1,22 @@
-import uuid
+import os
 
-from velruse.app.baseconvert import base_encode
+from pyramid.httpexceptions import HTTPSeeOther
+from pyramid.response import Response
 
+from velruse.app.baseconvert import ALPHABET
+from velruse.app.baseconvert import get_codec
+from velruse.compat import quote
 
-def redirect_form(end_point, token):
-    """Generate a redirect form for POSTing"""
-    return """
+
+FORM_TEMPLATE = """
 <html>
 <head>
   <title>OpenID transaction in progress</title>
 </head>
 <body onload="document.forms[0].submit();">
-<form action="%s" method="post" accept-charset="UTF-8"
+<form action="%(end_point)s" method="post" accept-charset="UTF-8"
  enctype="application/x-www-form-urlencoded">
-<input type="hidden" name="token" value="%s" />
+<input type="hidden" name="token" value="%(token)s" />
 <input type="submit" value="Continue"/></form>
 <script>
 var elements = document.forms[0].elements;
@@ -23,9 +26,80 @@ for (var i = 0; i < elements.length; i++) {
 </script>
 </body>
 </html>
-""" % (end_point, token)
+"""
+
+
+def redirect_form(end_point, token):
+    """Generate a redirect form for POSTing"""
+    return FORM_TEMPLATE % {'end_point': end_point, 'token': token}
+
+
+class RedirectForm(object):
+    """Hand tokens to ``end_point`` with an auto-submitted POST form.
+
+    The page is rendered once for the endpoint, only the token is
+    inserted for each response.
+    """
+    def __init__(self, end_point):
+        page = FORM_TEMPLATE % {'end_point': end_point, 'token': '\0'}
+        prefix, suffix = page.encode('utf-8').split(b'\0')
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def render(self, token):
+        """Return the page for ``token`` as bytes"""
+        return b''.join((self.prefix, token.encode('utf-8'), self.suffix))
+
+    def response(self, token):
+        return Response(body=self.render(token))
+
+
+class RedirectLocation(object):
+    """Hand tokens to ``end_point`` with a ``303 See Other`` redirect, in
+    the ``token`` query parameter."""
+
+    def __init__(self, end_point):
+        sep = '&' if '?' in end_point else '?'
+        self.prefix = end_point + sep + 'token='
+
+    def location(self, token):
+        return self.prefix + quote(token, safe='')
+
+    def response(self, token):
+        return HTTPSeeOther(location=self.location(token))
+
+
+# tokens hold at least the 122 random bits of the UUID4 formerly encoded
+# with ALPHABET
+TOKEN_LENGTH = get_codec(ALPHABET).width(122)
+
+# map every random byte below the largest multiple of the alphabet size to
+# a character and drop the others, so that the characters are uniformly
+# distributed
+_ACCEPTED = 256 - 256 % len(ALPHABET)
+_TOKEN_TABLE = bytes(bytearray(
+    ord(ALPHABET[i % len(ALPHABET)]) for i in range(256)))
+_TOKEN_REJECTED = bytes(bytearray(range(_ACCEPTED, 256)))
+
+
+def _random_chars(count):
+    """Return ``count`` random characters of ``ALPHABET`` as bytes"""
+    chars = b''
+    while len(chars) < count:
+        # read enough bytes for the expected rejections plus some slack
+        need = count - len(chars)
+        size = need * 256 // _ACCEPTED + 16
+        chars += os.urandom(size).translate(_TOKEN_TABLE, _TOKEN_REJECTED)
+    return chars[:count]
 
 
 def generate_token():
     """Generate a random token"""
-    return base_encode(uuid.uuid4().int)
+    return _random_chars(TOKEN_LENGTH).decode('ascii')
+
+
+def generate_tokens(count):
+    """Generate a list of ``count`` random tokens at once"""
+    chars = _random_chars(count * TOKEN_LENGTH).decode('ascii')
+    return [chars[i:i + TOKEN_LENGTH]
+            for i in range(0, len(chars), TOKEN_LENGTH)]
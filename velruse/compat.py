@@ -36,3 +36,18 @@ try:
     from urllib import urlencode
 except ImportError:
     from urllib.parse import urlencode
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit
+
+try:
+    from collections.abc import Mapping
+except ImportError: #pragma NO COVER Python < 3.3
+    from collections import Mapping
@@ -15,5 +15,28 @@ class ThirdPartyFailure(VelruseException):
     data"""
 
 
+class UpstreamFailure(ThirdPartyFailure):
+    """Raised when an upstream request fails or is answered with an
+    error"""
+
+
 class CSRFError(VelruseException):
     """Raised when CSRF validation fails"""
+
+
+class DeadlineExceeded(ThirdPartyFailure):
+    """Raised when the upstream requests of a login run out of time"""
+
+
+class ProviderUnavailable(ThirdPartyFailure):
+    """Raised instead of contacting a provider whose circuit breaker is
+    open"""
+
+
+class BulkheadFull(ProviderUnavailable):
+    """Raised instead of queueing a call to a provider whose bulkhead is
+    full"""
+
+
+class InvalidIDToken(ThirdPartyFailure):
+    """Raised when an ID token fails verification"""
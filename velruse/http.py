@@ -0,0 +1,650 @@
+"""Pooled HTTP transport shared by the provider callbacks"""
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import partial
+import socket
+import sys
+import threading
+import time
+from types import GeneratorType
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import AuthenticationComplete
+from .exceptions import BulkheadFull
+from .exceptions import DeadlineExceeded
+from .exceptions import ProviderUnavailable
+from .exceptions import UpstreamFailure
+
+log = __import__('logging').getLogger(__name__)
+
+#: The errors of an upstream call counted as failures by a
+#: :class:`CircuitBreaker`. The other errors, such as the
+#: :class:`~velruse.exceptions.ThirdPartyFailure` raised when checking
+#: the parameters of a callback, are not.
+UPSTREAM_ERRORS = (UpstreamFailure, DeadlineExceeded,
+                   requests.RequestException, socket.error)
+
+
+class HTTPRequest(object):
+    """A description of an upstream request.
+
+    Provider flows yield these instead of performing the request
+    themselves so that the same flow can be driven by the blocking
+    :class:`HTTPClient` or by an asynchronous client.
+
+    """
+    def __init__(self, method, url, data=None, params=None, headers=None,
+                 auth=None, timeout=None):
+        self.method = method
+        self.url = url
+        self.data = data
+        self.params = params
+        self.headers = headers
+        self.auth = auth
+        self.timeout = timeout
+
+    def __repr__(self):
+        return '<HTTPRequest %s %s>' % (self.method, self.url)
+
+    def optional(self, part, budget=None):
+        """Return an :class:`OptionalRequest` retrieving ``part``"""
+        return OptionalRequest(self.method, self.url, part, budget,
+                               data=self.data,
+                               params=self.params,
+                               headers=self.headers,
+                               auth=self.auth,
+                               timeout=self.timeout)
+
+
+class OptionalRequest(HTTPRequest):
+    """A request retrieving an optional ``part`` of a profile.
+
+    The request is given ``budget`` seconds, the ``optional_budget`` of
+    the client by default. When it fails or runs out of time the flow
+    receives ``None`` instead of the response and ``part`` is listed in
+    the :attr:`~velruse.AuthenticationComplete.missing` parts of the
+    result.
+
+    """
+    def __init__(self, method, url, part, budget=None, **kw):
+        HTTPRequest.__init__(self, method, url, **kw)
+        self.part = part
+        self.budget = budget
+
+    def limit(self, budget=None):
+        """Bound the timeout of the request by its budget, or ``budget``,
+        and return it"""
+        if self.budget is not None:
+            budget = self.budget
+        if budget is not None and (self.timeout is None or
+                                   self.timeout > budget):
+            self.timeout = budget
+        return self.timeout
+
+
+class FlowRunner(object):
+    """Step through a flow, resolving the sub-flows it yields.
+
+    This holds the state shared by the blocking and asynchronous drivers.
+    :meth:`start`, :meth:`send` and :meth:`throw` return the next
+    :class:`HTTPRequest` to perform, or ``None`` once :attr:`done` is
+    set, at which point the result of the flow is :attr:`result`.
+
+    The drivers call :meth:`skip` instead of sending back the response of
+    an :class:`OptionalRequest` they gave up on.
+
+    """
+    def __init__(self, flow):
+        self.stack = [flow]
+        self.done = False
+        self.result = None
+        self.missing = []
+
+    def start(self):
+        return self._advance(next, self.stack[-1])
+
+    def send(self, value):
+        return self._advance(self.stack[-1].send, value)
+
+    def throw(self, exc_info):
+        return self._advance(self.stack[-1].throw, *exc_info)
+
+    def close(self):
+        while self.stack:
+            self.stack.pop().close()
+
+    def skip(self, req):
+        """Record the part of ``req`` as missing and return ``None``, the
+        value sent back to the flow in place of the response"""
+        self.missing.append(req.part)
+        return None
+
+    def _advance(self, step, *args):
+        while True:
+            try:
+                item = step(*args)
+            except StopIteration:
+                item = None
+            except Exception:
+                # propagate the error to the parent flow, if any
+                self.stack.pop()
+                if not self.stack:
+                    raise
+                step, args = self.stack[-1].throw, sys.exc_info()
+                continue
+            else:
+                if isinstance(item, GeneratorType):
+                    self.stack.append(item)
+                    step, args = next, (item,)
+                    continue
+                if isinstance(item, HTTPRequest):
+                    return item
+
+            # the current flow has produced its result
+            self.stack.pop().close()
+            if not self.stack:
+                self.done = True
+                self.result = item
+                if self.missing and isinstance(item, AuthenticationComplete):
+                    item.missing.extend(self.missing)
+                return None
+            step, args = self.stack[-1].send, (item,)
+
+
+class Deadline(object):
+    """The time left to the upstream requests of a login"""
+
+    def __init__(self, seconds, clock=time.time):
+        self.clock = clock
+        self.expires = clock() + seconds
+
+    def remaining(self):
+        return self.expires - self.clock()
+
+    def timeout(self, timeout=None):
+        """Return the timeout of the next request, the time left or
+        ``timeout`` if it is shorter.
+
+        Raise :class:`~velruse.exceptions.DeadlineExceeded` once no time
+        is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('the deadline of the upstream requests '
+                                   'expired')
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
+class CircuitBreaker(object):
+    """Stop calling an upstream service which keeps failing.
+
+    The breaker is *closed* as long as the calls succeed. Once
+    ``failures`` calls in a row have failed, or have been slower than
+    ``slow_call`` seconds, it *opens* and the next calls are rejected
+    with :class:`~velruse.exceptions.ProviderUnavailable` without
+    contacting the service. After ``reset_timeout`` seconds it is
+    *half-open*: up to ``probes`` calls are let through at a time and the
+    breaker closes once one of them succeeds or opens again if one fails.
+
+    A call is made between :meth:`acquire` and one of :meth:`success`,
+    :meth:`failure` or :meth:`release`, the latter for a call which
+    ended for reasons unrelated to the service.
+
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failures=5, reset_timeout=30, slow_call=None,
+                 probes=1, name=None, clock=time.time):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self.probes = probes
+        self.name = name
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = 0
+        self.counts = {'calls': 0, 'failures': 0, 'rejected': 0,
+                       'opened': 0}
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    @property
+    def state(self):
+        """``closed``, ``open`` or ``half-open``"""
+        with self.lock:
+            return self._state()
+
+    def acquire(self):
+        """Let a call through or raise
+        :class:`~velruse.exceptions.ProviderUnavailable`"""
+        with self.lock:
+            state = self._state()
+            if state == self.HALF_OPEN and self.probing < self.probes:
+                self.probing += 1
+            elif state != self.CLOSED:
+                self.counts['rejected'] += 1
+                raise ProviderUnavailable(
+                    'the circuit breaker of %s is open' % (
+                        self.name or 'the provider'))
+            self.counts['calls'] += 1
+
+    def _end_probe(self):
+        self.probing = max(self.probing - 1, 0)
+
+    def _open(self):
+        log.warning('opening the circuit breaker of %s after %d failures',
+                    self.name, self.consecutive_failures)
+        self.counts['opened'] += 1
+        self.opened_at = self.clock()
+
+    def success(self, elapsed=0):
+        """Record a successful call which took ``elapsed`` seconds"""
+        if self.slow_call is not None and elapsed > self.slow_call:
+            return self.failure()
+        with self.lock:
+            state = self._state()
+            if state == self.OPEN:
+                # a call made before the breaker opened
+                return
+            if state == self.HALF_OPEN:
+                self._end_probe()
+                log.info('closing the circuit breaker of %s', self.name)
+            self.opened_at = None
+            self.consecutive_failures = 0
+
+    def failure(self):
+        """Record a failed call"""
+        with self.lock:
+            self.counts['failures'] += 1
+            self.consecutive_failures += 1
+            state = self._state()
+            if state == self.HALF_OPEN:
+                self._end_probe()
+                self._open()
+            elif (state == self.CLOSED and
+                    self.consecutive_failures >= self.failures):
+                self._open()
+
+    def release(self):
+        """Record a call which neither succeeded nor failed"""
+        with self.lock:
+            if self._state() == self.HALF_OPEN:
+                self._end_probe()
+
+    def stats(self):
+        """Return the state of the breaker and its counters, for
+        monitoring"""
+        with self.lock:
+            stats = dict(self.counts)
+            stats.update(state=self._state(),
+                         consecutive_failures=self.consecutive_failures,
+                         opened_at=self.opened_at)
+            return stats
+
+
+def make_breaker(breaker=None, name=None):
+    """Create a :class:`CircuitBreaker`.
+
+    ``breaker`` may be an existing breaker, which is returned unchanged,
+    a dict of keyword arguments for a new one or ``None`` for no breaker.
+    """
+    if breaker is None or isinstance(breaker, CircuitBreaker):
+        return breaker
+    breaker = dict(breaker)
+    breaker.setdefault('name', name)
+    return CircuitBreaker(**breaker)
+
+
+class Bulkhead(object):
+    """Run the upstream calls of a provider on threads of its own.
+
+    At most ``concurrency`` calls run at a time and up to ``queue`` more
+    wait for a thread, further calls are rejected at once with
+    :class:`~velruse.exceptions.BulkheadFull`. A slow provider thus holds
+    at most ``concurrency + queue`` of the application's threads instead
+    of starving the logins of the other providers.
+
+    """
+    def __init__(self, concurrency=4, queue=0, name=None):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.name = name
+
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.counts = {'calls': 0, 'rejected': 0}
+        self._executor = None
+
+    @property
+    def executor(self):
+        """The threads of the bulkhead, started on first use"""
+        if self._executor is None:
+            with self.lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.concurrency)
+        return self._executor
+
+    def acquire(self):
+        """Take a slot or raise :class:`~velruse.exceptions.BulkheadFull`"""
+        with self.lock:
+            if self.pending >= self.concurrency + self.queue:
+                self.counts['rejected'] += 1
+                raise BulkheadFull('the bulkhead of %s is full' % (
+                    self.name or 'the provider'))
+            self.pending += 1
+            self.counts['calls'] += 1
+
+    def release(self, *args):
+        """Give a slot back"""
+        with self.lock:
+            self.pending -= 1
+
+    def submit(self, func):
+        """Schedule ``func`` on the threads of the bulkhead and return its
+        future"""
+        self.acquire()
+        try:
+            future = self.executor.submit(func)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    def call(self, func, timeout=None):
+        """Call ``func`` on the threads of the bulkhead and wait for its
+        result, at most ``timeout`` seconds after which
+        :class:`~velruse.exceptions.DeadlineExceeded` is raised"""
+        future = self.submit(func)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise DeadlineExceeded('the deadline of the upstream requests '
+                                   'expired')
+
+    def stats(self):
+        """Return the size of the bulkhead and its counters, for
+        monitoring"""
+        with self.lock:
+            stats = dict(self.counts)
+            stats.update(concurrency=self.concurrency, queue=self.queue,
+                         pending=self.pending)
+            return stats
+
+    def shutdown(self):
+        """Stop the threads once the pending calls are done"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def make_bulkhead(bulkhead=None, name=None):
+    """Create a :class:`Bulkhead`.
+
+    ``bulkhead`` may be an existing bulkhead, which is returned unchanged,
+    a dict of keyword arguments for a new one or ``None`` for no bulkhead.
+    """
+    if bulkhead is None or isinstance(bulkhead, Bulkhead):
+        return bulkhead
+    bulkhead = dict(bulkhead)
+    bulkhead.setdefault('name', name)
+    return Bulkhead(**bulkhead)
+
+
+class HTTPClient(object):
+    """A pooled HTTP client owned by a single provider.
+
+    Each provider keeps one of these for the lifetime of the application
+    so that back-to-back logins reuse warm connections to the upstream
+    hosts instead of paying a fresh TCP+TLS handshake for every request.
+
+    ``pool_connections`` is the number of per-host connection pools to
+    cache, ``pool_maxsize`` is the maximum number of connections kept
+    alive for each host and ``keep_alive`` may be set to ``False`` to
+    close each connection once the response has been read.
+
+    ``max_workers`` bounds the number of lookup threads running the
+    optional requests and the background refreshes of the provider.
+
+    ``timeout`` is the timeout in seconds of each request and ``deadline``
+    the time allowed to all the requests of a flow run by :meth:`run`,
+    both unlimited by default. ``optional_budget`` is the time given to an
+    :class:`OptionalRequest` without a budget of its own. ``breaker`` is a
+    :class:`CircuitBreaker`, or a dict of its arguments, guarding
+    :meth:`run`. ``bulkhead`` is a :class:`Bulkhead`, or a dict of its
+    arguments, running :meth:`run` on threads reserved to the provider.
+
+    """
+    def __init__(self,
+                 pool_connections=10,
+                 pool_maxsize=10,
+                 keep_alive=True,
+                 max_workers=4,
+                 timeout=None,
+                 deadline=None,
+                 optional_budget=2.0,
+                 breaker=None,
+                 bulkhead=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.deadline = deadline
+        self.optional_budget = optional_budget
+        self.breaker = make_breaker(breaker)
+        self.bulkhead = make_bulkhead(bulkhead)
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.session = session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+
+    def request(self, method, url, **kw):
+        if kw.get('timeout') is None:
+            kw['timeout'] = self.timeout
+        return self.session.request(method, url, **kw)
+
+    def get(self, url, **kw):
+        return self.request('GET', url, **kw)
+
+    def post(self, url, data=None, **kw):
+        return self.request('POST', url, data=data, **kw)
+
+    @property
+    def executor(self):
+        """The thread pool running the lookups in the background.
+
+        It is created on first use so that providers which never need it
+        do not start any threads.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor
+
+    def send(self, req):
+        """Perform an :class:`HTTPRequest` and return the response."""
+        return self.request(req.method, req.url,
+                            data=req.data,
+                            params=req.params,
+                            headers=req.headers,
+                            auth=req.auth,
+                            timeout=req.timeout)
+
+    def perform(self, req, runner):
+        """Perform the request yielded by the flow of ``runner`` and return
+        the response.
+
+        An optional request is performed on the lookup threads so that it
+        is abandoned, and skipped, once its budget is spent.
+
+        An abandoned request keeps its lookup thread until it completes.
+        Its timeout is bounded by its budget, but the timeout of
+        `Requests`_ limits each socket operation rather than the whole
+        response: a server trickling a response holds the thread longer,
+        and once every thread of ``max_workers`` is held the lookups of
+        the following logins wait for one.
+
+        .. _Requests: https://requests.readthedocs.io/
+        """
+        if not isinstance(req, OptionalRequest):
+            return self.send(req)
+        wait_for = req.limit(self.optional_budget)
+        future = self.executor.submit(self.send, req)
+        try:
+            return future.result(wait_for)
+        except Exception:
+            log.info('skipping the optional %s of %s', req.part, req.url,
+                     exc_info=True)
+            return runner.skip(req)
+
+    def new_deadline(self):
+        """Return the :class:`Deadline` of a new flow or ``None``"""
+        if self.deadline is None:
+            return None
+        return Deadline(self.deadline)
+
+    def call(self, func, errors=(), guard=True):
+        """Call ``func`` through the circuit breaker, on the threads of the
+        bulkhead if there is one.
+
+        The exceptions in :data:`UPSTREAM_ERRORS` and ``errors`` are
+        counted as failures of the upstream service. ``guard`` may be
+        set to ``False`` for the calls to a service chosen by the user,
+        which are not reported to the circuit breaker. The result is
+        awaited at most :attr:`deadline` seconds.
+        """
+        if self.bulkhead is None:
+            return self._guarded(func, errors, guard)
+        return self.bulkhead.call(
+            partial(self._guarded, func, errors, guard), self.deadline)
+
+    def _guarded(self, func, errors, guard=True):
+        breaker = self.breaker
+        if breaker is None or not guard:
+            return func()
+        breaker.acquire()
+        start = time.time()
+        try:
+            result = func()
+        except UPSTREAM_ERRORS + tuple(errors):
+            breaker.failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.success(time.time() - start)
+        return result
+
+    def run(self, flow):
+        """Drive a provider flow to completion and return its result.
+
+        A flow is a generator which yields an :class:`HTTPRequest` each
+        time it needs to talk to the upstream server and receives the
+        response as the value of the ``yield`` expression. Errors raised while performing a request are thrown into the flow
+        at the ``yield``.
+
+        A flow may also yield another flow, whose result is then sent back
+        as the value of the ``yield``. The first value yielded which is
+        neither a request nor a flow is the result of the flow, usually an
+        :class:`~velruse.AuthenticationComplete` or
+        :class:`~velruse.AuthenticationDenied` context.
+
+        The requests are bounded by :attr:`timeout` and, together, by
+        :attr:`deadline`: once it has passed
+        :class:`~velruse.exceptions.DeadlineExceeded` is thrown into the
+        flow instead of performing the next request. The flow is not run
+        when the :attr:`breaker` is open, and is run by the
+        :attr:`bulkhead` if there is one.
+
+        """
+        return self.call(partial(self._run, flow))
+
+    def _run(self, flow):
+        runner = FlowRunner(flow)
+        deadline = self.new_deadline()
+        try:
+            item = runner.start()
+            while not runner.done:
+                if deadline is not None:
+                    try:
+                        limit_timeouts(item, deadline, self.timeout)
+                    except DeadlineExceeded:
+                        if isinstance(item, OptionalRequest):
+                            item = runner.send(runner.skip(item))
+                        else:
+                            item = runner.throw(sys.exc_info())
+                        continue
+                try:
+                    response = self.perform(item, runner)
+                except Exception:
+                    item = runner.throw(sys.exc_info())
+                else:
+                    item = runner.send(response)
+            return runner.result
+        finally:
+            runner.close()
+
+    def close(self):
+        """Close all pooled connections and stop the lookup threads."""
+        self.session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self.bulkhead is not None:
+            self.bulkhead.shutdown()
+
+
+def limit_timeouts(req, deadline, timeout=None):
+    """Bound the timeout of ``req`` by ``deadline``"""
+    timeout = deadline.timeout(timeout)
+    if req.timeout is None or req.timeout > timeout:
+        req.timeout = timeout
+
+
+def check_response(response):
+    """Raise :class:`~velruse.exceptions.UpstreamFailure` unless the
+    upstream response succeeded"""
+    if response.status_code != 200:
+        raise UpstreamFailure("Status %s: %s" % (
+            response.status_code, response.content))
+
+
+def make_http_client(http=None, name=None):
+    """Create an :class:`HTTPClient` for a provider.
+
+    ``http`` may be an existing :class:`HTTPClient`, which is returned
+    unchanged so that several providers can share one pool, or a dict of
+    keyword arguments for a new client. ``name`` is the name of the
+    provider, reported by its circuit breaker and bulkhead.
+
+    """
+    if isinstance(http, HTTPClient):
+        return http
+    http = dict(http or {})
+    if http.get('breaker') is not None:
+        http['breaker'] = make_breaker(http['breaker'], name)
+    if http.get('bulkhead') is not None:
+        http['bulkhead'] = make_bulkhead(http['bulkhead'], name)
+    return HTTPClient(**http)
@@ -0,0 +1,245 @@
+"""Local verification of OpenID Connect ID tokens.
+
+An ID token is a JSON Web Token signed by the identity provider with one
+of the keys it publishes as a JSON Web Key Set (JWKS). The key sets are
+kept by a :class:`JWKSCache` shared by the whole process, for as long as
+the ``Cache-Control`` header of the key set allows, and refreshed in the
+background shortly before they expire so that the logins do not wait on
+them.
+
+Only RSA keys and the ``RS256`` algorithm are supported.
+
+This module requires the ``cryptography`` package.
+
+"""
+import base64
+import binascii
+import json
+import re
+import threading
+import time
+
+from pyramid.exceptions import ConfigurationError
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:  # pragma: no cover
+    rsa = None
+
+from .exceptions import InvalidIDToken
+from .http import HTTPRequest
+from .http import check_response
+from .http import make_http_client
+
+
+log = __import__('logging').getLogger(__name__)
+
+MAX_AGE_RE = re.compile(r'(?:^|,)\s*max-age\s*=\s*"?(\d+)"?', re.I)
+NO_CACHE_RE = re.compile(r'(?:^|,)\s*(?:no-cache|no-store)\s*(?:,|$)', re.I)
+
+
+def b64decode(data):
+    """Decode unpadded base64url ``data``"""
+    if not isinstance(data, bytes):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def b64int(data):
+    """Decode the unsigned big-endian integer of base64url ``data``"""
+    return int(binascii.hexlify(b64decode(data)), 16)
+
+
+def cache_max_age(cache_control):
+    """Return the lifetime in seconds allowed by a ``Cache-Control``
+    header, or ``None`` when it does not say"""
+    if not cache_control:
+        return None
+    if NO_CACHE_RE.search(cache_control):
+        return 0
+    match = MAX_AGE_RE.search(cache_control)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def load_key(jwk):
+    """Return the RSA public key of a JSON Web Key or ``None`` for keys of
+    other types or uses"""
+    if jwk.get('kty') != 'RSA' or jwk.get('use', 'sig') != 'sig':
+        return None
+    if jwk.get('alg', 'RS256') != 'RS256':
+        return None
+    numbers = rsa.RSAPublicNumbers(b64int(jwk['e']), b64int(jwk['n']))
+    return numbers.public_key()
+
+
+def parse_id_token(id_token):
+    """Split an ID token into its header, claims, signed part and
+    signature"""
+    try:
+        if not isinstance(id_token, bytes):
+            id_token = id_token.encode('ascii')
+        header, claims, signature = id_token.split(b'.')
+        return (json.loads(b64decode(header).decode('utf-8')),
+                json.loads(b64decode(claims).decode('utf-8')),
+                header + b'.' + claims,
+                b64decode(signature))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise InvalidIDToken('malformed ID token')
+
+
+def verify_id_token(id_token, keys, audience, issuers, now=None,
+                    leeway=60):
+    """Verify ``id_token`` and return its claims.
+
+    ``keys`` maps the key ids of the issuer to their public keys. The
+    token must be signed by one of them, issued by one of ``issuers`` for
+    ``audience``, the client id, and be valid at ``now``, give or take
+    ``leeway`` seconds.
+
+    Raise :class:`~velruse.exceptions.InvalidIDToken` otherwise.
+    """
+    header, claims, signed, signature = parse_id_token(id_token)
+    if header.get('alg') != 'RS256':
+        raise InvalidIDToken('unsupported ID token algorithm %r'
+                             % header.get('alg'))
+    key = keys.get(header.get('kid'))
+    if key is None:
+        raise InvalidIDToken('unknown ID token key %r' % header.get('kid'))
+    try:
+        key.verify(signature, signed, padding.PKCS1v15(), hashes.SHA256())
+    except InvalidSignature:
+        raise InvalidIDToken('invalid ID token signature')
+
+    if not isinstance(claims, dict):
+        raise InvalidIDToken('malformed ID token')
+    if claims.get('iss') not in issuers:
+        raise InvalidIDToken('unexpected ID token issuer %r'
+                             % claims.get('iss'))
+    aud = claims.get('aud')
+    if audience not in (aud if isinstance(aud, list) else [aud]):
+        raise InvalidIDToken('the ID token was issued for another client')
+    if now is None:
+        now = time.time()
+    try:
+        expires = float(claims['exp'])
+        issued = float(claims.get('iat', 0))
+    except (KeyError, TypeError, ValueError):
+        raise InvalidIDToken('malformed ID token')
+    if expires + leeway < now:
+        raise InvalidIDToken('expired ID token')
+    if issued - leeway > now:
+        raise InvalidIDToken('ID token issued in the future')
+    return claims
+
+
+class JWKSCache(object):
+    """The signing keys published by an issuer at ``url``.
+
+    The key set is kept for the ``max-age`` of its ``Cache-Control``
+    header, ``default_ttl`` seconds if it has none, but at least
+    ``min_ttl`` seconds. It is refreshed in the background once it
+    expires within ``refresh_ahead`` seconds, and at most every
+    ``min_ttl`` seconds when a token is signed by an unknown key.
+
+    The key set is fetched by the flow of a login when there is none yet,
+    see :meth:`keys_flow`, and in the background by ``http``, a
+    :class:`~velruse.http.HTTPClient` or a dict of its arguments.
+
+    """
+    def __init__(self, url, http=None, default_ttl=3600, min_ttl=60,
+                 refresh_ahead=300, clock=time.time):
+        if rsa is None:  # pragma: no cover
+            raise ConfigurationError(
+                'the "cryptography" package is required to verify ID '
+                'tokens')
+        self.url = url
+        self.http = make_http_client(http)
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.refresh_ahead = refresh_ahead
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.keys = None
+        self.expires = 0
+        self.fetched = 0
+        self.refreshing = False
+
+    def request(self):
+        return HTTPRequest('GET', self.url)
+
+    def update(self, response):
+        """Replace the keys by those of a key set ``response``"""
+        check_response(response)
+        keys = {}
+        for jwk in response.json().get('keys', []):
+            key = load_key(jwk)
+            if key is not None:
+                keys[jwk.get('kid')] = key
+        headers = getattr(response, 'headers', None) or {}
+        ttl = cache_max_age(headers.get('Cache-Control'))
+        if ttl is None:
+            ttl = self.default_ttl
+        now = self.clock()
+        with self.lock:
+            self.keys = keys
+            self.fetched = now
+            self.expires = now + max(ttl, self.min_ttl)
+        return keys
+
+    def keys_flow(self, kid=None):
+        """Flow returning the keys, requesting the key set first when it
+        has expired or does not have ``kid``"""
+        with self.lock:
+            keys = self.keys
+            now = self.clock()
+            stale = keys is None or now >= self.expires
+            missing = (not stale and kid is not None and kid not in keys and
+                       now - self.fetched >= self.min_ttl)
+            ahead = not stale and self.expires - now <= self.refresh_ahead
+        if stale or missing:
+            keys = self.update((yield self.request()))
+        elif ahead:
+            self.refresh_in_background()
+        yield keys
+
+    def refresh(self):
+        """Fetch the key set now"""
+        try:
+            return self.update(self.http.send(self.request()))
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            log.warning('could not refresh the keys of %s', self.url,
+                        exc_info=True)
+
+    def refresh_in_background(self):
+        """Start fetching the key set unless a refresh is under way"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        self.http.executor.submit(self._refresh)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_jwks_cache(url):
+    """Return the :class:`JWKSCache` of ``url`` shared by the process"""
+    with _caches_lock:
+        cache = _caches.get(url)
+        if cache is None:
+            cache = _caches[url] = JWKSCache(url)
+        return cache
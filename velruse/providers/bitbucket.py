@@ -2,21 +2,15 @@
 
 http://confluence.atlassian.com/display/BITBUCKET/OAuth+on+Bitbucket
 """
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-from requests_oauthlib import OAuth1
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import ThirdPartyFailure
+from ..http import check_response
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth1 import OAuth1Provider
 
 
 REQUEST_URL = 'https://bitbucket.org/api/1.0/oauth/request_token/'
@@ -43,6 +37,10 @@ def add_bitbucket_login_from_settings(config, prefix='velruse.bitbucket.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
+    p.update_prefetch()
     config.add_bitbucket_login(**p.kwargs)
 
 
@@ -51,11 +49,17 @@ def add_bitbucket_login(config,
                         consumer_secret,
                         login_path='/bitbucket/login',
                         callback_path='/bitbucket/login/callback',
-                        name='bitbucket'):
+                        name='bitbucket',
+                        http=None,
+                        prefetch=None,
+                        callback_url=None,
+                        lazy_profile=False):
     """
     Add a Bitbucket login provider to the application.
     """
-    provider = BitbucketProvider(name, consumer_key, consumer_secret)
+    provider = BitbucketProvider(name, consumer_key, consumer_secret, http,
+                                 prefetch, callback_url=callback_url,
+                                 lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -68,78 +72,23 @@ def add_bitbucket_login(config,
     register_provider(config, name, provider)
 
 
-class BitbucketProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.type = 'bitbucket'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a bitbucket login"""
-        # grab the initial request token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            callback_uri=request.route_url(self.callback_route))
-        resp = requests.post(REQUEST_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        request_token = dict(parse_qsl(resp.text))
-
-        # store the token for later
-        request.session['velruse.token'] = request_token
-
-        # redirect the user to authorize the app
-        auth_url = flat_url(AUTH_URL, oauth_token=request_token['oauth_token'])
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the bitbucket redirect"""
-        if 'denied' in request.GET:
-            return AuthenticationDenied("User denied authentication",
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        verifier = request.GET.get('oauth_verifier')
-        if not verifier:
-            raise ThirdPartyFailure("No oauth_verifier returned")
-
-        request_token = request.session.pop('velruse.token')
-
-        # turn our request token into an access token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=request_token['oauth_token'],
-            resource_owner_secret=request_token['oauth_token_secret'],
-            verifier=verifier)
-        resp = requests.post(ACCESS_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        access_token = dict(parse_qsl(resp.text))
-        creds = {
-            'oauthAccessToken': access_token['oauth_token'],
-            'oauthAccessTokenSecret': access_token['oauth_token_secret'],
-        }
-
-        # setup oauth for general api calls
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=creds['oauthAccessToken'],
-            resource_owner_secret=creds['oauthAccessTokenSecret'])
+class BitbucketProvider(OAuth1Provider):
+    type = 'bitbucket'
+    context = BitbucketAuthenticationComplete
+    request_token_url = REQUEST_URL
+    authorize_url = AUTH_URL
+    access_token_url = ACCESS_URL
+
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 prefetch=None, callback_url=None, lazy_profile=False):
+        OAuth1Provider.__init__(self, name, consumer_key, consumer_secret,
+                                http, prefetch, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
 
+    def profile_flow(self, access_token):
         # request user profile
-        resp = requests.get(USER_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
+        resp = yield self.signed_request('GET', USER_URL, access_token)
+        check_response(resp)
         user_data = resp.json()
 
         data = user_data['user']
@@ -169,9 +118,11 @@ class BitbucketProvider(object):
             display_name = data.get('display_name')
         profile['displayName'] = display_name
 
-        # request user emails
-        resp = requests.get(EMAIL_URL.format(username=username), auth=oauth)
-        if resp.status_code == 200:
+        # request user emails, optional
+        resp = yield self.signed_request(
+            'GET', EMAIL_URL.format(username=username),
+            access_token).optional('emails')
+        if resp is not None and resp.status_code == 200:
             data = resp.json()
             emails = []
             for item in data:
@@ -182,8 +133,4 @@ class BitbucketProvider(object):
                 if item.get('active'):
                     profile['verifiedEmail'] = item['email']
             profile['emails'] = emails
-
-        return BitbucketAuthenticationComplete(profile=profile,
-                                               credentials=creds,
-                                               provider_name=self.name,
-                                               provider_type=self.type)
+        yield profile
@@ -1,21 +1,14 @@
 """Facebook Authentication Views"""
 import datetime
-import uuid
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
-import requests
 
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import CSRFError
-from ..exceptions import ThirdPartyFailure
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class FacebookAuthenticationComplete(AuthenticationComplete):
@@ -36,6 +29,9 @@ def add_facebook_login_from_settings(config, prefix='velruse.facebook.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_facebook_login(**p.kwargs)
 
 
@@ -45,11 +41,16 @@ def add_facebook_login(config,
                        scope=None,
                        login_path='/login/facebook',
                        callback_path='/login/facebook/callback',
-                       name='facebook'):
+                       name='facebook',
+                       http=None,
+                       callback_url=None,
+                       lazy_profile=False):
     """
     Add a Facebook login provider to the application.
     """
-    provider = FacebookProvider(name, consumer_key, consumer_secret, scope)
+    provider = FacebookProvider(name, consumer_key, consumer_secret, scope,
+                                http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -62,79 +63,32 @@ def add_facebook_login(config,
     register_provider(config, name, provider)
 
 
-class FacebookProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = 'facebook'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
+class FacebookProvider(OAuth2Provider):
+    type = 'facebook'
+    context = FacebookAuthenticationComplete
+    authorize_url = 'https://www.facebook.com/dialog/oauth/'
+    access_token_url = 'https://graph.facebook.com/oauth/access_token'
+    access_token_method = 'GET'
+    access_token_format = 'qs'
+    profile_url = 'https://graph.facebook.com/me'
+    response_type = None
+    grant_type = None
+    denied_param = 'error_reason'
+
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
         self.display = 'page'
 
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a facebook login"""
-        scope = request.POST.get('scope', self.scope)
-        display = request.POST.get('display', self.display)
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-        fb_url = flat_url(
-            'https://www.facebook.com/dialog/oauth/',
-            scope=scope,
-            display=display,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            state=state)
-        return HTTPFound(location=fb_url)
-
-    def callback(self, request):
-        """Process the facebook redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_reason', 'No reason provided.')
-            return AuthenticationDenied(reason=reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://graph.facebook.com/oauth/access_token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        access_token = dict(parse_qsl(r.text))['access_token']
-
-        # Retrieve profile data
-        graph_url = flat_url('https://graph.facebook.com/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        fb_profile = r.json()
-        profile = extract_fb_data(fb_profile)
-
-        cred = {'oauthAccessToken': access_token}
-        return FacebookAuthenticationComplete(profile=profile,
-                                              credentials=cred,
-                                              provider_name=self.name,
-                                              provider_type=self.type)
+    def authorize_params(self, request):
+        params = OAuth2Provider.authorize_params(self, request)
+        params['display'] = request.POST.get('display', self.display)
+        return params
+
+    def extract_profile(self, data, token_data):
+        return extract_fb_data(data)
 
 
 def extract_fb_data(data):
@@ -190,7 +144,7 @@ def extract_fb_data(data):
     profile['name'] = name
 
     # Now strip out empty values
-    for k, v in profile.items():
+    for k, v in list(profile.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del profile[k]
 
@@ -1,21 +1,15 @@
 """Github Authentication Views"""
-import uuid
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import CSRFError
-from ..exceptions import ThirdPartyFailure
+from ..http import HTTPRequest
+from ..http import check_response
 from ..settings import ProviderSettings
 from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class GithubAuthenticationComplete(AuthenticationComplete):
@@ -36,8 +30,11 @@ def add_github_login_from_settings(config, prefix='velruse.github.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
     p.update('secure')
     p.update('domain')
+    p.update_http()
     config.add_github_login(**p.kwargs)
 
 
@@ -49,7 +46,10 @@ def add_github_login(config,
                      callback_path='/login/github/callback',
                      secure=True,
                      domain='github.com',
-                     name='github'):
+                     name='github',
+                     http=None,
+                     callback_url=None,
+                     lazy_profile=False):
     """
     Add a Github login provider to the application.
     """
@@ -58,7 +58,10 @@ def add_github_login(config,
                               consumer_secret,
                               scope,
                               secure,
-                              domain)
+                              domain,
+                              http,
+                              callback_url=callback_url,
+                              lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -71,77 +74,45 @@ def add_github_login(config,
     register_provider(config, name, provider)
 
 
-class GithubProvider(object):
+class GithubProvider(OAuth2Provider):
+    type = 'github'
+    context = GithubAuthenticationComplete
+    access_token_method = 'GET'
+    access_token_format = 'qs'
+    response_type = None
+    grant_type = None
+
     def __init__(self,
                  name,
                  consumer_key,
                  consumer_secret,
                  scope,
                  secure,
-                 domain):
-        self.name = name
-        self.type = 'github'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
+                 domain,
+                 http=None,
+                 callback_url=None,
+                 lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
         self.protocol = 'http' if secure is False else 'https'
         self.domain = domain
 
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a github login"""
-        scope = request.POST.get('scope', self.scope)
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-        gh_url = flat_url(
-            '%s://%s/login/oauth/authorize' % (self.protocol, self.domain),
-            scope=scope,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            state=state)
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the github redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason=reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            '%s://%s/login/oauth/access_token' % (self.protocol, self.domain),
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        access_token = dict(parse_qsl(r.text))['access_token']
+        self.authorize_url = '%s://%s/login/oauth/authorize' % (
+            self.protocol, self.domain)
+        self.access_token_url = '%s://%s/login/oauth/access_token' % (
+            self.protocol, self.domain)
+        self.api_url = '%s://api.%s' % (self.protocol, self.domain)
+
+    def profile_flow(self, token_data):
+        access_token = token_data['access_token']
 
         # Retrieve profile data
-        graph_url = flat_url('%s://api.%s/user' % (self.protocol, self.domain),
+        graph_url = flat_url(self.api_url + '/user',
                              access_token=access_token)
         graph_headers = dict(Accept='application/vnd.github.v3+json')
-        r = requests.get(graph_url, headers=graph_headers)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
+        r = yield HTTPRequest('GET', graph_url, headers=graph_headers)
+        check_response(r)
         data = r.json()
 
         profile = {}
@@ -159,8 +130,4 @@ class GithubProvider(object):
         if 'email' in data:
             profile['emails'] = [{'value': data['email']}]
 
-        cred = {'oauthAccessToken': access_token}
-        return GithubAuthenticationComplete(profile=profile,
-                                            credentials=cred,
-                                            provider_name=self.name,
-                                            provider_type=self.type)
+        yield profile
@@ -2,14 +2,13 @@ from __future__ import absolute_import
 
 from openid.extensions import ax
 
-import requests
-from requests_oauthlib import OAuth1
-
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from ..api import register_provider
-from ..compat import parse_qsl
+from ..exceptions import ThirdPartyFailure
 
+from .oauth1 import OAuth1Signer
+from .oauth1 import access_token_flow
 from .oid_extensions import OAuthRequest
 from .oid_extensions import UIRequest
 from .openid import (
@@ -49,7 +48,9 @@ def add_google_login(config,
                      scope=None,
                      login_path='/login/google',
                      callback_path='/login/google/callback',
-                     name='google'):
+                     name='google',
+                     http=None,
+                     callback_url=None):
     """
     Add a Google login provider to the application using the OpenID+OAuth
     hybrid protocol.  This protocol can be configured for purely
@@ -65,6 +66,7 @@ def add_google_login(config,
       + ``consumer_key``
       + ``consumer_secret``
       + ``scope``
+      + ``http``
     """
     provider = GoogleConsumer(
         name,
@@ -73,7 +75,9 @@ def add_google_login(config,
         storage,
         consumer_key,
         consumer_secret,
-        scope)
+        scope,
+        http,
+        callback_url=callback_url)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -86,12 +90,14 @@ def add_google_login(config,
     register_provider(config, name, provider)
 
 class GoogleConsumer(OpenIDConsumer):
+    fixed_identifier = True
     openid_attributes = [
         'country', 'email', 'first_name', 'last_name', 'language',
     ]
 
     def __init__(self, name, attrs=None, realm=None, storage=None,
-                 oauth_key=None, oauth_secret=None, oauth_scope=None):
+                 oauth_key=None, oauth_secret=None, oauth_scope=None,
+                 http=None, callback_url=None):
         """Handle Google Auth
 
         This also handles making an OAuth request during the OpenID
@@ -99,10 +105,12 @@ class GoogleConsumer(OpenIDConsumer):
 
         """
         OpenIDConsumer.__init__(self, name, 'google_hybrid', realm, storage,
-                                context=GoogleAuthenticationComplete)
+                                context=GoogleAuthenticationComplete,
+                                callback_url=callback_url, http=http)
         self.oauth_key = oauth_key
         self.oauth_secret = oauth_secret
         self.oauth_scope = oauth_scope
+        self.signer = OAuth1Signer(oauth_key, oauth_secret)
         if attrs is not None:
             self.openid_attributes = attrs
 
@@ -151,16 +159,12 @@ class GoogleConsumer(OpenIDConsumer):
         if self.oauth_key is None:
             return
 
-        # setup oauth for general api calls
-        oauth = OAuth1(
-            self.oauth_key,
-            client_secret=self.oauth_secret,
-            resource_owner_key=credentials['oauthAccessToken'],
-            resource_owner_secret=credentials['oauthAccessTokenSecret'])
-
         profile_url = \
             'https://www-opensocial.googleusercontent.com/api/people/@me/@self'
-        resp = requests.get(profile_url, auth=oauth)
+        resp = self.http.send(self.signer.request(
+            'GET', profile_url,
+            credentials['oauthAccessToken'],
+            credentials['oauthAccessTokenSecret']))
         if resp.status_code != 200:
             return
         data = resp.json()
@@ -172,18 +176,12 @@ class GoogleConsumer(OpenIDConsumer):
 
     def _get_access_token(self, request_token):
         """Retrieve the access token if OAuth hybrid was used"""
-        oauth = OAuth1(
-            self.oauth_key,
-            client_secret=self.oauth_secret,
-            resource_owner_key=request_token)
-
-        resp = requests.post(GOOGLE_OAUTH, auth=oauth)
-        if resp.status_code != 200:
-            log.error(
-                'OAuth token validation failed. Status: %d, Content: %s',
-                resp.status_code, resp.content)
+        try:
+            access_token = self.http.run(access_token_flow(
+                self.signer, GOOGLE_OAUTH, request_token))
+        except ThirdPartyFailure as e:
+            log.error('OAuth token validation failed. %s', e)
         else:
-            access_token = dict(parse_qsl(resp.text))
             return {
                 'oauthAccessToken': access_token['oauth_token'],
                 'oauthAccessTokenSecret': access_token['oauth_token_secret'],
@@ -1,22 +1,16 @@
-import uuid
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import CSRFError
-from ..exceptions import ThirdPartyFailure
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 GOOGLE_OAUTH2_DOMAIN = 'accounts.google.com'
+GOOGLE_JWKS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
 
 
 class GoogleAuthenticationComplete(AuthenticationComplete):
@@ -46,6 +40,10 @@ def add_google_login_from_settings(config, prefix='velruse.google.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update('verify_id_token')
+    p.update_http()
     config.add_google_oauth2_login(**p.kwargs)
 
 def add_google_login(config,
@@ -54,16 +52,29 @@ def add_google_login(config,
                      scope=None,
                      login_path='/login/google',
                      callback_path='/login/google/callback',
-                     name='google'):
+                     name='google',
+                     http=None,
+                     callback_url=None,
+                     lazy_profile=False,
+                     verify_id_token=False):
     """
     Add a Google login provider to the application supporting the new
     OAuth2 protocol.
+
+    With ``verify_id_token`` the profile is read from the ID token of the
+    access token response, verified against Google's published keys,
+    instead of being requested from the userinfo endpoint. This requires
+    the ``cryptography`` package.
     """
     provider = GoogleOAuth2Provider(
         name,
         consumer_key,
         consumer_secret,
-        scope)
+        scope,
+        http,
+        callback_url=callback_url,
+        lazy_profile=lazy_profile,
+        verify_id_token=verify_id_token)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -75,89 +86,93 @@ def add_google_login(config,
 
     register_provider(config, name, provider)
 
-class GoogleOAuth2Provider(object):
+class GoogleOAuth2Provider(OAuth2Provider):
+    type = 'google_oauth2'
+    context = GoogleAuthenticationComplete
+    authorize_url = 'https://%s/o/oauth2/auth' % GOOGLE_OAUTH2_DOMAIN
+    access_token_url = 'https://%s/o/oauth2/token' % GOOGLE_OAUTH2_DOMAIN
+    profile_url = 'https://www.googleapis.com/oauth2/v1/userinfo'
+    jwks_url = GOOGLE_JWKS_URL
+    issuers = GOOGLE_ISSUERS
 
     profile_scope = 'https://www.googleapis.com/auth/userinfo.profile'
     email_scope = 'https://www.googleapis.com/auth/userinfo.email'
+    default_scope = ' '.join((profile_scope, email_scope))
 
     def __init__(self,
                  name,
                  consumer_key,
                  consumer_secret,
-                 scope):
-        self.name = name
-        self.type = 'google_oauth2'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
+                 scope,
+                 http=None,
+                 callback_url=None,
+                 lazy_profile=False,
+                 verify_id_token=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
         self.protocol = 'https'
         self.domain = GOOGLE_OAUTH2_DOMAIN
 
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
+        self.jwks = None
+        if verify_id_token:
+            # imported on demand as it loads the cryptography package
+            from ..idtoken import get_jwks_cache
+            self.jwks = get_jwks_cache(self.jwks_url)
 
-        self.scope = scope
-        if not self.scope:
-            self.scope = ' '.join((self.profile_scope, self.email_scope))
-
-    def login(self, request):
-        """Initiate a google login"""
+    def login_scope(self, request):
         scope = ' '.join(request.POST.getall('scope')) or self.scope
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-
-        approval_prompt = request.POST.get('approval_prompt', 'auto')
-
-        auth_url = flat_url(
-            '%s://%s/o/oauth2/auth' % (self.protocol, self.domain),
-            scope=scope,
-            response_type='code',
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            approval_prompt=approval_prompt,
-            access_type='offline',
-            state=state)
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the google redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason=reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        r = requests.post(
-            '%s://%s/o/oauth2/token' % (self.protocol, self.domain),
-            dict(client_id=self.consumer_key,
-                 client_secret=self.consumer_secret,
-                 redirect_uri=request.route_url(self.callback_route),
-                 code=code,
-                 grant_type='authorization_code'),
-        )
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        token_data = r.json()
-        access_token = token_data['access_token']
-        refresh_token = token_data.get('refresh_token')
+        if self.jwks is not None and 'openid' not in scope.split():
+            # the ID token is only returned for the openid scope
+            scope = 'openid ' + scope
+        return scope
+
+    def static_authorize_params(self):
+        params = OAuth2Provider.static_authorize_params(self)
+        params['access_type'] = 'offline'
+        return params
+
+    def authorize_params(self, request):
+        params = OAuth2Provider.authorize_params(self, request)
+        params['approval_prompt'] = request.POST.get('approval_prompt',
+                                                     'auto')
+        return params
+
+    def id_token_flow(self, id_token):
+        """Flow verifying ``id_token`` and returning its claims"""
+        from ..idtoken import parse_id_token
+        from ..idtoken import verify_id_token
+        header = parse_id_token(id_token)[0]
+        keys = yield self.jwks.keys_flow(header.get('kid'))
+        yield verify_id_token(id_token, keys, self.consumer_key, self.issuers)
+
+    def claims_profile(self, claims):
+        """Normalize the claims of a verified ID token"""
+        email = claims.get('email')
+        profile = {
+            'accounts': [{
+                'domain': self.domain,
+                'username': email,
+                'userid': claims['sub'],
+            }],
+            'displayName': claims.get('name', email),
+        }
+        if email:
+            profile['preferredUsername'] = email
+            profile['emails'] = [{'value': email}]
+            if claims.get('email_verified') in (True, 'true'):
+                profile['verifiedEmail'] = email
+        return profile
+
+    def profile_flow(self, token_data):
+        if self.jwks is not None and 'id_token' in token_data:
+            claims = yield self.id_token_flow(token_data['id_token'])
+            yield self.claims_profile(claims)
+            return
 
         # Retrieve profile data if scopes allow
         profile = {}
-        user_url = flat_url(
-            '%s://www.googleapis.com/oauth2/v1/userinfo' % self.protocol,
-            access_token=access_token)
-        r = requests.get(user_url)
+        r = yield self.profile_request(token_data)
 
         if r.status_code == 200:
             data = r.json()
@@ -173,10 +188,8 @@ class GoogleOAuth2Provider(object):
             profile['preferredUsername'] = data['email']
             profile['verifiedEmail'] = data['email']
             profile['emails'] = [{'value': data['email']}]
+        yield profile
 
-        cred = {'oauthAccessToken': access_token,
-                'oauthRefreshToken': refresh_token}
-        return GoogleAuthenticationComplete(profile=profile,
-                                            credentials=cred,
-                                            provider_name=self.name,
-                                            provider_type=self.type)
+    def credentials(self, token_data):
+        return {'oauthAccessToken': token_data['access_token'],
+                'oauthRefreshToken': token_data.get('refresh_token')}
@@ -1,17 +1,18 @@
 """Last.fm Authentication Views"""
+from functools import partial
 from hashlib import md5
 
 from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
     AuthenticationDenied,
     register_provider,
 )
 from ..exceptions import ThirdPartyFailure
+from ..http import check_response
+from ..http import make_http_client
 from ..settings import ProviderSettings
 from ..utils import flat_url
 
@@ -35,6 +36,7 @@ def add_lastfm_login_from_settings(config, prefix='velruse.lastfm.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update_http()
     config.add_lastfm_login(**p.kwargs)
 
 
@@ -43,11 +45,12 @@ def add_lastfm_login(config,
                      consumer_secret,
                      login_path='/lastfm/login',
                      callback_path='/lastfm/login/callback',
-                     name='lastfm'):
+                     name='lastfm',
+                     http=None):
     """
     Add a Last.fm login provider to the application.
     """
-    provider = LastfmProvider(name, consumer_key, consumer_secret)
+    provider = LastfmProvider(name, consumer_key, consumer_secret, http)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -61,11 +64,12 @@ def add_lastfm_login(config,
 
 
 class LastfmProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
+    def __init__(self, name, consumer_key, consumer_secret, http=None):
         self.name = name
         self.type = 'lastfm'
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
+        self.http = make_http_client(http, name)
 
         self.login_route = 'velruse.%s-login' % name
         self.callback_route = 'velruse.%s-callback' % name
@@ -87,7 +91,10 @@ class LastfmProvider(object):
             return AuthenticationDenied(reason,
                                         provider_name=self.name,
                                         provider_type=self.type)
+        return self.http.call(partial(self.complete, token))
 
+    def complete(self, token):
+        """Retrieve the session and the profile of ``token``"""
         # Now establish a session with the token
         params = {
             'method': 'auth.getSession',
@@ -96,10 +103,8 @@ class LastfmProvider(object):
         }
         signed_params = sign_call(params, self.consumer_secret)
         session_url = flat_url(API_BASE, format='json', **signed_params)
-        r = requests.get(session_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
+        r = self.http.get(session_url)
+        check_response(r)
         data = r.json()
 
         session = data['session']
@@ -110,10 +115,8 @@ class LastfmProvider(object):
         # Fetch the user data
         user_url = flat_url(API_BASE, format='json', method='user.getInfo',
                             user=session['name'], api_key=self.consumer_key)
-        r = requests.get(user_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
+        r = self.http.get(user_url)
+        check_response(r)
         data = r.json()['user']
         profile = {
             'displayName': data['name'],
@@ -149,7 +152,7 @@ class LastfmProvider(object):
 
 def sign_call(params, secret):
     pairs = ['%s%s' % (k, params[k]) for k in sorted(params)]
-    api_sig = md5(''.join(pairs) + secret).hexdigest()
+    api_sig = md5((''.join(pairs) + secret).encode('utf-8')).hexdigest()
     signed_params = params.copy()
     signed_params['api_sig'] = api_sig
     return signed_params
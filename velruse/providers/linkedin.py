@@ -1,19 +1,13 @@
 """LinkedIn Authentication Views"""
-import requests
-from requests_oauthlib import OAuth1
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import ThirdPartyFailure
+from ..http import check_response
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth1 import OAuth1Provider
 
 
 REQUEST_URL = 'https://api.linkedin.com/uas/oauth/requestToken'
@@ -38,6 +32,10 @@ def add_linkedin_login_from_settings(config, prefix='velruse.linkedin.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
+    p.update_prefetch()
     config.add_linkedin_login(**p.kwargs)
 
 
@@ -46,11 +44,17 @@ def add_linkedin_login(config,
                        consumer_secret,
                        login_path='/login/linkedin',
                        callback_path='/login/linkedin/callback',
-                       name='linkedin'):
+                       name='linkedin',
+                       http=None,
+                       prefetch=None,
+                       callback_url=None,
+                       lazy_profile=False):
     """
     Add a Last.fm login provider to the application.
     """
-    provider = LinkedInProvider(name, consumer_key, consumer_secret)
+    provider = LinkedInProvider(name, consumer_key, consumer_secret, http,
+                                prefetch, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -63,82 +67,27 @@ def add_linkedin_login(config,
     register_provider(config, name, provider)
 
 
-class LinkedInProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.type = 'linked_in'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a LinkedIn login"""
-        # grab the initial request token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            callback_uri=request.route_url(self.callback_route))
-        resp = requests.post(REQUEST_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        request_token = dict(parse_qsl(resp.text))
-
-        # store the token for later
-        request.session['velruse.token'] = request_token
-
-        # redirect the user to authorize the app
-        auth_url = flat_url(AUTH_URL, oauth_token=request_token['oauth_token'])
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the LinkedIn redirect"""
-        if 'denied' in request.GET:
-            return AuthenticationDenied("User denied authentication",
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        verifier = request.GET.get('oauth_verifier')
-        if not verifier:
-            raise ThirdPartyFailure("No oauth_verifier returned")
-
-        request_token = request.session.pop('velruse.token')
-
-        # turn our request token into an access token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=request_token['oauth_token'],
-            resource_owner_secret=request_token['oauth_token_secret'],
-            verifier=verifier)
-        resp = requests.post(ACCESS_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        access_token = dict(parse_qsl(resp.text))
-        creds = {
-            'oauthAccessToken': access_token['oauth_token'],
-            'oauthAccessTokenSecret': access_token['oauth_token_secret'],
-        }
+class LinkedInProvider(OAuth1Provider):
+    type = 'linked_in'
+    context = LinkedInAuthenticationComplete
+    request_token_url = REQUEST_URL
+    authorize_url = AUTH_URL
+    access_token_url = ACCESS_URL
 
-        # setup oauth for general api calls
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=creds['oauthAccessToken'],
-            resource_owner_secret=creds['oauthAccessTokenSecret'])
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 prefetch=None, callback_url=None, lazy_profile=False):
+        OAuth1Provider.__init__(self, name, consumer_key, consumer_secret,
+                                http, prefetch, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
 
+    def profile_flow(self, access_token):
         profile_url = 'http://api.linkedin.com/v1/people/~'
         profile_url += (':(first-name,last-name,id,date-of-birth,picture-url,'
                         'email-address)')
         profile_url += '?format=json'
 
-        resp = requests.get(profile_url, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
+        resp = yield self.signed_request('GET', profile_url, access_token)
+        check_response(resp)
         data = resp.json()
 
         # Setup the normalized contact info
@@ -158,7 +107,4 @@ class LinkedInProvider(object):
             'domain': 'linkedin.com',
             'userid': data['id']
         }]
-        return LinkedInAuthenticationComplete(profile=profile,
-                                              credentials=creds,
-                                              provider_name=self.name,
-                                              provider_type=self.type)
+        yield profile
@@ -1,19 +1,15 @@
 """Live Authentication Views"""
 import datetime
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
 from ..exceptions import ThirdPartyFailure
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class LiveAuthenticationComplete(AuthenticationComplete):
@@ -34,6 +30,9 @@ def add_live_login_from_settings(config, prefix='velruse.live.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_live_login(**p.kwargs)
 
 
@@ -43,11 +42,16 @@ def add_live_login(config,
                    scope=None,
                    login_path='/login/live',
                    callback_path='/login/live/callback',
-                   name='live'):
+                   name='live',
+                   http=None,
+                   callback_url=None,
+                   lazy_profile=False):
     """
     Add a Live login provider to the application.
     """
-    provider = LiveProvider(name, consumer_key, consumer_secret, scope)
+    provider = LiveProvider(name, consumer_key, consumer_secret, scope,
+                            http, callback_url=callback_url,
+                            lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -60,72 +64,30 @@ def add_live_login(config,
     register_provider(config, name, provider)
 
 
-class LiveProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = 'live'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a Live login"""
-        scope = request.POST.get('scope', self.scope or
-                                 'wl.basic wl.emails wl.signin')
-        fb_url = flat_url('https://login.live.com/oauth20_authorize.srf', scope=scope,
-                          client_id=self.consumer_key,
-                          redirect_uri=request.route_url(self.callback_route),
-                          response_type="code")
-        return HTTPFound(location=fb_url)
-
-    def callback(self, request):
-        """Process the Live redirect"""
+class LiveProvider(OAuth2Provider):
+    type = 'live'
+    context = LiveAuthenticationComplete
+    authorize_url = 'https://login.live.com/oauth20_authorize.srf'
+    access_token_url = 'https://login.live.com/oauth20_token.srf'
+    profile_url = 'https://apis.live.net/v5.0/me'
+    default_scope = 'wl.basic wl.emails wl.signin'
+    use_state = False
+    denied_param = 'error_reason'
+
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def denied(self, request):
         if 'error' in request.GET:
             raise ThirdPartyFailure(request.GET.get('error_description',
                                     'No reason provided.'))
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_reason', 'No reason provided.')
-            return AuthenticationDenied(reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        access_url = 'https://login.live.com/oauth20_token.srf'
-        access_data = {
-            "client_id": self.consumer_key,
-            "client_secret": self.consumer_secret,
-            "redirect_uri": request.route_url(self.callback_route),
-            "grant_type": "authorization_code",
-            "code": code
-        }
-        r = requests.post(access_url, data=access_data)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = r.json()
-        access_token = data['access_token']
-
-        # Retrieve profile data
-        graph_url = flat_url('https://apis.live.net/v5.0/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        live_profile = r.json()
-        profile = extract_live_data(live_profile)
-
-        cred = {'oauthAccessToken': access_token}
-        if 'refresh_token' in data:
-            cred['oauthRefreshToken'] = data['refresh_token']
-        return LiveAuthenticationComplete(profile=profile,
-                                          credentials=cred,
-                                          provider_name=self.name,
-                                          provider_type=self.type)
+        return OAuth2Provider.denied(self, request)
+
+    def extract_profile(self, data, token_data):
+        return extract_live_data(data)
 
 
 def extract_live_data(data):
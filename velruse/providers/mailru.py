@@ -4,21 +4,17 @@ You may see developer docs on http://api.mail.ru/docs/guides/oauth/
 """
 import hashlib
 import re
-import uuid
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import CSRFError, ThirdPartyFailure
+from ..http import HTTPRequest
 from ..settings import ProviderSettings
 from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 PROVIDER_NAME = 'mailru'
@@ -57,6 +53,9 @@ def add_mailru_login_from_settings(config, prefix='velruse.mailru.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_mailru_login(**p.kwargs)
 
 
@@ -67,10 +66,15 @@ def add_mailru_login(
     scope=None,
     login_path='/login/{name}'.format(name=PROVIDER_NAME),
     callback_path='/login/{name}/callback'.format(name=PROVIDER_NAME),
-    name=PROVIDER_NAME
+    name=PROVIDER_NAME,
+    http=None,
+    callback_url=None,
+    lazy_profile=False
 ):
     """Add a MailRu login provider to the application."""
-    provider = MailRuProvider(name, consumer_key, consumer_secret, scope)
+    provider = MailRuProvider(name, consumer_key, consumer_secret, scope,
+                              http, callback_url=callback_url,
+                              lazy_profile=lazy_profile)
     config.add_route(provider.login_route, login_path)
     config.add_view(
         provider,
@@ -86,69 +90,21 @@ def add_mailru_login(
     register_provider(config, name, provider)
 
 
-class MailRuProvider(object):
-
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = PROVIDER_NAME
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.{name}-login'.format(name=name)
-        self.callback_route = 'velruse.{name}-callback'.format(name=name)
-
-    def login(self, request):
-        """Initiate a MailRu login"""
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-        auth_url = flat_url(
-            PROVIDER_AUTH_URL,
-            scope=self.scope,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            response_type='code',
-            state=state)
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the MailRu redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(
-                reason=reason,
-                provider_name=self.name,
-                provider_type=self.type
-            )
-        # Now retrieve the access token with the code
-        access_params = dict(
-            grant_type='authorization_code',
-            code=code,
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-        )
-        r = requests.post(PROVIDER_ACCESS_TOKEN_URL, access_params)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        data = r.json()
-        access_token = data['access_token']
-
-        # Retrieve profile data.
+class MailRuProvider(OAuth2Provider):
+    type = PROVIDER_NAME
+    context = MailRuAuthenticationComplete
+    authorize_url = PROVIDER_AUTH_URL
+    access_token_url = PROVIDER_ACCESS_TOKEN_URL
+    profile_url = PROVIDER_USER_PROFILE_URL
+
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def profile_request(self, token_data):
+        access_token = token_data['access_token']
 
         # Mail.ru API requires a special parameter 'sig' which must be composed
         # by the following sequence
@@ -162,7 +118,7 @@ class MailRuProvider(object):
                 method=PROVIDER_USER_PROFILE_API_METHOD,
                 access_token=access_token,
                 secret_key=self.consumer_secret
-            )
+            ).encode('utf-8')
         ).hexdigest()
 
         # Read more about the following params on
@@ -175,22 +131,19 @@ class MailRuProvider(object):
             session_key=access_token,
             secure=1
         )
-        r = requests.get(profile_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        profile = r.json()[0]
-        profile = extract_normalize_mailru_data(profile)
-        cred = {'oauthAccessToken': access_token}
-        return MailRuAuthenticationComplete(
-            profile=profile,
-            credentials=cred,
-            provider_name=self.name,
-            provider_type=self.type
-        )
+        return HTTPRequest('GET', profile_url)
+
+    def eager_profile(self, token_data):
+        # the user id is returned along with the access token
+        if 'x_mailru_vid' not in token_data:
+            return {}
+        return {
+            'accounts': [{'domain': PROVIDER_DOMAIN,
+                          'userid': token_data['x_mailru_vid']}],
+        }
+
+    def extract_profile(self, data, token_data):
+        return extract_normalize_mailru_data(data[0])
 
 
 def extract_normalize_mailru_data(data):
@@ -298,7 +251,7 @@ def extract_normalize_mailru_data(data):
         profile['addresses'].append(address)
 
     # Now strip out empty values
-    for k, v in profile.items():
+    for k, v in list(profile.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del profile[k]
 
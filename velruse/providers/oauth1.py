@@ -0,0 +1,370 @@
+"""Common implementation of the OAuth 1.0a flow.
+
+Requests are signed with HMAC-SHA1 by an :class:`OAuth1Signer` which is
+created once per provider and keeps the consumer side of the signing key
+precomputed. The signature is returned as an ``Authorization`` header so
+that the signed requests can be performed by any flow driver.
+
+"""
+import base64
+from collections import deque
+from functools import partial
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+
+from pyramid.httpexceptions import HTTPFound
+
+from ..api import (
+    AuthenticationComplete,
+    AuthenticationDenied,
+    LazyProfile,
+)
+from ..compat import (
+    TEXT,
+    parse_qsl,
+    quote,
+    urlsplit,
+)
+from ..exceptions import ThirdPartyFailure
+from ..http import HTTPRequest
+from ..http import check_response
+from ..http import make_http_client
+from ..utils import CallbackURL
+from ..utils import flat_url
+
+
+log = __import__('logging').getLogger(__name__)
+
+
+def escape(value):
+    """Percent encode ``value`` as required by RFC 5849"""
+    if not isinstance(value, TEXT):
+        value = str(value)
+    return quote(value.encode('utf-8'), safe='~')
+
+
+def base_string_uri(url):
+    """Return the base string URI and the query parameters of ``url``"""
+    scheme, netloc, path, query, _ = urlsplit(url)
+    scheme = scheme.lower()
+    netloc = netloc.lower()
+    if ((scheme == 'http' and netloc.endswith(':80')) or
+            (scheme == 'https' and netloc.endswith(':443'))):
+        netloc = netloc.rsplit(':', 1)[0]
+    uri = '%s://%s%s' % (scheme, netloc, path or '/')
+    return uri, parse_qsl(query, keep_blank_values=True)
+
+
+class OAuth1Signer(object):
+    """Sign requests on behalf of a single OAuth 1.0a consumer.
+
+    :meth:`sign` returns the headers to add to the request.
+    """
+    signature_method = 'HMAC-SHA1'
+
+    def __init__(self, consumer_key, consumer_secret):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.key_prefix = escape(consumer_secret) + '&'
+        self.consumer_params = [
+            ('oauth_consumer_key', consumer_key),
+            ('oauth_signature_method', self.signature_method),
+            ('oauth_version', '1.0'),
+        ]
+
+    def sign(self, method, url, token=None, token_secret=None, data=None,
+             nonce=None, timestamp=None, **oauth_params):
+        """Return the ``Authorization`` header of a request.
+
+        ``data`` are the form encoded parameters of the body, if any, as
+        a dict or a list of ``(name, value)`` pairs.
+        Extra protocol parameters such as ``callback`` or ``verifier``
+        are passed as keyword arguments without their ``oauth_`` prefix.
+        """
+        params = list(self.consumer_params)
+        params.append(('oauth_nonce', nonce or uuid.uuid4().hex))
+        params.append(('oauth_timestamp', timestamp or str(int(time.time()))))
+        if token is not None:
+            params.append(('oauth_token', token))
+        for k, v in oauth_params.items():
+            params.append(('oauth_' + k, v))
+
+        uri, query = base_string_uri(url)
+        if hasattr(data, 'items'):
+            data = data.items()
+        signed = query + list(data or ()) + params
+        # sorted by name then value, RFC 5849 section 3.4.1.3.2
+        normalized = '&'.join('%s=%s' % kv for kv in sorted(
+            (escape(k), escape(v)) for k, v in signed))
+        base = '&'.join((method.upper(), escape(uri), escape(normalized)))
+        key = self.key_prefix + escape(token_secret or '')
+        digest = hmac.new(key.encode('ascii'), base.encode('ascii'),
+                          hashlib.sha1).digest()
+        params.append(('oauth_signature',
+                       base64.b64encode(digest).decode('ascii')))
+        return {'Authorization': 'OAuth ' + ', '.join(
+            '%s="%s"' % (escape(k), escape(v)) for k, v in params)}
+
+    def request(self, method, url, token=None, token_secret=None, data=None,
+                **oauth_params):
+        """Return a signed :class:`~velruse.http.HTTPRequest`"""
+        headers = self.sign(method, url, token, token_secret, data,
+                            **oauth_params)
+        return HTTPRequest(method, url, data=data, headers=headers)
+
+
+def request_token_flow(signer, url, callback_url):
+    """Generator of the upstream request fetching a request token"""
+    r = yield signer.request('POST', url, callback=callback_url)
+    check_response(r)
+    yield dict(parse_qsl(r.text))
+
+
+def access_token_flow(signer, url, token, token_secret=None, verifier=None):
+    """Generator of the upstream request exchanging a request token for an
+    access token"""
+    oauth_params = {}
+    if verifier is not None:
+        oauth_params['verifier'] = verifier
+    r = yield signer.request('POST', url, token, token_secret, **oauth_params)
+    check_response(r)
+    yield dict(parse_qsl(r.text))
+
+
+class RequestTokenPool(object):
+    """A pool of unused request tokens fetched ahead of the logins.
+
+    Request tokens are bound to the callback URL they were requested with,
+    so a separate pool of up to ``size`` tokens is kept for each one. A
+    token is handed out at most once and is discarded if it has not been
+    used within ``ttl`` seconds.
+
+    ``fetch(callback_url)`` returns a new request token and is called in
+    the background by ``executor`` whenever a pool needs to be refilled.
+    The pool of a callback URL is first filled after its first login.
+
+    Unless it is configured, the callback URL depends on the host sent by
+    the client, so at most ``max_pools`` are kept: the logins to other
+    callback URLs fetch their token themselves.
+
+    """
+    def __init__(self, fetch, executor, size=2, ttl=300,
+                 max_pools=CallbackURL.max_entries, clock=time.time):
+        self.fetch = fetch
+        self.executor = executor
+        self.size = size
+        self.ttl = ttl
+        self.max_pools = max_pools
+        self.clock = clock
+        self.pools = {}
+        self.refilling = set()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.errors = 0
+
+    def get(self, callback_url):
+        """Return an unused request token or ``None`` if none is ready"""
+        now = self.clock()
+        token = None
+        with self.lock:
+            pool = self.pools.get(callback_url)
+            if pool is None:
+                if len(self.pools) >= self.max_pools:
+                    self.misses += 1
+                    return None
+                pool = self.pools[callback_url] = deque()
+            while pool:
+                expires, candidate = pool.popleft()
+                if expires > now:
+                    token = candidate
+                    break
+                self.expired += 1
+            if token is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.refill(callback_url)
+        return token
+
+    def refill(self, callback_url):
+        """Top up the pool of ``callback_url`` in the background"""
+        with self.lock:
+            if callback_url in self.refilling:
+                return
+            self.refilling.add(callback_url)
+        try:
+            self.executor.submit(self._refill, callback_url)
+        except Exception:
+            # the executor is shutting down
+            with self.lock:
+                self.refilling.discard(callback_url)
+
+    def _refill(self, callback_url):
+        try:
+            while True:
+                with self.lock:
+                    pool = self.pools[callback_url]
+                    if len(pool) >= self.size:
+                        return
+                try:
+                    token = self.fetch(callback_url)
+                except Exception:
+                    log.exception('failed to prefetch a request token for '
+                                  '%s', callback_url)
+                    with self.lock:
+                        self.errors += 1
+                    return
+                with self.lock:
+                    pool.append((self.clock() + self.ttl, token))
+        finally:
+            with self.lock:
+                self.refilling.discard(callback_url)
+
+    def stats(self):
+        """Return the pool metrics as a dict"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'errors': self.errors,
+                'available': sum(len(p) for p in self.pools.values()),
+            }
+
+
+class OAuth1Provider(object):
+    """Base class of the providers using the OAuth 1.0a flow.
+
+    The login view fetches a request token from :attr:`request_token_url`
+    and redirects the user to :attr:`authorize_url`. The callback exchanges
+    it at :attr:`access_token_url` and retrieves the profile with
+    :meth:`profile_flow`, on first access with ``lazy_profile``.
+
+    """
+    #: The provider type reported in the authentication result.
+    type = None
+
+    #: The :class:`~velruse.AuthenticationComplete` subclass returned
+    #: by the callback.
+    context = AuthenticationComplete
+
+    request_token_url = None
+    authorize_url = None
+    access_token_url = None
+
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 prefetch=None, callback_url=None, lazy_profile=False):
+        self.name = name
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.signer = OAuth1Signer(consumer_key, consumer_secret)
+        self.http = make_http_client(http, name)
+        self.lazy_profile = lazy_profile
+
+        self.token_pool = None
+        if prefetch and prefetch.get('size'):
+            self.token_pool = RequestTokenPool(self.fetch_request_token,
+                                               self.http.executor,
+                                               **prefetch)
+
+        self.login_route = 'velruse.%s-login' % name
+        self.callback_route = 'velruse.%s-callback' % name
+        self.callback_url = CallbackURL(self.callback_route, callback_url)
+
+    def redirect_uri(self, request):
+        return self.callback_url(request)
+
+    def fetch_request_token(self, callback_url):
+        """Fetch a new request token from the service"""
+        return self.http.run(request_token_flow(
+            self.signer, self.request_token_url, callback_url))
+
+    def get_request_token(self, request):
+        """Return an unused request token for the login ``request``
+
+        The token is taken from :attr:`token_pool` when prefetching is
+        enabled and a token is ready, otherwise it is fetched right away.
+        """
+        callback_url = self.redirect_uri(request)
+        if self.token_pool is not None:
+            token = self.token_pool.get(callback_url)
+            if token is not None:
+                return token
+        return self.fetch_request_token(callback_url)
+
+    def login(self, request):
+        """Initiate a login"""
+        # grab the initial request token
+        request_token = self.get_request_token(request)
+
+        # store the token for later
+        request.session['velruse.token'] = request_token
+
+        # redirect the user to authorize the app
+        auth_url = flat_url(self.authorize_url,
+                            oauth_token=request_token['oauth_token'])
+        return HTTPFound(location=auth_url)
+
+    def signed_request(self, method, url, access_token, **kw):
+        """Return an :class:`~velruse.http.HTTPRequest` to an API endpoint
+        signed with ``access_token``"""
+        return self.signer.request(method, url,
+                                   access_token['oauth_token'],
+                                   access_token['oauth_token_secret'], **kw)
+
+    def profile_flow(self, access_token):
+        """Generator of the upstream requests retrieving the profile"""
+        raise NotImplementedError
+
+    def eager_profile(self, access_token):
+        """Return the fields of the profile found in the access token
+        response, used by :attr:`lazy_profile` before the profile is
+        retrieved"""
+        return {}
+
+    def credentials(self, access_token):
+        return {
+            'oauthAccessToken': access_token['oauth_token'],
+            'oauthAccessTokenSecret': access_token['oauth_token_secret'],
+        }
+
+    def callback(self, request):
+        """Process the redirect from the service"""
+        return self.http.run(self.callback_flow(request))
+
+    def callback_flow(self, request):
+        """Generator of the upstream requests made by :meth:`callback`"""
+        if 'denied' in request.GET:
+            yield AuthenticationDenied("User denied authentication",
+                                       provider_name=self.name,
+                                       provider_type=self.type)
+            return
+
+        verifier = request.GET.get('oauth_verifier')
+        if not verifier:
+            raise ThirdPartyFailure("No oauth_verifier returned")
+
+        request_token = request.session.pop('velruse.token')
+
+        # turn our request token into an access token
+        access_token = yield access_token_flow(
+            self.signer, self.access_token_url,
+            request_token['oauth_token'],
+            request_token['oauth_token_secret'],
+            verifier)
+
+        if self.lazy_profile:
+            profile = LazyProfile(partial(self.profile_flow, access_token),
+                                  self.http, self.eager_profile(access_token))
+        else:
+            profile = yield self.profile_flow(access_token)
+        yield self.context(profile=profile,
+                           credentials=self.credentials(access_token),
+                           provider_name=self.name,
+                           provider_type=self.type)
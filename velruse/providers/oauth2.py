@@ -0,0 +1,232 @@
+"""Common implementation of the OAuth 2.0 authorization code flow.
+
+Providers describe the upstream service declaratively by subclassing
+:class:`OAuth2Provider` and setting its endpoint URLs and the format of
+the access token response. Where a service departs from the
+specification, the relevant step is overridden as a method.
+
+"""
+from functools import partial
+import uuid
+
+from pyramid.httpexceptions import HTTPFound
+
+from ..api import (
+    AuthenticationComplete,
+    AuthenticationDenied,
+    LazyProfile,
+)
+from ..compat import parse_qsl
+from ..exceptions import CSRFError
+from ..http import HTTPRequest
+from ..http import check_response
+from ..http import make_http_client
+from ..utils import CallbackURL
+from ..utils import URLTemplate
+from ..utils import flat_url
+
+
+class OAuth2Provider(object):
+    """Base class of the providers using the OAuth 2.0 code grant.
+
+    The login view redirects the user to :attr:`authorize_url`. The
+    callback exchanges the returned code at :attr:`access_token_url`,
+    fetches :attr:`profile_url` with the access token and normalizes the
+    result with :meth:`extract_profile`.
+
+    With ``lazy_profile`` the profile is only fetched when the
+    :class:`~velruse.LazyProfile` of the result is first read, beyond the
+    fields of :meth:`eager_profile`.
+
+    """
+    #: The provider type reported in the authentication result.
+    type = None
+
+    #: The :class:`~velruse.AuthenticationComplete` subclass returned
+    #: by the callback.
+    context = AuthenticationComplete
+
+    #: The URL the user is redirected to by the login view.
+    authorize_url = None
+
+    #: The URL the authorization code is exchanged at.
+    access_token_url = None
+
+    #: The HTTP method used to exchange the code, ``GET`` or ``POST``.
+    access_token_method = 'POST'
+
+    #: The format of the access token response, ``json`` or ``qs`` for
+    #: an urlencoded body.
+    access_token_format = 'json'
+
+    #: The URL the profile is fetched from. It receives the access token
+    #: in the ``access_token`` query parameter.
+    profile_url = None
+
+    #: The scope requested when none is configured.
+    default_scope = None
+
+    #: Protect the callback against CSRF with a ``state`` parameter kept
+    #: in the session.
+    use_state = True
+
+    #: The ``response_type`` and ``grant_type`` parameters, omitted from
+    #: the requests when ``None``.
+    response_type = 'code'
+    grant_type = 'authorization_code'
+
+    #: Send the ``redirect_uri`` parameter. Some services only accept
+    #: the callback URL registered with the application.
+    send_redirect_uri = True
+
+    #: The callback parameter holding the reason of a denied login.
+    denied_param = 'error'
+
+    def __init__(self, name, consumer_key, consumer_secret, scope=None,
+                 http=None, callback_url=None, lazy_profile=False):
+        self.name = name
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.scope = scope or self.default_scope
+        self.http = make_http_client(http, name)
+        self.lazy_profile = lazy_profile
+
+        self.login_route = 'velruse.%s-login' % name
+        self.callback_route = 'velruse.%s-callback' % name
+        self.callback_url = CallbackURL(self.callback_route, callback_url)
+        self.authorize_template = None
+
+    def redirect_uri(self, request):
+        return self.callback_url(request)
+
+    def login_scope(self, request):
+        return request.POST.get('scope', self.scope)
+
+    def static_authorize_params(self):
+        """Return the query parameters of the authorization URL that are
+        the same for every login"""
+        return {
+            'client_id': self.consumer_key,
+            'response_type': self.response_type,
+        }
+
+    def authorize_params(self, request):
+        """Return the query parameters of the authorization URL specific
+        to a login"""
+        params = {'scope': self.login_scope(request)}
+        if self.send_redirect_uri:
+            params['redirect_uri'] = self.redirect_uri(request)
+        if self.use_state:
+            request.session['velruse.state'] = params['state'] = \
+                uuid.uuid4().hex
+        return dict((k, v) for k, v in params.items() if v is not None)
+
+    def login(self, request):
+        """Initiate a login"""
+        template = self.authorize_template
+        if template is None:
+            # built on first use as subclasses may set authorize_url in
+            # their constructor
+            template = self.authorize_template = URLTemplate(
+                self.authorize_url, self.static_authorize_params(),
+                volatile=('state',))
+        url = template(**self.authorize_params(request))
+        return HTTPFound(location=url)
+
+    def check_state(self, request):
+        sess_state = request.session.pop('velruse.state', None)
+        req_state = request.GET.get('state')
+        if not sess_state or sess_state != req_state:
+            raise CSRFError(
+                'CSRF Validation check failed. Request state {req_state} is '
+                'not the same as session state {sess_state}'.format(
+                    req_state=req_state,
+                    sess_state=sess_state
+                )
+            )
+
+    def denied(self, request):
+        """Return the context of a login without an authorization code"""
+        reason = request.GET.get(self.denied_param, 'No reason provided.')
+        return AuthenticationDenied(reason=reason,
+                                    provider_name=self.name,
+                                    provider_type=self.type)
+
+    def access_token_request(self, request, code):
+        """Return the :class:`~velruse.http.HTTPRequest` exchanging
+        ``code`` for an access token"""
+        params = {
+            'client_id': self.consumer_key,
+            'client_secret': self.consumer_secret,
+            'code': code,
+        }
+        if self.grant_type is not None:
+            params['grant_type'] = self.grant_type
+        if self.send_redirect_uri:
+            params['redirect_uri'] = self.redirect_uri(request)
+        if self.access_token_method == 'GET':
+            return HTTPRequest('GET', flat_url(self.access_token_url,
+                                               **params))
+        return HTTPRequest(self.access_token_method, self.access_token_url,
+                           params)
+
+    def parse_access_token(self, response):
+        """Return the token data of an access token response as a dict"""
+        check_response(response)
+        if self.access_token_format == 'qs':
+            return dict(parse_qsl(response.text))
+        return response.json()
+
+    def profile_request(self, token_data):
+        return HTTPRequest('GET', flat_url(
+            self.profile_url, access_token=token_data['access_token']))
+
+    def extract_profile(self, data, token_data):
+        """Normalize the profile ``data`` returned by the service"""
+        raise NotImplementedError
+
+    def profile_flow(self, token_data):
+        """Generator of the upstream requests retrieving the profile"""
+        r = yield self.profile_request(token_data)
+        check_response(r)
+        yield self.extract_profile(r.json(), token_data)
+
+    def eager_profile(self, token_data):
+        """Return the fields of the profile found in the access token
+        response, used by :attr:`lazy_profile` before the profile is
+        retrieved"""
+        return {}
+
+    def credentials(self, token_data):
+        cred = {'oauthAccessToken': token_data['access_token']}
+        if 'refresh_token' in token_data:
+            cred['oauthRefreshToken'] = token_data['refresh_token']
+        return cred
+
+    def callback(self, request):
+        """Process the redirect from the service"""
+        return self.http.run(self.callback_flow(request))
+
+    def callback_flow(self, request):
+        """Generator of the upstream requests made by :meth:`callback`"""
+        if self.use_state:
+            self.check_state(request)
+        code = request.GET.get('code')
+        if not code:
+            yield self.denied(request)
+            return
+
+        # Now retrieve the access token with the code
+        r = yield self.access_token_request(request, code)
+        token_data = self.parse_access_token(r)
+
+        if self.lazy_profile:
+            profile = LazyProfile(partial(self.profile_flow, token_data),
+                                  self.http, self.eager_profile(token_data))
+        else:
+            profile = yield self.profile_flow(token_data)
+        yield self.context(profile=profile,
+                           credentials=self.credentials(token_data),
+                           provider_name=self.name,
+                           provider_type=self.type)
+
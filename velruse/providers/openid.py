@@ -1,8 +1,16 @@
 from __future__ import absolute_import
 
 import datetime
+from functools import partial
 import re
+import threading
 
+try:
+    from urllib.request import urlopen
+except ImportError:  # pragma: no cover Python < 3
+    from urllib2 import urlopen
+
+from openid import fetchers
 from openid.consumer import consumer
 from openid.extensions import ax
 from openid.extensions import sreg
@@ -20,9 +28,14 @@ from ..exceptions import (
     MissingParameter,
     ThirdPartyFailure,
 )
+from ..http import make_http_client
+from ..utils import CallbackURL
 
 log = __import__('logging').getLogger(__name__)
 
+# the HTTP client and deadline of the consumer fetching in this thread
+_limits = threading.local()
+
 # Setup our attribute objects that we'll be requesting
 ax_attributes = dict(
     nickname='http://axschema.org/namePerson/friendly',
@@ -76,6 +89,37 @@ class OpenIDAuthenticationComplete(AuthenticationComplete):
     """OpenID auth complete"""
 
 
+class TimeoutFetcher(fetchers.Urllib2Fetcher):
+    """A ``python-openid`` fetcher applying the timeout and deadline of the
+    consumer fetching"""
+
+    def urlopen(self, req):
+        http = getattr(_limits, 'http', None)
+        timeout = None
+        if http is not None:
+            timeout = http.timeout
+            if _limits.deadline is not None:
+                timeout = _limits.deadline.timeout(timeout)
+        if timeout is None:
+            return urlopen(req)
+        return urlopen(req, timeout=timeout)
+
+
+def install_timeout_fetcher():
+    """Make ``python-openid`` fetch with a :class:`TimeoutFetcher` unless
+    the application has set its own fetcher"""
+    current = fetchers.getDefaultFetcher()
+    current = getattr(current, 'fetcher', current)
+    if isinstance(current, TimeoutFetcher):
+        return
+    if type(current) in (fetchers.Urllib2Fetcher, fetchers.HTTPLib2Fetcher,
+                         fetchers.CurlHTTPFetcher):
+        fetchers.setDefaultFetcher(TimeoutFetcher())
+    else:
+        log.warning('the OpenID fetcher %r does not apply the timeouts of '
+                    'the providers', current)
+
+
 def includeme(config):
     config.add_directive('add_openid_login', add_openid_login)
 
@@ -85,15 +129,22 @@ def add_openid_login(config,
                      storage=None,
                      login_path='/login/openid',
                      callback_path='/login/openid/callback',
-                     name='openid'):
+                     name='openid',
+                     callback_url=None,
+                     http=None):
     """
     Add an OpenID login provider to the application.
 
     `storage` should be an object conforming to the
     `openid.store.interface.OpenIDStore` protocol. If left as `None` then
     the provider will run in a stateless mode.
+
+    `http` configures the timeouts and the circuit breaker of the
+    discovery and verification requests, see
+    :func:`velruse.http.make_http_client`.
     """
-    provider = OpenIDConsumer(name, 'openid', realm=realm, storage=storage)
+    provider = OpenIDConsumer(name, 'openid', realm=realm, storage=storage,
+                              callback_url=callback_url, http=http)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -112,20 +163,31 @@ class OpenIDConsumer(object):
     Providors using specialized OpenID based authentication subclass this.
 
     """
+    #: Whether the identifier is set by the provider rather than entered by
+    #: the user, in which case the failures of the discovery and
+    #: verification are reported to the circuit breaker of :attr:`http`.
+    fixed_identifier = False
+
     def __init__(self,
                  name,
                  _type,
                  realm=None,
                  storage=None,
-                 context=OpenIDAuthenticationComplete):
+                 context=OpenIDAuthenticationComplete,
+                 callback_url=None,
+                 http=None):
         self.openid_store = storage
         self.name = name
         self.type = _type
         self.context = context
         self.realm_override = realm
+        self.http = make_http_client(http, name)
+        if self.http.timeout is not None or self.http.deadline is not None:
+            install_timeout_fetcher()
 
         self.login_route = 'velruse.%s-url' % name
         self.callback_route = 'velruse.%s-callback' % name
+        self.callback_url = CallbackURL(self.callback_route, callback_url)
 
     def _get_realm(self, request):
         if self.realm_override is not None:
@@ -158,6 +220,23 @@ class OpenIDConsumer(object):
         )
         authrequest.addExtension(sreg_request)
 
+    def _upstream(self, func):
+        """Call ``func``, which may fetch documents from the provider,
+        within the time limits and through the circuit breaker of
+        :attr:`http`"""
+        def limited():
+            _limits.http = self.http
+            _limits.deadline = self.http.new_deadline()
+            try:
+                return func()
+            finally:
+                _limits.http = _limits.deadline = None
+        # the identifiers entered by the user may name any server, their
+        # failures say nothing of the health of the provider
+        return self.http.call(limited, errors=(consumer.DiscoveryFailure,
+                                               fetchers.HTTPFetchingError),
+                              guard=self.fixed_identifier)
+
     def _get_access_token(self, request_token):
         """Called to exchange a request token for the access token
 
@@ -185,7 +264,8 @@ class OpenIDConsumer(object):
 
         try:
             log.debug('About to try OpenID begin')
-            authrequest = oidconsumer.begin(openid_url)
+            authrequest = self._upstream(
+                partial(oidconsumer.begin, openid_url))
         except consumer.DiscoveryFailure:
             log.debug('OpenID begin DiscoveryFailure')
             raise
@@ -201,7 +281,7 @@ class OpenIDConsumer(object):
 
         realm = self._get_realm(request)
         # TODO: add a csrf check to the return_to URL
-        return_to = request.route_url(self.callback_route)
+        return_to = self.callback_url(request)
         request.session['velruse.openid_session'] = openid_session
 
         # OpenID 2.0 lets Providers request POST instead of redirect, this
@@ -234,8 +314,9 @@ class OpenIDConsumer(object):
 
         # Setup the consumer and parse the information coming back
         oidconsumer = consumer.Consumer(openid_session, self.openid_store)
-        return_to = request.route_url(self.callback_route)
-        info = oidconsumer.complete(request.params, return_to)
+        return_to = self.callback_url(request)
+        info = self._upstream(
+            partial(oidconsumer.complete, request.params, return_to))
 
         if info.status in [consumer.FAILURE, consumer.CANCEL]:
             return AuthenticationDenied("OpenID failure",
@@ -384,7 +465,7 @@ def extract_openid_data(identifier, sreg_resp, ax_resp):
         ud['thumbnailUrl'] = thumbnail
 
     # Now strip out empty values
-    for k, v in ud.items():
+    for k, v in list(ud.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del ud[k]
 
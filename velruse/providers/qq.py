@@ -1,20 +1,17 @@
 """QQ Authentication Views"""
 import json
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import ThirdPartyFailure
+from ..http import HTTPRequest
+from ..http import check_response
 from ..settings import ProviderSettings
 from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class QQAuthenticationComplete(AuthenticationComplete):
@@ -35,6 +32,9 @@ def add_qq_login_from_settings(config, prefix='velruse.qq.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_qq_login(**p.kwargs)
 
 
@@ -44,11 +44,16 @@ def add_qq_login(config,
                  scope=None,
                  login_path='/login/qq',
                  callback_path='/login/qq/callback',
-                 name='qq'):
+                 name='qq',
+                 http=None,
+                 callback_url=None,
+                 lazy_profile=False):
     """
     Add a QQ login provider to the application.
     """
-    provider = QQProvider(name, consumer_key, consumer_secret, scope)
+    provider = QQProvider(name, consumer_key, consumer_secret, scope,
+                          http, callback_url=callback_url,
+                          lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -61,57 +66,28 @@ def add_qq_login(config,
     register_provider(config, name, provider)
 
 
-class QQProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = 'qq'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a qq login"""
-        scope = request.POST.get('scope', self.scope)
-        gh_url = flat_url('https://graph.qq.com/oauth2.0/authorize',
-                          scope=scope,
-                          client_id=self.consumer_key,
-                          response_type='code',
-                          redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the qq redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            'https://graph.qq.com/oauth2.0/token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            grant_type='authorization_code',
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        access_token = dict(parse_qsl(r.text))['access_token']
-
-        # Retrieve profile data
-        graph_url = flat_url('https://graph.qq.com/oauth2.0/me',
-                             access_token=access_token)
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
+class QQProvider(OAuth2Provider):
+    type = 'qq'
+    context = QQAuthenticationComplete
+    authorize_url = 'https://graph.qq.com/oauth2.0/authorize'
+    access_token_url = 'https://graph.qq.com/oauth2.0/token'
+    access_token_method = 'GET'
+    access_token_format = 'qs'
+    profile_url = 'https://graph.qq.com/oauth2.0/me'
+    use_state = False
+
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def profile_flow(self, token_data):
+        access_token = token_data['access_token']
+
+        # Retrieve the openid of the user, then its profile data
+        r = yield self.profile_request(token_data)
+        check_response(r)
         data = json.loads(r.text[10:-3])
         openid = data.get('openid', '')
 
@@ -120,21 +96,16 @@ class QQProvider(object):
             access_token=access_token,
             oauth_consumer_key=self.consumer_key,
             openid=openid)
-        r = requests.get(user_info_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
+        r = yield HTTPRequest('GET', user_info_url)
+        check_response(r)
         data = r.json()
 
-        profile = {
+        yield {
             'accounts': [{'domain': 'qq.com', 'userid': openid}],
             'displayName': data['nickname'],
             'preferredUsername': data['nickname'],
             'data': data
         }
 
-        cred = {'oauthAccessToken': access_token}
-        return QQAuthenticationComplete(profile=profile,
-                                        credentials=cred,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
+    def credentials(self, token_data):
+        return {'oauthAccessToken': token_data['access_token']}
@@ -1,17 +1,12 @@
 """Renren Authentication Views"""
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import ThirdPartyFailure
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class RenrenAuthenticationComplete(AuthenticationComplete):
@@ -32,6 +27,9 @@ def add_renren_login_from_settings(config, prefix='velruse.renren.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_renren_login(**p.kwargs)
 
 
@@ -41,11 +39,16 @@ def add_renren_login(config,
                      scope='',
                      login_path='/login/renren',
                      callback_path='/login/renren/callback',
-                     name='renren'):
+                     name='renren',
+                     http=None,
+                     callback_url=None,
+                     lazy_profile=False):
     """
     Add a Renren login provider to the application.
     """
-    provider = RenrenProvider(name, consumer_key, consumer_secret, scope)
+    provider = RenrenProvider(name, consumer_key, consumer_secret, scope,
+                              http, callback_url=callback_url,
+                              lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -58,61 +61,33 @@ def add_renren_login(config,
     register_provider(config, name, provider)
 
 
-class RenrenProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = 'renren'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a renren login"""
-        scope = request.POST.get('scope', self.scope)
-        url = flat_url('https://graph.renren.com/oauth/authorize',
-                       scope=scope,
-                       client_id=self.consumer_key,
-                       response_type='code',
-                       redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(url)
-
-    def callback(self, request):
-        """Process the renren redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        access_url = flat_url(
-            'https://graph.renren.com/oauth/token',
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            grant_type='authorization_code',
-            redirect_uri=request.route_url(self.callback_route),
-            code=code)
-
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = r.json()
-        access_token = data['access_token']
-        profile = {
+class RenrenProvider(OAuth2Provider):
+    type = 'renren'
+    context = RenrenAuthenticationComplete
+    authorize_url = 'https://graph.renren.com/oauth/authorize'
+    access_token_url = 'https://graph.renren.com/oauth/token'
+    access_token_method = 'GET'
+    use_state = False
+
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def eager_profile(self, token_data):
+        # The user is returned along with the access token
+        user = token_data['user']
+        return {
             'accounts': [
-                {'domain': 'renren.com', 'userid': data['user']['id']},
+                {'domain': 'renren.com', 'userid': user['id']},
             ],
-            'displayName': data['user']['name'],
-            'preferredUsername': data['user']['name'],
+            'displayName': user['name'],
+            'preferredUsername': user['name'],
         }
 
-        cred = {'oauthAccessToken': access_token}
+    def profile_flow(self, token_data):
+        yield self.eager_profile(token_data)
 
-        return RenrenAuthenticationComplete(profile=profile,
-                                            credentials=cred,
-                                            provider_name=self.name,
-                                            provider_type=self.type)
+    def credentials(self, token_data):
+        return {'oauthAccessToken': token_data['access_token']}
@@ -2,19 +2,16 @@
 from hashlib import md5
 import time
 
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import ThirdPartyFailure
+from ..http import HTTPRequest
 from ..settings import ProviderSettings
 from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 class TaobaoAuthenticationComplete(AuthenticationComplete):
@@ -34,6 +31,9 @@ def add_taobao_login_from_settings(config, prefix='velruse.taobao.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_taobao_login(**p.kwargs)
 
 
@@ -42,11 +42,16 @@ def add_taobao_login(config,
                      consumer_secret,
                      login_path='/login/taobao',
                      callback_path='/login/taobao/callback',
-                     name='taobao'):
+                     name='taobao',
+                     http=None,
+                     callback_url=None,
+                     lazy_profile=False):
     """
     Add a Taobao login provider to the application.
     """
-    provider = TaobaoProvider(name, consumer_key, consumer_secret)
+    provider = TaobaoProvider(name, consumer_key, consumer_secret, http,
+                              callback_url=callback_url,
+                              lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -59,48 +64,25 @@ def add_taobao_login(config,
     register_provider(config, name, provider)
 
 
-class TaobaoProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.type = 'taobao'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a taobao login"""
-        gh_url = flat_url('https://oauth.taobao.com/authorize',
-                          client_id=self.consumer_key,
-                          response_type='code',
-                          redirect_uri=request.route_url(self.callback_route))
-        return HTTPFound(location=gh_url)
-
-    def callback(self, request):
-        """Process the taobao redirect"""
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(reason,
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-
-        # Now retrieve the access token with the code
-        r = requests.post(
-            'https://oauth.taobao.com/token',
-            dict(grant_type='authorization_code',
-                 client_id=self.consumer_key,
-                 client_secret=self.consumer_secret,
-                 redirect_uri=request.route_url(self.callback_route),
-                 code=code))
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = r.json()
-        access_token = data['access_token']
-
-        # Retrieve profile data
+class TaobaoProvider(OAuth2Provider):
+    type = 'taobao'
+    context = TaobaoAuthenticationComplete
+    authorize_url = 'https://oauth.taobao.com/authorize'
+    access_token_url = 'https://oauth.taobao.com/token'
+    profile_url = 'http://gw.api.taobao.com/router/rest'
+    use_state = False
+
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 callback_url=None,
+                 lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                http=http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def login_scope(self, request):
+        return None
+
+    def profile_request(self, token_data):
         params = {
             'method': 'taobao.user.get',
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
@@ -109,33 +91,37 @@ class TaobaoProvider(object):
             'v': '2.0',
             'sign_method': 'md5',
             'fields': 'user_id,nick',
-            'session': access_token,
+            'session': token_data['access_token'],
         }
         src = (
             self.consumer_secret
             + ''.join(["%s%s" % (k, v) for k, v in sorted(params.items())])
             + self.consumer_secret
         )
-        params['sign'] = md5(src).hexdigest().upper()
-        get_user_info_url = flat_url('http://gw.api.taobao.com/router/rest',
-                                     **params)
-        r = requests.get(get_user_info_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                r.status_code, r.content))
-        data = r.json()
+        params['sign'] = md5(src.encode('utf-8')).hexdigest().upper()
+        return HTTPRequest('GET', flat_url(self.profile_url, **params))
 
+    def eager_profile(self, token_data):
+        # the user is returned along with the access token
+        if 'taobao_user_id' not in token_data:
+            return {}
+        profile = {
+            'accounts': [{'domain': 'taobao.com',
+                          'userid': token_data['taobao_user_id']}],
+        }
+        if 'taobao_user_nick' in token_data:
+            profile['displayName'] = token_data['taobao_user_nick']
+            profile['preferredUsername'] = token_data['taobao_user_nick']
+        return profile
+
+    def extract_profile(self, data, token_data):
         username = data['user_get_response']['user']['nick']
         userid = data['user_get_response']['user']['user_id']
-
-        profile = {
+        return {
             'accounts': [{'domain': 'taobao.com', 'userid': userid}],
             'displayName': username,
             'preferredUsername': username,
         }
 
-        cred = {'oauthAccessToken': access_token}
-        return TaobaoAuthenticationComplete(profile=profile,
-                                            credentials=cred,
-                                            provider_name=self.name,
-                                            provider_type=self.type)
+    def credentials(self, token_data):
+        return {'oauthAccessToken': token_data['access_token']}
@@ -1,20 +1,12 @@
 """Twitter Authentication Views"""
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
-from requests_oauthlib import OAuth1
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..compat import parse_qsl
-from ..exceptions import ThirdPartyFailure
 from ..settings import ProviderSettings
-from ..utils import flat_url
+from .oauth1 import OAuth1Provider
 
 
 REQUEST_URL = 'https://api.twitter.com/oauth/request_token'
@@ -39,6 +31,10 @@ def add_twitter_login_from_settings(config, prefix='velruse.twitter.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
+    p.update_prefetch()
     config.add_twitter_login(**p.kwargs)
 
 
@@ -47,11 +43,17 @@ def add_twitter_login(config,
                       consumer_secret,
                       login_path='/login/twitter',
                       callback_path='/login/twitter/callback',
-                      name='twitter'):
+                      name='twitter',
+                      http=None,
+                      prefetch=None,
+                      callback_url=None,
+                      lazy_profile=False):
     """
     Add a Twitter login provider to the application.
     """
-    provider = TwitterProvider(name, consumer_key, consumer_secret)
+    provider = TwitterProvider(name, consumer_key, consumer_secret, http,
+                               prefetch, callback_url=callback_url,
+                               lazy_profile=lazy_profile)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login',
@@ -65,65 +67,20 @@ def add_twitter_login(config,
     register_provider(config, name, provider)
 
 
-class TwitterProvider(object):
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.type = 'twitter'
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-
-        self.login_route = 'velruse.%s-login' % name
-        self.callback_route = 'velruse.%s-callback' % name
-
-    def login(self, request):
-        """Initiate a Twitter login"""
-        # grab the initial request token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            callback_uri=request.route_url(self.callback_route))
-        resp = requests.post(REQUEST_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        request_token = dict(parse_qsl(resp.text))
-
-        # store the token for later
-        request.session['velruse.token'] = request_token
-
-        # redirect the user to authorize the app
-        auth_url = flat_url(AUTH_URL, oauth_token=request_token['oauth_token'])
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the Twitter redirect"""
-        if 'denied' in request.GET:
-            return AuthenticationDenied("User denied authentication",
-                                        provider_name=self.name,
-                                        provider_type=self.type)
-        verifier = request.GET.get('oauth_verifier')
-        if not verifier:
-            raise ThirdPartyFailure("No oauth_verifier returned")
-
-        request_token = request.session.pop('velruse.token')
-
-        # turn our request token into an access token
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=request_token['oauth_token'],
-            resource_owner_secret=request_token['oauth_token_secret'],
-            verifier=verifier)
-        resp = requests.post(ACCESS_URL, auth=oauth)
-        if resp.status_code != 200:
-            raise ThirdPartyFailure("Status %s: %s" % (
-                resp.status_code, resp.content))
-        access_token = dict(parse_qsl(resp.text))
-        creds = {
-            'oauthAccessToken': access_token['oauth_token'],
-            'oauthAccessTokenSecret': access_token['oauth_token_secret'],
-        }
+class TwitterProvider(OAuth1Provider):
+    type = 'twitter'
+    context = TwitterAuthenticationComplete
+    request_token_url = REQUEST_URL
+    authorize_url = AUTH_URL
+    access_token_url = ACCESS_URL
+
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 prefetch=None, callback_url=None, lazy_profile=False):
+        OAuth1Provider.__init__(self, name, consumer_key, consumer_secret,
+                                http, prefetch, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
 
+    def eager_profile(self, access_token):
         username = access_token['screen_name']
 
         # Setup the normalized contact info
@@ -135,14 +92,16 @@ class TwitterProvider(object):
         }]
         profile['displayName'] = username
         profile['preferredUsername'] = username
+        return profile
 
-        oauth = OAuth1(
-            self.consumer_key,
-            client_secret=self.consumer_secret,
-            resource_owner_key=access_token['oauth_token'],
-            resource_owner_secret=access_token['oauth_token_secret'])
-        resp = requests.get(DATA_URL % username, auth=oauth)
-        if resp.status_code == 200:
+    def profile_flow(self, access_token):
+        username = access_token['screen_name']
+        profile = self.eager_profile(access_token)
+
+        # the details are optional, the profile is complete without them
+        resp = yield self.signed_request('GET', DATA_URL % username,
+                                         access_token).optional('details')
+        if resp is not None and resp.status_code == 200:
             data = resp.json()
             if 'name' in data:
                 # replace display name with the full name
@@ -159,8 +118,4 @@ class TwitterProvider(object):
                 h = int(offset)
                 m = int(abs(offset - h) * 60)
                 profile['utcOffset'] = '{h:+03d}:{m:02d}'.format(h=h, m=m)
-
-        return TwitterAuthenticationComplete(profile=profile,
-                                             credentials=creds,
-                                             provider_name=self.name,
-                                             provider_type=self.type)
+        yield profile
@@ -4,22 +4,17 @@ VK is considered to be the #1 social network
 (with more than a 100 million active users) in Russia.
 You may see the developer docs at http://vk.com/developers.php#devstep2
 """
-import uuid
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import CSRFError, ThirdPartyFailure
+from ..http import HTTPRequest
 from ..settings import ProviderSettings
 from ..utils import flat_url
 from ..compat import u
+from .oauth2 import OAuth2Provider
 
 
 PROVIDER_NAME = 'vk'
@@ -51,6 +46,9 @@ def add_vk_login_from_settings(config, prefix='velruse.vk.'):
     p.update('scope')
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_vk_login(**p.kwargs)
 
 
@@ -61,10 +59,15 @@ def add_vk_login(
     scope=None,
     login_path='/login/{name}'.format(name=PROVIDER_NAME),
     callback_path='/login/{name}/callback'.format(name=PROVIDER_NAME),
-    name=PROVIDER_NAME
+    name=PROVIDER_NAME,
+    http=None,
+    callback_url=None,
+    lazy_profile=False
 ):
     """Add a VK login provider to the application."""
-    provider = VKProvider(name, consumer_key, consumer_secret, scope)
+    provider = VKProvider(name, consumer_key, consumer_secret, scope, http,
+                          callback_url=callback_url,
+                          lazy_profile=lazy_profile)
     config.add_route(provider.login_route, login_path)
     config.add_view(
         provider,
@@ -80,97 +83,45 @@ def add_vk_login(
     register_provider(config, name, provider)
 
 
-class VKProvider(object):
-
-    def __init__(self, name, consumer_key, consumer_secret, scope):
-        self.name = name
-        self.type = PROVIDER_NAME
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.scope = scope
-
-        self.login_route = 'velruse.{name}-login'.format(name=name)
-        self.callback_route = 'velruse.{name}-callback'.format(name=name)
-
-    def login(self, request):
-        """Initiate a VK login"""
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-        fb_url = flat_url(
-            PROVIDER_AUTH_URL,
-            scope=self.scope,
-            client_id=self.consumer_key,
-            redirect_uri=request.route_url(self.callback_route),
-            response_type='code',
-            state=state)
-        return HTTPFound(location=fb_url)
-
-    def callback(self, request):
-        """Process the VK redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error_description',
-                                     'No reason provided.')
-            return AuthenticationDenied(
-                reason=reason,
-                provider_name=self.name,
-                provider_type=self.type
-            )
-        # Now retrieve the access token with the code
-        access_url = flat_url(
-            PROVIDER_ACCESS_TOKEN_URL,
-            client_id=self.consumer_key,
-            client_secret=self.consumer_secret,
-            redirect_uri=request.route_url(self.callback_route),
-            code=code
-        )
-        r = requests.get(access_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        data = r.json()
-        access_token = data['access_token']
+class VKProvider(OAuth2Provider):
+    type = PROVIDER_NAME
+    context = VKAuthenticationComplete
+    authorize_url = PROVIDER_AUTH_URL
+    access_token_url = PROVIDER_ACCESS_TOKEN_URL
+    access_token_method = 'GET'
+    profile_url = PROVIDER_USER_PROFILE_URL
+    grant_type = None
+    denied_param = 'error_description'
 
-        # Retrieve profile data
+    def __init__(self, name, consumer_key, consumer_secret, scope,
+                 http=None, callback_url=None, lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                scope, http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def profile_request(self, token_data):
         graph_url = flat_url(
             PROVIDER_USER_PROFILE_URL,
-            access_token=access_token,
-            uids=data['user_id'],
+            access_token=token_data['access_token'],
+            uids=token_data['user_id'],
             fields=(
                 'first_name,last_name,nickname,domain,sex,bdate,city,country,'
                 'timezone,photo,photo_medium,photo_big,photo_rec,has_mobile,'
                 'mobile_phone,home_phone,rate,contacts,education'
             )
         )
-        r = requests.get(graph_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        vk_profile = r.json()['response'][0]
-        vk_profile['uid'] = data['user_id']
-        profile = extract_normalize_vk_data(vk_profile)
-        cred = {'oauthAccessToken': access_token}
-        return VKAuthenticationComplete(
-            profile=profile,
-            credentials=cred,
-            provider_name=self.name,
-            provider_type=self.type
-        )
+        return HTTPRequest('GET', graph_url)
+
+    def eager_profile(self, token_data):
+        return {
+            'accounts': [{'domain': 'vk.com',
+                          'userid': token_data['user_id']}],
+        }
+
+    def extract_profile(self, data, token_data):
+        vk_profile = data['response'][0]
+        vk_profile['uid'] = token_data['user_id']
+        return extract_normalize_vk_data(vk_profile)
 
 
 def extract_normalize_vk_data(data):
@@ -243,7 +194,7 @@ def extract_normalize_vk_data(data):
             })
 
     # Now strip out empty values
-    for k, v in profile.items():
+    for k, v in list(profile.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del profile[k]
 
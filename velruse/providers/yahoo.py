@@ -2,14 +2,13 @@ from __future__ import absolute_import
 
 from openid.extensions import ax
 
-import requests
-from requests_oauthlib import OAuth1
-
 from pyramid.security import NO_PERMISSION_REQUIRED
 
 from ..api import register_provider
-from ..compat import parse_qsl
+from ..exceptions import ThirdPartyFailure
 
+from .oauth1 import OAuth1Signer
+from .oauth1 import access_token_flow
 from .oid_extensions import OAuthRequest
 from .openid import (
     OpenIDAuthenticationComplete,
@@ -38,16 +37,19 @@ def add_yahoo_login(config,
                     consumer_secret=None,
                     login_path='/login/yahoo',
                     callback_path='/login/yahoo/callback',
-                    name='yahoo'):
+                    name='yahoo',
+                    http=None,
+                    callback_url=None):
     """
     Add a Yahoo login provider to the application.
 
     OpenID parameters: realm, storage
 
-    OAuth parameters: consumer_key, consumer_secret
+    OAuth parameters: consumer_key, consumer_secret, http
     """
     provider = YahooConsumer(name, realm, storage,
-                             consumer_key, consumer_secret)
+                             consumer_key, consumer_secret, http,
+                             callback_url=callback_url)
 
     config.add_route(provider.login_route, login_path)
     config.add_view(provider, attr='login', route_name=provider.login_route,
@@ -61,8 +63,11 @@ def add_yahoo_login(config,
 
 
 class YahooConsumer(OpenIDConsumer):
+    fixed_identifier = True
+
     def __init__(self, name, realm=None, storage=None,
-                 oauth_key=None, oauth_secret=None):
+                 oauth_key=None, oauth_secret=None, http=None,
+                 callback_url=None):
         """Handle Yahoo Auth
 
         This also handles making an OAuth request during the OpenID
@@ -70,9 +75,11 @@ class YahooConsumer(OpenIDConsumer):
 
         """
         OpenIDConsumer.__init__(self, name, 'yahoo', realm, storage,
-                                context=YahooAuthenticationComplete)
+                                context=YahooAuthenticationComplete,
+                                callback_url=callback_url, http=http)
         self.oauth_key = oauth_key
         self.oauth_secret = oauth_secret
+        self.signer = OAuth1Signer(oauth_key, oauth_secret)
 
     def _lookup_identifier(self, request, identifier):
         """Return the Yahoo OpenID directed endpoint"""
@@ -96,18 +103,12 @@ class YahooConsumer(OpenIDConsumer):
             authrequest.addExtension(oauth_request)
 
     def _get_access_token(self, request_token):
-        oauth = OAuth1(
-            self.oauth_key,
-            client_secret=self.oauth_secret,
-            resource_owner_key=request_token)
-
-        resp = requests.post(YAHOO_OAUTH, auth=oauth)
-        if resp.status_code != 200:
-            log.error(
-                'OAuth token validation failed. Status: %d, Content: %s',
-                resp.status_code, resp.content)
+        try:
+            access_token = self.http.run(access_token_flow(
+                self.signer, YAHOO_OAUTH, request_token))
+        except ThirdPartyFailure as e:
+            log.error('OAuth token validation failed. %s', e)
         else:
-            access_token = dict(parse_qsl(resp.text))
             return {
                 'oauthAccessToken': access_token['oauth_token'],
                 'oauthAccessTokenSecret': access_token['oauth_token_secret'],
@@ -2,21 +2,16 @@
 
 You may see developer docs at http://api.yandex.com/oauth/
 """
-import uuid
-
-from pyramid.httpexceptions import HTTPFound
 from pyramid.security import NO_PERMISSION_REQUIRED
 
-import requests
-
 from ..api import (
     AuthenticationComplete,
-    AuthenticationDenied,
     register_provider,
 )
-from ..exceptions import CSRFError, ThirdPartyFailure
+from ..http import HTTPRequest
 from ..settings import ProviderSettings
 from ..utils import flat_url
+from .oauth2 import OAuth2Provider
 
 
 PROVIDER_NAME = 'yandex'
@@ -42,6 +37,9 @@ def add_yandex_login_from_settings(config, prefix='velruse.yandex.'):
     p.update('consumer_secret', required=True)
     p.update('login_path')
     p.update('callback_path')
+    p.update('callback_url')
+    p.update('lazy_profile')
+    p.update_http()
     config.add_yandex_login(**p.kwargs)
 
 
@@ -51,10 +49,15 @@ def add_yandex_login(
     consumer_secret,
     login_path='/login/{name}'.format(name=PROVIDER_NAME),
     callback_path='/login/{name}/callback'.format(name=PROVIDER_NAME),
-    name=PROVIDER_NAME
+    name=PROVIDER_NAME,
+    http=None,
+    callback_url=None,
+    lazy_profile=False
 ):
     """Add a Yandex login provider to the application."""
-    provider = YandexProvider(name, consumer_key, consumer_secret)
+    provider = YandexProvider(name, consumer_key, consumer_secret, http,
+                              callback_url=callback_url,
+                              lazy_profile=lazy_profile)
     config.add_route(provider.login_route, login_path)
     config.add_view(
         provider,
@@ -70,92 +73,40 @@ def add_yandex_login(
     register_provider(config, name, provider)
 
 
-class YandexProvider(object):
-
-    def __init__(self, name, consumer_key, consumer_secret):
-        self.name = name
-        self.type = PROVIDER_NAME
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.login_route = 'velruse.{name}-login'.format(name=name)
-        # Yandex doesn't support redirect_uri and scope parameters in
-        # the query string.
-        # You must define the Callback URI and the Scope fields manually in
-        # application's settings page at https://oauth.yandex.ru/client/my
-        # The following attribute is left intact in order to preserve API
-        # consistency.
-        self.callback_route = 'velruse.{name}-callback'.format(name=name)
-
-    def login(self, request):
-        """Initiate a Yandex login"""
-        request.session['velruse.state'] = state = uuid.uuid4().hex
-        auth_url = flat_url(
-            PROVIDER_AUTH_URL,
-            client_id=self.consumer_key,
-            response_type='code',
-            state=state
-        )
-        return HTTPFound(location=auth_url)
-
-    def callback(self, request):
-        """Process the Yandex redirect"""
-        sess_state = request.session.pop('velruse.state', None)
-        req_state = request.GET.get('state')
-        if not sess_state or sess_state != req_state:
-            raise CSRFError(
-                'CSRF Validation check failed. Request state {req_state} is '
-                'not the same as session state {sess_state}'.format(
-                    req_state=req_state,
-                    sess_state=sess_state
-                )
-            )
-        code = request.GET.get('code')
-        if not code:
-            reason = request.GET.get('error', 'No reason provided.')
-            return AuthenticationDenied(
-                reason=reason,
-                provider_name=self.name,
-                provider_type=self.type
-            )
-        # Now retrieve the access token with the code
-        token_params = {
-            'grant_type': 'authorization_code',
-            'code': code,
-            'client_id': self.consumer_key,
-            'client_secret': self.consumer_secret,
-        }
-        r = requests.post(PROVIDER_ACCESS_TOKEN_URL, token_params)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        data = r.json()
-        access_token = data['access_token']
-
-        # Retrieve profile data
+class YandexProvider(OAuth2Provider):
+    type = PROVIDER_NAME
+    context = YandexAuthenticationComplete
+    authorize_url = PROVIDER_AUTH_URL
+    access_token_url = PROVIDER_ACCESS_TOKEN_URL
+    profile_url = PROVIDER_USER_PROFILE_URL
+    # Yandex doesn't support redirect_uri and scope parameters in
+    # the query string.
+    # You must define the Callback URI and the Scope fields manually in
+    # application's settings page at https://oauth.yandex.ru/client/my
+    # The callback route is left intact in order to preserve API
+    # consistency.
+    send_redirect_uri = False
+
+    def __init__(self, name, consumer_key, consumer_secret, http=None,
+                 callback_url=None,
+                 lazy_profile=False):
+        OAuth2Provider.__init__(self, name, consumer_key, consumer_secret,
+                                http=http, callback_url=callback_url,
+                                lazy_profile=lazy_profile)
+
+    def login_scope(self, request):
+        return None
+
+    def profile_request(self, token_data):
         profile_url = flat_url(
             PROVIDER_USER_PROFILE_URL,
             format='json',
-            oauth_token=access_token
-        )
-        r = requests.get(profile_url)
-        if r.status_code != 200:
-            raise ThirdPartyFailure(
-                'Status {status}: {content}'.format(
-                    status=r.status_code, content=r.content
-                )
-            )
-        profile = r.json()
-        profile = extract_normalize_yandex_data(profile)
-        cred = {'oauthAccessToken': access_token}
-        return YandexAuthenticationComplete(
-            profile=profile,
-            credentials=cred,
-            provider_name=self.name,
-            provider_type=self.type
+            oauth_token=token_data['access_token']
         )
+        return HTTPRequest('GET', profile_url)
+
+    def extract_profile(self, data, token_data):
+        return extract_normalize_yandex_data(data)
 
 
 def extract_normalize_yandex_data(data):
@@ -190,7 +141,7 @@ def extract_normalize_yandex_data(data):
     )
 
     # Now strip out empty values
-    for k, v in profile.items():
+    for k, v in list(profile.items()):
         if not v or (isinstance(v, list) and not v[0]):
             del profile[k]
 
@@ -1,7 +1,46 @@
+from pyramid.settings import asbool
+
+
 def splitlines(s):
     return filter(None, [x.strip() for x in s.splitlines()])
 
 
+# settings accepted under ``<prefix>http.`` and the function used to
+# convert each of them from their string representation
+HTTP_SETTINGS = {
+    'pool_connections': int,
+    'pool_maxsize': int,
+    'keep_alive': asbool,
+    'max_workers': int,
+    'timeout': float,
+    'deadline': float,
+    'optional_budget': float,
+}
+
+# settings accepted under ``<prefix>http.breaker.`` to guard a provider
+# with a circuit breaker
+BREAKER_SETTINGS = {
+    'failures': int,
+    'reset_timeout': float,
+    'slow_call': float,
+    'probes': int,
+}
+
+# settings accepted under ``<prefix>http.bulkhead.`` to run the upstream
+# calls of a provider on threads of its own
+BULKHEAD_SETTINGS = {
+    'concurrency': int,
+    'queue': int,
+}
+
+# settings accepted under ``<prefix>prefetch.`` by the OAuth1 providers
+PREFETCH_SETTINGS = {
+    'size': int,
+    'ttl': float,
+    'max_pools': int,
+}
+
+
 class ProviderSettings(object):
     def __init__(self, settings, prefix=''):
         self.settings = settings
@@ -25,3 +64,55 @@ class ProviderSettings(object):
             self.kwargs[dst] = value
         elif required:
             raise KeyError('missing required setting "%s"' % key)
+
+    def collect_group(self, group, conversions):
+        """Return the ``<group>.*`` settings as a dict.
+
+        Only the names found in ``conversions`` are collected, each one
+        converted from its string representation by the associated
+        function.
+        """
+        values = {}
+        for name, convert in conversions.items():
+            key = self.prefix + group + '.' + name
+            if key in self.settings:
+                values[name] = convert(self.settings[key])
+        return values
+
+    def update_group(self, group, conversions, dst=None):
+        """Collect the ``<group>.*`` settings into a single dict.
+
+        The dict returned by :meth:`collect_group` is stored under ``dst``,
+        which defaults to ``group``, if any setting was found.
+        """
+        if dst is None:
+            dst = group
+        values = self.collect_group(group, conversions)
+        if values:
+            self.kwargs[dst] = values
+
+    def update_http(self, dst='http'):
+        """Collect the ``http.*`` transport settings into a single dict.
+
+        The dict is stored under ``dst`` and is suitable for passing to
+        :func:`velruse.http.make_http_client`.
+
+        A circuit breaker is enabled by ``http.breaker = true`` or by any of
+        the ``http.breaker.*`` settings, and likewise a bulkhead by
+        ``http.bulkhead``.
+        """
+        self.update_group('http', HTTP_SETTINGS, dst)
+        for name, conversions in (('breaker', BREAKER_SETTINGS),
+                                  ('bulkhead', BULKHEAD_SETTINGS)):
+            group = 'http.' + name
+            values = self.collect_group(group, conversions)
+            if values or asbool(self.settings.get(self.prefix + group)):
+                self.kwargs.setdefault(dst, {})[name] = values
+
+    def update_prefetch(self, dst='prefetch'):
+        """Collect the ``prefetch.*`` request token pool settings.
+
+        The dict is stored under ``dst`` and is suitable for passing to
+        :class:`velruse.providers.oauth1.RequestTokenPool`.
+        """
+        self.update_group('prefetch', PREFETCH_SETTINGS, dst)
@@ -0,0 +1,133 @@
+"""Stores holding the authentication results of the standalone app.
+
+A result is stored by the login callback under a random token and read
+back once by ``/auth_info``. Any object with the methods of
+:class:`ResultStore` may be passed to ``config.register_velruse_store``,
+including the `anykeystore`_ backends.
+
+.. _anykeystore: http://pypi.python.org/pypi/anykeystore/
+
+"""
+from anykeystore import create_store
+
+
+# stores implemented by velruse itself, other names are looked up in
+# anykeystore
+BACKENDS = {
+    'memory': 'velruse.store.memory:MemoryStore',
+    'redis': 'velruse.store.redis:RedisStore',
+}
+
+
+class ResultStore(object):
+    """The interface of a result store.
+
+    This is compatible with the `anykeystore` backends.
+    """
+
+    def store(self, key, value, expires=None):
+        """Store ``value`` under ``key`` for ``expires`` seconds"""
+        raise NotImplementedError
+
+    def retrieve(self, key):
+        """Return the value of ``key`` or raise :exc:`KeyError`"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove ``key`` if it exists"""
+        raise NotImplementedError
+
+    def consume(self, key):
+        """Return the value of ``key`` and remove it.
+
+        This raises :exc:`KeyError` if ``key`` does not exist. Stores
+        should implement this atomically so that a key may be consumed at
+        most once.
+        """
+        value = self.retrieve(key)
+        self.delete(key)
+        return value
+
+    def retrieve_many(self, keys):
+        """Return a dict of the values of the existing ``keys``"""
+        return _collect(self.retrieve, keys)
+
+    def consume_many(self, keys):
+        """Return a dict of the values of the existing ``keys`` and remove
+        them"""
+        return _collect(self.consume, keys)
+
+    def purge_expired(self):
+        """Remove the expired keys, if the store does not do it itself"""
+
+
+def consume(storage, key):
+    """Return the value of ``key`` in ``storage`` and remove it.
+
+    This uses the native ``consume`` operation of the store when it has
+    one and otherwise falls back to a retrieve followed by a delete,
+    which is not atomic.
+    """
+    if hasattr(storage, 'consume'):
+        return storage.consume(key)
+    value = storage.retrieve(key)
+    storage.delete(key)
+    return value
+
+
+def _collect(get, keys):
+    values = {}
+    for key in keys:
+        try:
+            values[key] = get(key)
+        except KeyError:
+            pass
+    return values
+
+
+def retrieve_many(storage, keys):
+    """Return a dict of the values of the existing ``keys`` in ``storage``.
+
+    This uses the native ``retrieve_many`` operation of the store when it
+    has one and otherwise retrieves the keys one at a time.
+    """
+    if hasattr(storage, 'retrieve_many'):
+        return storage.retrieve_many(keys)
+    return _collect(storage.retrieve, keys)
+
+
+def consume_many(storage, keys):
+    """Return a dict of the values of the existing ``keys`` in ``storage``
+    and remove them.
+
+    This uses the native ``consume_many`` operation of the store when it
+    has one and otherwise consumes the keys one at a time with
+    :func:`consume`.
+    """
+    if hasattr(storage, 'consume_many'):
+        return storage.consume_many(keys)
+    return _collect(lambda key: consume(storage, key), keys)
+
+
+def load_backend(name):
+    path = BACKENDS[name]
+    module_name, attr = path.split(':')
+    module = __import__(module_name, fromlist=[attr])
+    return getattr(module, attr)
+
+
+def create_store_from_settings(settings, prefix='store.'):
+    """Create a result store from the ``<prefix>*`` settings.
+
+    ``<prefix>store`` names the backend. The remaining settings are
+    passed as keyword arguments to either one of the stores in
+    :mod:`velruse.store` or the `anykeystore` backend of that name.
+    """
+    kwargs = {}
+    for k, v in settings.items():
+        if k.startswith(prefix):
+            kwargs[k[len(prefix):]] = v
+    name = kwargs.pop('store')
+    if name in BACKENDS:
+        return load_backend(name)(**kwargs)
+    return create_store(name, **kwargs)
@@ -0,0 +1,110 @@
+"""A bounded in-process result store."""
+from collections import OrderedDict
+import heapq
+import threading
+import time
+
+from . import ResultStore
+
+
+class MemoryStore(ResultStore):
+    """Keep the results in memory, for a single process deployment.
+
+    At most ``capacity`` results are kept, the least recently used one is
+    evicted when a new result does not fit. Expired results are removed
+    in order of expiration as the store is used, tracked by a heap.
+
+    """
+    def __init__(self, capacity=10000, clock=time.time):
+        self.capacity = int(capacity)
+        self.clock = clock
+        self.data = OrderedDict()
+        self.expiry = []
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def _purge(self, now):
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            expires, key = heapq.heappop(expiry)
+            entry = self.data.get(key)
+            # skip the entries of keys since removed or replaced
+            if entry is not None and entry[1] == expires:
+                del self.data[key]
+                self.expirations += 1
+
+        # drop the stale entries once they outnumber the live ones
+        if len(expiry) > 2 * len(self.data) + 64:
+            self.expiry = [(entry[1], key)
+                           for key, entry in self.data.items()
+                           if entry[1] is not None]
+            heapq.heapify(self.expiry)
+
+    def store(self, key, value, expires=None):
+        now = self.clock()
+        if expires is not None:
+            if hasattr(expires, 'total_seconds'):
+                expires = expires.total_seconds()
+            expires = now + expires
+        with self.lock:
+            self._purge(now)
+            self.data.pop(key, None)
+            self.data[key] = (value, expires)
+            if expires is not None:
+                heapq.heappush(self.expiry, (expires, key))
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def retrieve(self, key):
+        with self.lock:
+            self._purge(self.clock())
+            entry = self.data.pop(key)
+            self.data[key] = entry
+            return entry[0]
+
+    def consume(self, key):
+        with self.lock:
+            self._purge(self.clock())
+            return self.data.pop(key)[0]
+
+    def retrieve_many(self, keys):
+        values = {}
+        with self.lock:
+            self._purge(self.clock())
+            for key in keys:
+                entry = self.data.pop(key, None)
+                if entry is not None:
+                    self.data[key] = entry
+                    values[key] = entry[0]
+        return values
+
+    def consume_many(self, keys):
+        values = {}
+        with self.lock:
+            self._purge(self.clock())
+            for key in keys:
+                entry = self.data.pop(key, None)
+                if entry is not None:
+                    values[key] = entry[0]
+        return values
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def purge_expired(self):
+        with self.lock:
+            self._purge(self.clock())
+
+    def stats(self):
+        """Return the size of the store and its eviction counters"""
+        with self.lock:
+            return {
+                'size': len(self.data),
+                'capacity': self.capacity,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
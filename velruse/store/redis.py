@@ -0,0 +1,267 @@
+"""A result store speaking the Redis protocol directly.
+
+Connections are kept in a pool and every operation is written as a single
+pipeline, so storing a result or consuming it costs one round trip.
+
+"""
+from __future__ import absolute_import
+
+import json
+import socket
+import threading
+import time
+
+from ..compat import TEXT
+from ..exceptions import VelruseException
+from . import ResultStore
+
+
+class RedisError(VelruseException):
+    """An error reply of the Redis server or a broken connection"""
+
+
+def pack_command(args):
+    """Encode a command in the Redis protocol"""
+    out = [('*%d\r\n' % len(args)).encode('ascii')]
+    for arg in args:
+        if isinstance(arg, TEXT):
+            arg = arg.encode('utf-8')
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode('ascii')
+        out.append(('$%d\r\n' % len(arg)).encode('ascii'))
+        out.append(arg)
+        out.append(b'\r\n')
+    return b''.join(out)
+
+
+class Connection(object):
+    """A connection to a Redis server"""
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 socket_timeout=None):
+        self.sock = socket.create_connection((host, port), socket_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        try:
+            if password:
+                self.execute(['AUTH', password])
+            if db:
+                self.execute(['SELECT', db])
+        except Exception:
+            self.close()
+            raise
+
+    def send(self, commands):
+        self.sock.sendall(b''.join(pack_command(c) for c in commands))
+
+    def read(self):
+        """Read a reply, error replies are returned as :exc:`RedisError`"""
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise RedisError('connection closed by the server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            return RedisError(rest.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self.reader.read(size + 2)
+            if len(data) != size + 2:
+                raise RedisError('connection closed by the server')
+            return data[:-2]
+        if kind == b'*':
+            size = int(rest)
+            if size < 0:
+                return None
+            return [self.read() for i in range(size)]
+        raise RedisError('invalid reply %r' % line)
+
+    def execute(self, command):
+        self.send([command])
+        reply = self.read()
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def close(self):
+        try:
+            self.reader.close()
+        finally:
+            self.sock.close()
+
+
+class ConnectionPool(object):
+    """A pool of at most ``max_connections`` connections.
+
+    A caller waits for up to ``timeout`` seconds for a connection when
+    they are all in use.
+    """
+
+    def __init__(self, max_connections=10, timeout=5, **connection_kw):
+        self.max_connections = max_connections
+        self.connection_kw = connection_kw
+        self.timeout = timeout
+        self.idle = []
+        self.in_use = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            deadline = time.time() + self.timeout
+            while self.in_use >= self.max_connections:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RedisError('no connection available')
+                self.cond.wait(remaining)
+            self.in_use += 1
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return Connection(**self.connection_kw)
+        except Exception:
+            self._free()
+            raise
+
+    def _free(self):
+        with self.cond:
+            self.in_use -= 1
+            self.cond.notify()
+
+    def release(self, conn):
+        with self.cond:
+            self.idle.append(conn)
+        self._free()
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            self._free()
+
+    def close(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+class RedisStore(ResultStore):
+    """Store the results as JSON in a Redis server.
+
+    ``host``, ``port``, ``db`` and ``key_prefix`` are the settings of the
+    anykeystore Redis backend, whose ``backend_api`` is not supported as
+    the protocol is spoken directly. Additionally ``password``
+    authenticates the connections, ``max_connections`` bounds the pool and
+    ``socket_timeout`` limits the time spent waiting on the server.
+
+    The anykeystore backend pickled the results, which this store cannot
+    read: the results stored before switching to it are lost.
+
+    """
+    def __init__(self, host='localhost', port=6379, db=0,
+                 key_prefix='velruse.', password=None, max_connections=10,
+                 socket_timeout=5):
+        self.key_prefix = key_prefix or ''
+        self.pool = ConnectionPool(max_connections=int(max_connections),
+                                   timeout=float(socket_timeout),
+                                   host=host,
+                                   port=int(port),
+                                   db=int(db),
+                                   password=password,
+                                   socket_timeout=float(socket_timeout))
+
+    def _make_key(self, key):
+        return '%s%s' % (self.key_prefix, key)
+
+    def pipeline(self, commands):
+        """Send ``commands`` at once and return their replies.
+
+        Error replies are returned as :exc:`RedisError` instances.
+        """
+        conn = self.pool.acquire()
+        try:
+            conn.send(commands)
+            replies = [conn.read() for c in commands]
+        except BaseException:
+            # the replies left unread would be taken for those of the
+            # next commands
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return replies
+
+    def execute(self, *command):
+        reply = self.pipeline([command])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def _dumps(self, value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def _loads(self, data):
+        if data is None:
+            raise KeyError
+        return json.loads(data.decode('utf-8'))
+
+    def store(self, key, value, expires=None):
+        command = ['SET', self._make_key(key), self._dumps(value)]
+        if expires is not None:
+            if hasattr(expires, 'total_seconds'):
+                expires = expires.total_seconds()
+            command.extend(['PX', max(int(expires * 1000), 1)])
+        self.execute(*command)
+
+    def retrieve(self, key):
+        return self._loads(self.execute('GET', self._make_key(key)))
+
+    def delete(self, key):
+        self.execute('DEL', self._make_key(key))
+
+    def consume(self, key):
+        key = self._make_key(key)
+        replies = self.pipeline([
+            ['MULTI'],
+            ['GET', key],
+            ['DEL', key],
+            ['EXEC'],
+        ])
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return self._loads(replies[-1][0])
+
+    def retrieve_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        replies = self.execute('MGET', *[self._make_key(k) for k in keys])
+        return self._collect(keys, replies)
+
+    def consume_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        redis_keys = [self._make_key(k) for k in keys]
+        replies = self.pipeline([
+            ['MULTI'],
+            ['MGET'] + redis_keys,
+            ['DEL'] + redis_keys,
+            ['EXEC'],
+        ])
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return self._collect(keys, replies[-1][0])
+
+    def _collect(self, keys, replies):
+        return dict((k, self._loads(v))
+                    for k, v in zip(keys, replies) if v is not None)
+
+    def close(self):
+        self.pool.close()
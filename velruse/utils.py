@@ -1,6 +1,81 @@
 """Utilities for the auth functionality"""
+import threading
+
 from .compat import urlencode
 
 def flat_url(url, **kw):
     """Creates a URL with the query param encoded"""
     return url + '?' + urlencode(kw)
+
+
+class CallbackURL(object):
+    """Generate the absolute URL of a provider's callback route.
+
+    The URL only depends on the application URL of the request, its
+    scheme, host and script name, so it is generated once per application
+    URL and then reused. At most ``max_entries`` URLs are kept as the host
+    comes from the client. When ``url`` is set it is always used instead.
+
+    """
+    max_entries = 64
+
+    def __init__(self, route_name, url=None):
+        self.route_name = route_name
+        self.url = url
+        self.urls = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.url:
+            return self.url
+        key = request.application_url
+        url = self.urls.get(key)
+        if url is None:
+            url = request.route_url(self.route_name)
+            with self.lock:
+                if len(self.urls) < self.max_entries:
+                    self.urls[key] = url
+        return url
+
+
+class URLTemplate(object):
+    """A URL whose fixed query parameters are encoded once.
+
+    ``params`` are encoded when the template is created and the parameters
+    given to each call are appended to them, ``None`` values being
+    omitted. The encoded form of the appended values is remembered as
+    well, up to ``max_entries`` of them, since most of them, like a
+    redirect URI, repeat from one call to the next. The ``volatile``
+    parameters, like a nonce, are always encoded.
+
+    """
+    max_entries = 256
+
+    def __init__(self, url, params=None, volatile=()):
+        params = sorted((k, v) for k, v in (params or {}).items()
+                        if v is not None)
+        self.url = url
+        self.prefix = url + '?' + urlencode(params)
+        self.separator = '&' if params else ''
+        self.volatile = frozenset(volatile)
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+    def _encode(self, key, value):
+        if key in self.volatile:
+            return urlencode([(key, value)])
+        item = (key, value)
+        part = self.encoded.get(item)
+        if part is None:
+            part = urlencode([item])
+            with self.lock:
+                if len(self.encoded) < self.max_entries:
+                    self.encoded[item] = part
+        return part
+
+    def __call__(self, **params):
+        parts = [self._encode(k, v) for k, v in params.items()
+                 if v is not None]
+        if not parts:
+            return self.prefix
+        return self.prefix + self.separator + '&'.join(parts)